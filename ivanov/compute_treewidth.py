@@ -11,8 +11,16 @@ from ivanov.graph import nxext
 from ivanov.graph import algorithms
 from ivanov import graph, helpers
 from ivanov.graph import rdf
+import itertools
 import codecs
 
+def get_rballs(nx_graph, nodes, r, d):
+    '''Yields the r-balls of the given nodes in their order.
+    :param d: The edge direction of the r-balls: "in", "out" or "all".
+    '''
+    for node in nodes:
+        yield algorithms.r_ball(nx_graph, node, r, -1 if d == "in" else 1 if d == "out" else 0)
+
 def compute_rballs_tw(in_files, output_dir):
     nx_graph, uri_node_map = rdf.convert_rdf_to_nx_graph(in_files, discard_classes=True)
     node_uri_map = {node: uri.replace(u",", u"[comma]").replace(u"\n", u"[new_line]") for uri, node in uri_node_map.items()}
@@ -24,20 +32,26 @@ def compute_rballs_tw(in_files, output_dir):
         for r in [2, 3, 4, 5]:
             out_file = codecs.open(output_dir + "tw_r{0}_{1}".format(r, d), "w", "utf8")
             
+            # don't compute treewidth for r-balls which are known to be big
+            pending_nodes = [node for node in nx_graph.nodes_iter() if node not in rballs_with_big_tw]
+            pending = set(pending_nodes)
+            
+            # the r-balls and their tree-widths are computed lazily, one per pending node of the loop below
+            rballs, rballs_to_print = itertools.tee(get_rballs(nx_graph, pending_nodes, r, d))
+            tws = arnborg_proskurowski.get_treewidths(rballs)
+            
             i = 0
             for node in nx_graph.nodes_iter():
                 print "-------------------------------------"
                 print u"Node {0}/{1} ({2})".format(i, nodes_in_graph, node_uri_map[node])
                 print "r = {0}, d = {1}".format(r, d)
-                if node in rballs_with_big_tw:
-                    # don't compute treewidth for r-balls which are known to be big
-                    tw = -1
-                else:
-                    rball = algorithms.r_ball(nx_graph, node, r, -1 if d == "in" else 1 if d == "out" else 0)
-                    print "r-ball nodes:", rball.number_of_nodes()
-                    tw = arnborg_proskurowski.get_treewidth(rball)
+                if node in pending:
+                    print "r-ball nodes:", next(rballs_to_print).number_of_nodes()
+                    tw = next(tws)
                     if tw == -1:
                         rballs_with_big_tw.add(node)
+                else:
+                    tw = -1
                 print "Treewidth: ", tw
                 line = u"{0},{1}\n".format(node_uri_map[node], tw)
                 out_file.write(line)
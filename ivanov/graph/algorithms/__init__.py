@@ -49,7 +49,7 @@ def r_ball(graph, center, r, edge_dir=0):
 def r_ball_hyper(hypergraph, center, r, edge_dir=0, center_default_color=False):
     '''The same as r_ball but for Hypergraph.
     '''
-    assert type(hypergraph) is Hypergraph
+    assert isinstance(hypergraph, Hypergraph)
     
     visited_nodes = set()
     
@@ -83,7 +83,7 @@ def r_ball_hyper(hypergraph, center, r, edge_dir=0, center_default_color=False):
                     if v not in visited_nodes:
                         recurse(v, i + 1)
     
-    rball = Hypergraph()
+    rball = type(hypergraph)()
     if center_default_color:
         # the center node's default color is 0 ("owl:Thing")
         rball.add_node(center, attr_dict={"labels": ["0"]})
@@ -5,23 +5,60 @@ Created on Nov 21, 2015
 '''
 
 from reducible_feature import ReducibleFeature
+from canonical_cache import CanonicalRepresentationCache
+from fast_treewidth import get_treewidths
 from ivanov.graph.hypergraph import Hypergraph
 from itertools import groupby, permutations
+import numpy as np
+import hashlib
 import sys
 
 def get_treewidth(graph):
     result = run_algorithm(graph, return_features=False, compute_string=False)
     return result[0]
 
+# the cache used by get_canonical_representation (see set_canonical_cache)
+canonical_cache = None
+
+def set_canonical_cache(cache):
+    '''Sets the cache of the canonical representations used by get_canonical_representation,
+    e.g. CanonicalRepresentationCache(max_size=10000). None (default) disables the caching.
+    '''
+    global canonical_cache
+    canonical_cache = cache
+
 def get_canonical_representation(graph):
+    if canonical_cache is not None:
+        return canonical_cache.get_canonical_representation(graph)
     result = run_algorithm(graph)
     return result[1]
 
+def get_canonical_hash(graph):
+    '''Returns the 64-bit canonical hash of a graph (see run_algorithm with canonical_hash=True).
+    '''
+    result = run_algorithm(graph, canonical_hash=True)
+    return result[1]
+
+def get_label_hash(label):
+    '''Returns a 64-bit hash (the first 8 bytes of SHA-1, as for the hashed Weisfeiler-Lehman labels)
+    of a label (unicode labels are encoded in UTF-8).
+    '''
+    label_bytes = label.encode("utf8") if type(label) is unicode else str(label)
+    return int(hashlib.sha1(label_bytes).hexdigest()[:16], 16)
+
+def hash_label(label):
+    '''Replaces a label by its hash if the label is longer than the hash string (of the form #<16 hex digits>).
+    '''
+    if len(label) > 17:
+        return u"#{0:016x}".format(get_label_hash(label))
+    else:
+        return label
+
 def get_reduced_features(graph):
     result = run_algorithm(graph, return_features=True, compute_string=False)
     return result[2]
  
-def run_algorithm(graph, return_features=False, compute_string=True):
+def run_algorithm(graph, return_features=False, compute_string=True, canonical_hash=False):
     '''Performs the algorithm proposed by Arnborg & Proskurowski on a graph with tree-width at most 3.
     :param graph: A NetworkX graph or a Hypergraph.
     :param return_features: (default False) If true, returns the features, which
@@ -29,6 +66,13 @@ def run_algorithm(graph, return_features=False, compute_string=True):
     :param compute_string: (default True) If True returns the canonical string
     representation of the graph. False means to perform the reduction rules
     without computing the canonical string.
+    :param canonical_hash: (default False) If True (and compute_string is True) returns a 64-bit
+    canonical hash (numpy.uint64) instead of the canonical string. After each reduction step
+    the new labels are replaced by their hashes (see hash_label), so the labels built by the
+    rules contain the hashes of their children instead of their full strings. The rules still
+    build a (short) label string per reduced feature, the hashes only keep these strings from
+    growing with the size of the graph. The hash is canonical as well, but it is not the hash
+    of the canonical string.
     :return A tuple of the form (tree_width, canonical_string[, reduced_features]).
     '''
     def is_done(hypergraph):
@@ -47,6 +91,22 @@ def run_algorithm(graph, return_features=False, compute_string=True):
         
         return u",".join(labels)
     
+    def hash_labels(hypergraph):
+        # the attributes of both the nodes and the edges
+        for attr_dict in hypergraph.node.itervalues():
+            labels = attr_dict["labels"]
+            for i, label in enumerate(labels):
+                if len(label) > 17:
+                    labels[i] = hash_label(label)
+    
+    def result(treewidth, canon_str, features):
+        if canonical_hash:
+            canon_str = np.uint64(get_label_hash(canon_str))
+        if return_features:
+            return treewidth, canon_str, features
+        else:
+            return treewidth, canon_str
+    
     def rule_0(hypergraph, compute_string):
         modified = False
         
@@ -86,21 +146,9 @@ def run_algorithm(graph, return_features=False, compute_string=True):
             edges_group = list(hypergraph.parallel_edges_groups[key])
             endpoints = hypergraph.endpoints(edges_group[0])
             if compute_string:
-                perms = permutations(endpoints)
-                possible_labels = []
-                for perm in perms:
-                    possible_label = {}
-                    possible_label["perm"] = perm
-                    possible_label["label"] = []
-                    for edge in edges_group:
-                        possible_label["label"].append(Hypergraph.edge_to_string(hypergraph, edge, perm))
-                    possible_label["label"].sort()
-                    possible_label["label"] = u"(0.2;{0})".format(u",".join(possible_label["label"]))
-                    possible_labels.append(possible_label)
-                possible_labels = sorted(possible_labels, key=lambda element: element["label"])
-                minimal_label = possible_labels[0]["label"]
-                minimal_perm_indices = filter(lambda i: possible_labels[i]["label"] == minimal_label, range(len(possible_labels)))
-                direction = set([possible_labels[i]["perm"] for i in minimal_perm_indices])
+                minimal_strings, minimal_perms = ReducibleFeature.get_minimal_labeling(hypergraph, edges_group, permutations(endpoints))
+                minimal_label = u"(0.2;{0})".format(u",".join(minimal_strings))
+                direction = set(minimal_perms)
                 hypergraph.remove_edges_from(edges_group, unsafe=True)
                 hypergraph.add_edge(endpoints, direction, minimal_label)
             else:
@@ -161,21 +209,9 @@ def run_algorithm(graph, return_features=False, compute_string=True):
         for key in parallel_hedges_groups_keys:
             hedges_group = hypergraph.parallel_hedges_groups[key]
             endpoints = hypergraph.endpoints(hedges_group[0])
-            perms = permutations(endpoints)
-            possible_labels = []
-            for perm in perms:
-                possible_label = {}
-                possible_label["perm"] = perm
-                possible_label["label"] = []
-                for hedge in hedges_group:
-                    possible_label["label"].append(Hypergraph.hedge_to_string(hypergraph, hedge, perm))
-                possible_label["label"].sort()
-                possible_label["label"] = u",".join(possible_label["label"])
-                possible_labels.append(possible_label)
-            possible_labels = sorted(possible_labels, key=lambda element: element["label"])
-            minimal_label = possible_labels[0]["label"]
-            minimal_perm_indices = filter(lambda i: possible_labels[i]["label"] == minimal_label, range(len(possible_labels)))
-            direction = set([possible_labels[i]["perm"] for i in minimal_perm_indices])
+            minimal_strings, minimal_perms = ReducibleFeature.get_minimal_labeling(hypergraph, hedges_group, permutations(endpoints))
+            minimal_label = u",".join(minimal_strings)
+            direction = set(minimal_perms)
             hypergraph.remove_edges_from(hedges_group, unsafe=True)
             hypergraph.add_edge(endpoints, direction, u"(3;{0})".format(minimal_label))
         
@@ -207,7 +243,7 @@ def run_algorithm(graph, return_features=False, compute_string=True):
         
         return modified, degree_3_features if return_features else None
     
-    if type(graph) is not Hypergraph:
+    if not isinstance(graph, Hypergraph):
         hypergraph = Hypergraph(graph)
     else:
         hypergraph = graph.copy()
@@ -215,11 +251,10 @@ def run_algorithm(graph, return_features=False, compute_string=True):
     features = []
     treewidth = 0
     
+    canonical_hash = canonical_hash and compute_string
+    
     if hypergraph.number_of_nodes() == 0:
-        if return_features:
-            return treewidth, "", features
-        else:
-            return treewidth, ""
+        return result(treewidth, "", features)
     
     new_features = []
             
@@ -231,6 +266,9 @@ def run_algorithm(graph, return_features=False, compute_string=True):
         
 #         hypergraph.visualize()
         
+        if canonical_hash:
+            hash_labels(hypergraph)
+        
         # no need to check if modified here to continue, just go to the next rule after
         rule_0(hypergraph, compute_string)
 
@@ -261,20 +299,13 @@ def run_algorithm(graph, return_features=False, compute_string=True):
             if is_done(hypergraph):
                 if hypergraph.number_of_nodes() == 0:
                     sys.stderr.write("\n[ArnborgProskurowski] Error: empty graph produced.")
-                    if return_features:
-                        return treewidth, u"", features
-                    else:
-                        return treewidth, u""
+                    return result(treewidth, u"", features)
                 else:
                     canon_str = collect_labels(hypergraph) if compute_string else u""
                     if return_features:
                         features += new_features
-                        return treewidth, canon_str, features
-                    else:
-                        return treewidth, canon_str
+                    return result(treewidth, canon_str, features)
             else:
                 if return_features:
                     features += new_features
-                    return -1, u"Tree-width > 3", features
-                else:
-                    return -1, u"Tree-width > 3"
+                return result(-1, u"Tree-width > 3", features)
@@ -0,0 +1,108 @@
+'''
+Created on Oct 18, 2026
+
+@author: Ivan Ivanov
+'''
+
+from ivanov.graph.hypergraph import Hypergraph
+from networkx.algorithms.isomorphism import GraphMatcher
+from collections import OrderedDict
+import networkx as nx
+
+class CanonicalRepresentationCache(object):
+    '''A bounded LRU cache of the canonical representations computed by Arnborg & Proskurowski.
+    A graph is looked up by an isomorphism-invariant pre-hash of its labelled incidence graph
+    (see get_pre_hash) and a cached representation is returned only if the graphs are isomorphic
+    (verified exactly by VF2), so repeated features and shingles skip the reduction.
+    '''
+
+    @staticmethod
+    def get_incidence_graph(hypergraph):
+        '''Builds the labelled bipartite incidence graph of a hypergraph with edges of order at most 2.
+        The node vertices are labelled by the sorted node labels, the edge vertices by the edge labels
+        and each incidence by the positions of the node in the directions of the edge, so two such
+        hypergraphs are isomorphic iff their incidence graphs are.
+        :return: A NetworkX graph or None if the hypergraph has hyperedges.
+        '''
+        if hypergraph.number_of_hedges() > 0:
+            return None
+
+        incidence_graph = nx.Graph()
+        for node in hypergraph.nodes_iter():
+            incidence_graph.add_node(node, color=(0, tuple(sorted(hypergraph.node[node]["labels"]))))
+        for edge in hypergraph.edges_iter():
+            edge_attr = hypergraph.edge(edge)
+            incidence_graph.add_node(edge, color=(1, edge_attr["labels"][0]))
+            for node in hypergraph.endpoints(edge):
+                role = tuple(sorted(dir_perm.index(node) for dir_perm in edge_attr["direction"]))
+                incidence_graph.add_edge(edge, node, role=role)
+        return incidence_graph
+
+    @staticmethod
+    def get_pre_hash(incidence_graph, wl_iterations=2):
+        '''Computes an isomorphism-invariant hash of an incidence graph: the numbers of vertices and
+        incidences and the multiset of the vertex labels refined by a few Weisfeiler-Lehman iterations.
+        '''
+        colors = {v: hash(incidence_graph.node[v]["color"]) for v in incidence_graph.nodes_iter()}
+        for _ in range(wl_iterations):
+            colors = {v: hash((colors[v], tuple(sorted((incidence_graph[v][u]["role"], colors[u]) for u in incidence_graph[v]))))
+                      for v in incidence_graph.nodes_iter()}
+        return incidence_graph.number_of_nodes(), incidence_graph.number_of_edges(), hash(tuple(sorted(colors.values())))
+
+    @staticmethod
+    def is_isomorphic(incidence_graph_1, incidence_graph_2):
+        matcher = GraphMatcher(incidence_graph_1, incidence_graph_2, node_match=lambda a, b: a["color"] == b["color"],
+                               edge_match=lambda a, b: a["role"] == b["role"])
+        return matcher.is_isomorphic()
+
+    def get_canonical_representation(self, graph):
+        '''Returns the canonical representation of a graph (see arnborg_proskurowski.get_canonical_representation)
+        from the cache or computes and caches it.
+        :param graph: A NetworkX graph or a Hypergraph.
+        '''
+        from ivanov.graph.algorithms import arnborg_proskurowski
+
+        hypergraph = graph if isinstance(graph, Hypergraph) else Hypergraph(graph)
+        incidence_graph = CanonicalRepresentationCache.get_incidence_graph(hypergraph)
+        if incidence_graph is None:
+            self.misses += 1
+            return arnborg_proskurowski.run_algorithm(hypergraph)[1]
+
+        key = CanonicalRepresentationCache.get_pre_hash(incidence_graph)
+        entries = self.entries.pop(key, [])
+        # the key becomes the most recently used one
+        self.entries[key] = entries
+        for cached_incidence_graph, canon_str in entries:
+            if CanonicalRepresentationCache.is_isomorphic(incidence_graph, cached_incidence_graph):
+                self.hits += 1
+                return canon_str
+
+        self.misses += 1
+        treewidth, canon_str = arnborg_proskurowski.run_algorithm(hypergraph)
+        if 0 <= treewidth <= self.max_treewidth:
+            entries.append((incidence_graph, canon_str))
+            self.size += 1
+            while self.size > self.max_size:
+                _, evicted_entries = self.entries.popitem(last=False)
+                self.size -= len(evicted_entries)
+        elif not entries:
+            del self.entries[key]
+        return canon_str
+
+    def __len__(self):
+        return self.size
+
+    def __init__(self, max_size=10000, max_treewidth=2):
+        '''
+        :param max_size: (default 10000) Maximal number of cached graphs. The least recently
+        used pre-hashes are evicted first.
+        :param max_treewidth: (default 2) Only the representations of graphs with at most this
+        tree-width are cached. For tree-width 3 the order in which the degree-3 rules are applied
+        may depend on the node ids, so isomorphic graphs can get different representations.
+        '''
+        self.max_size = max_size
+        self.max_treewidth = max_treewidth
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,139 @@
+'''
+Created on Oct 18, 2026
+
+@author: Ivan Ivanov
+'''
+
+from ivanov.graph.hypergraph import Hypergraph
+
+def get_adjacency(graph):
+    '''Builds a lightweight adjacency of a graph (no labels, no directions, no self-loops and no parallel edges).
+    :param graph: A NetworkX graph or a Hypergraph.
+    :return: A dictionary node -> set of neighbors or None if the graph is a Hypergraph with hyperedges.
+    '''
+    if isinstance(graph, Hypergraph):
+        if graph.number_of_hedges() > 0:
+            return None
+        return {node: set(graph.neighbors(node)) - {node} for node in graph.nodes_iter()}
+
+    adjacency = {node: set() for node in graph.nodes_iter()}
+    for u, v in graph.edges_iter():
+        if u != v:
+            adjacency[u].add(v)
+            adjacency[v].add(u)
+    return adjacency
+
+def get_treewidth(graph):
+    '''Computes the same tree-width as arnborg_proskurowski.get_treewidth, but applies the reduction rules of
+    Arnborg & Proskurowski one node at a time on a lightweight adjacency with degree buckets: pendant (rule 1),
+    series (rule 2) and the degree-3 rules triangle, buddy and cube (rules 4.1, 4.2 and 4.3). A removed node of
+    degree 3 makes its neighbors a clique, as the hyperedge which replaces it in run_algorithm does. The graph
+    is rejected as soon as the tree-width is known to be greater than 3: it has more than 3n - 6 edges, every
+    node has more than 3 neighbors or no rule applies.
+    :param graph: A NetworkX graph or a Hypergraph.
+    :return: The tree-width (0 to 3) or -1 if it is greater than 3.
+    '''
+    adjacency = get_adjacency(graph)
+    if adjacency is None:
+        from ivanov.graph.algorithms import arnborg_proskurowski
+        return arnborg_proskurowski.run_algorithm(graph, return_features=False, compute_string=False)[0]
+    
+    nodes_count = len(adjacency)
+    if nodes_count >= 3 and sum(len(neighbors) for neighbors in adjacency.itervalues()) / 2 > 3 * nodes_count - 6:
+        # partial 3-trees have at most 3n - 6 edges
+        return -1
+    
+    # buckets[d] holds the nodes with d neighbors (for d < 4)
+    buckets = [set(), set(), set(), set()]
+    for node, neighbors in adjacency.iteritems():
+        if len(neighbors) < 4:
+            buckets[len(neighbors)].add(node)
+    
+    def unlink(u, v):
+        degree = len(adjacency[u])
+        if degree < 4:
+            buckets[degree].remove(u)
+        adjacency[u].remove(v)
+        if degree <= 4:
+            buckets[degree - 1].add(u)
+    
+    def link(u, v):
+        if v in adjacency[u]:
+            return
+        for x, y in [(u, v), (v, u)]:
+            degree = len(adjacency[x])
+            if degree < 4:
+                buckets[degree].remove(x)
+                if degree < 3:
+                    buckets[degree + 1].add(x)
+            adjacency[x].add(y)
+    
+    def eliminate(node):
+        # removes a node and makes its neighbors a clique
+        buckets[len(adjacency[node])].remove(node)
+        neighbors = list(adjacency.pop(node))
+        for neighbor in neighbors:
+            unlink(neighbor, node)
+        for i in range(len(neighbors)):
+            for j in range(i + 1, len(neighbors)):
+                link(neighbors[i], neighbors[j])
+    
+    def find_degree_3_rule():
+        # returns the nodes to eliminate (in this order) by a triangle, buddy or cube rule or None
+        for node in buckets[3]:
+            a, b, c = neighbors = adjacency[node]
+            if b in adjacency[a] or c in adjacency[a] or c in adjacency[b]:
+                # rule 4.1 (triangle)
+                return [node]
+            for other in adjacency[a]:
+                if other != node and other in buckets[3] and adjacency[other] == neighbors:
+                    # rule 4.2 (buddy)
+                    return [node, other]
+            if neighbors <= buckets[3]:
+                # rule 4.3 (cube), node is the hub and its neighbors lie on a ring with 3 other nodes
+                ring = [adjacency[neighbor] - {node} for neighbor in neighbors]
+                ring_nodes = ring[0] | ring[1] | ring[2]
+                if len(ring_nodes) == 3 and all(len(ring[i] & ring[j]) == 1 for i, j in [(0, 1), (0, 2), (1, 2)]):
+                    return [a, b, c, node]
+        return None
+    
+    treewidth = 0
+    
+    while True:
+        if buckets[0]:
+            # isolated node
+            del adjacency[buckets[0].pop()]
+        elif buckets[1]:
+            # rule 1 (pendant node)
+            node = buckets[1].pop()
+            neighbor, = adjacency.pop(node)
+            unlink(neighbor, node)
+            treewidth = max(treewidth, 1)
+        elif buckets[2]:
+            # rule 2 (series node), the new edge is merged with a parallel one (rule 0.2)
+            node = buckets[2].pop()
+            u, v = adjacency.pop(node)
+            unlink(u, node)
+            unlink(v, node)
+            link(u, v)
+            treewidth = max(treewidth, 2)
+        elif not adjacency:
+            return treewidth
+        elif not buckets[3]:
+            # every node has more than 3 neighbors, no rule can apply
+            return -1
+        else:
+            nodes = find_degree_3_rule()
+            if nodes is None:
+                return -1
+            for node in nodes:
+                eliminate(node)
+            treewidth = max(treewidth, 3)
+
+def get_treewidths(graphs):
+    '''Computes the tree-widths of many graphs (e.g. r-balls) with get_treewidth.
+    :param graphs: An iterable of NetworkX graphs or Hypergraphs.
+    :return: A generator of the tree-widths in the order of the graphs.
+    '''
+    for graph in graphs:
+        yield get_treewidth(graph)
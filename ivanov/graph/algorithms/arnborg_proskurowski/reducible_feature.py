@@ -430,6 +430,55 @@ class ReducibleFeature(object):
         else:       
             return []
     
+    @staticmethod
+    def get_minimal_labeling(hypergraph, edges, perms, labels=[]):
+        '''Finds the permutations of the nodes for which the sorted list of the labels and of the edges
+        encoded by Hypergraph.edge_to_string is lexicographically minimal when joined by commas.
+        An edge string depends only on the positions of the edge endpoints in the permutation,
+        so each distinct one is formatted once and interned to its rank among all strings.
+        The candidates are then compared as tuples of ranks, which gives the same order as
+        the joined strings unless a string is a proper prefix of another one (then the joined
+        strings of the distinct candidates are compared).
+        :param edges: The edges to encode.
+        :param perms: An iterable of permutations of the nodes (containing the edge endpoints).
+        :param labels: (default []) Additional labels, which do not depend on the permutation.
+        :return: A tuple (sorted_strings, minimal_perms), where sorted_strings is the sorted list of
+        the minimal candidate and minimal_perms is a list of the permutations which produce it.
+        '''
+        strings = list(labels)
+        string_ids = {}
+        edges_endpoints = [(edge, hypergraph.endpoints(edge)) for edge in edges]
+        
+        perms = list(perms)
+        candidates = []
+        for perm in perms:
+            positions = {node: i for i, node in enumerate(perm)}
+            candidate = range(len(labels))
+            for edge, endpoints in edges_endpoints:
+                key = (edge, tuple(positions[node] for node in endpoints))
+                string_id = string_ids.get(key)
+                if string_id is None:
+                    string_id = string_ids[key] = len(strings)
+                    strings.append(Hypergraph.edge_to_string(hypergraph, edge, perm))
+                candidate.append(string_id)
+            candidates.append(candidate)
+        
+        # intern the strings to their ranks (equal strings get equal ranks)
+        sorted_strings = sorted(set(strings))
+        ranks = {string: rank for rank, string in enumerate(sorted_strings)}
+        ranks = [ranks[string] for string in strings]
+        candidates = [tuple(sorted(ranks[string_id] for string_id in candidate)) for candidate in candidates]
+        
+        prefix_free = all(not sorted_strings[i + 1].startswith(sorted_strings[i]) for i in range(len(sorted_strings) - 1))
+        if prefix_free:
+            minimal_candidate = min(candidates)
+        else:
+            joined = {candidate: u",".join(sorted_strings[rank] for rank in candidate) for candidate in set(candidates)}
+            minimal_candidate = min(joined, key=lambda candidate: joined[candidate])
+        
+        minimal_perms = [perm for perm, candidate in zip(perms, candidates) if candidate == minimal_candidate]
+        return [sorted_strings[rank] for rank in minimal_candidate], minimal_perms
+    
     @staticmethod
     def basic_degree_3_reduction(hypergraph, reducible, separator, perms, label_template, compute_string=True):
         return ReducibleFeature.degree_3_reduction(hypergraph, [reducible], separator, perms, label_template, compute_string)
@@ -446,24 +495,12 @@ class ReducibleFeature(object):
         
         if compute_string:
             reducibles_labels = map(lambda reducible: hypergraph.node[reducible]["labels"][0], reducibles)
-            possible_labels = []
-            
-            for perm in perms:
-                possible_label = {}
-                # TODO: we remove the reducible nodes from the direction of the new edge
-                # However, this causes a change in the positions in the permutation.
-                # How should this be handled?
-                possible_label["perm"] = tuple(filter(lambda node: node not in reducibles, perm))
-                possible_label["label"] = list(reducibles_labels)
-                for edge in reducible_edges:
-                    possible_label["label"].append(Hypergraph.edge_to_string(hypergraph, edge, perm))
-                possible_label["label"] = ",".join(sorted(possible_label["label"]))
-                possible_labels.append(possible_label)
-            
-            possible_labels = sorted(possible_labels, key=lambda element: element["label"])
-            minimal_label = possible_labels[0]["label"]
-            minimal_perm_indices = filter(lambda i: possible_labels[i]["label"] == minimal_label, range(len(possible_labels)))
-            direction = set([possible_labels[i]["perm"] for i in minimal_perm_indices])
+            minimal_strings, minimal_perms = ReducibleFeature.get_minimal_labeling(hypergraph, reducible_edges, perms, reducibles_labels)
+            minimal_label = ",".join(minimal_strings)
+            # TODO: we remove the reducible nodes from the direction of the new edge
+            # However, this causes a change in the positions in the permutation.
+            # How should this be handled?
+            direction = set([tuple(filter(lambda node: node not in reducibles, perm)) for perm in minimal_perms])
         else:
             direction = [] # TODO: an empty direction may cause problems
         
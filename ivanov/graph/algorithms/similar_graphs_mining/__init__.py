@@ -8,6 +8,26 @@ from ivanov.graph.algorithms.similar_graphs_mining import feature_extraction,\
 from ivanov.graph.algorithms.similar_graphs_mining.sketch_matrix import SketchMatrix
 from ivanov.graph.hypergraph import Hypergraph
 
+def get_query_fingerprints(query_graph_list, wl_iterations, wl_labels_list):
+    '''Get the fingerprints of the shingles of the features of a query element.
+    :param query_graph_list: List of graphs representing one query element.
+    :return: A tuple (shingle_fingerprints, new_wl_labels_list), where shingle_fingerprints
+    is a set of fingerprints.
+    '''
+    new_wl_labels_list = wl_labels_list
+    shingles = []
+    for query_graph in query_graph_list:
+        if isinstance(query_graph, Hypergraph):
+            query_hypergraph = query_graph
+        else:
+            query_hypergraph = Hypergraph(query_graph)
+        
+        features, new_wl_labels_list = feature_extraction.extract_features(query_hypergraph, wl_iterations, new_wl_labels_list)
+        for feature in features:
+            shingles += shingle_extraction.extract_shingles(feature)
+    
+    return set(fingerprint.rabin_fingerprints(shingles).tolist()), new_wl_labels_list
+
 def get_similar_graphs(query_graph_list, sketch_matrix, wl_iterations, wl_labels_list):
     '''Get all similar graphs to the query graph list.
     :param query_graph_list: List of graphs representing one query element.
@@ -15,31 +35,22 @@ def get_similar_graphs(query_graph_list, sketch_matrix, wl_iterations, wl_labels
     :param: wl_iterations: Number of Weisfeiler & Lehman iterations to be performed.
     :param: wl_labels_list: List of labels used when building the sketch matrix.
     '''
-    def get_shingle_fingerprints():
-        def inner(query_features):
-            for features in query_features:
-                for feature in features:
-                    shingles = shingle_extraction.extract_shingles(feature)
-                    fingerprints = fingerprint.get_fingerprints(shingles)
-                    for fp in fingerprints:
-                        yield fp
-        
-        new_wl_labels_list = wl_labels_list
-    
-        query_features = []
-        for query_graph in query_graph_list:
-            if type(query_graph) is Hypergraph:
-                query_hypergraph = query_graph
-            else:
-                query_hypergraph = Hypergraph(query_graph)
-            
-            features, new_wl_labels_list = feature_extraction.extract_features(query_hypergraph, wl_iterations, new_wl_labels_list)
-            query_features.append(features)
-        
-        return set(inner(query_features)), new_wl_labels_list
-    
-    shingle_fingerprints, new_wl_labels_list = get_shingle_fingerprints()
+    shingle_fingerprints, new_wl_labels_list = get_query_fingerprints(query_graph_list, wl_iterations, wl_labels_list)
     
     sketch_column = sketch_matrix.compute_column(shingle_fingerprints)
     
     return sketch_matrix.get_similar_columns(sketch_column), new_wl_labels_list
+
+def get_similar_graphs_many(query_graph_lists, sketch_matrix, wl_iterations, wl_labels_list):
+    '''Get all similar graphs to each of multiple query graph lists (see get_similar_graphs).
+    The sketch columns of all queries are computed and looked up together (see SketchMatrix.query_many).
+    :return: A tuple (similar_columns_list, new_wl_labels_list), where similar_columns_list
+    has an array of similar columns for each query graph list.
+    '''
+    new_wl_labels_list = wl_labels_list
+    fingerprint_lists = []
+    for query_graph_list in query_graph_lists:
+        shingle_fingerprints, new_wl_labels_list = get_query_fingerprints(query_graph_list, wl_iterations, new_wl_labels_list)
+        fingerprint_lists.append(shingle_fingerprints)
+    
+    return sketch_matrix.query_many(fingerprint_lists), new_wl_labels_list
@@ -5,10 +5,43 @@ Created on Jan 13, 2016
 '''
 from ivanov.graph.algorithms.similar_graphs_mining import feature_extraction,\
     shingle_extraction, fingerprint
+from ivanov.graph.algorithms.similar_graphs_mining.coo_accumulator import COOAccumulator
+from ivanov.graph.algorithms import weisfeiler_lehman
 from ivanov.inout.serializable import Serializable
+from scipy.sparse import csr_matrix
 import numpy as np
+import multiprocessing
 import itertools
 
+def get_features_fingerprints(record_features):
+    '''Get the fingerprints of the shingles of the features of a record.
+    '''
+    shingles = list(itertools.chain(*[shingle_extraction.extract_shingles(feature) for feature in record_features]))
+    return fingerprint.rabin_fingerprints(shingles)
+
+def extract_chunk_fingerprints(args):
+    '''Extracts the fingerprints of the records of a chunk of the graph database with
+    hashed W&L labels. Run by the worker processes of CharacteristicMatrix.build_parallel.
+    :param args: A tuple (chunk, wl_iterations, sh_type, window_size, accumulate_wl_shingles).
+    :return: A tuple (features_fingerprints, w_shingles_fingerprints) of lists with the
+    fingerprints of each column built from the chunk by build and build_with_w_shingles.
+    '''
+    chunk, wl_iterations, sh_type, window_size, accumulate_wl_shingles = args
+    features_fingerprints = []
+    w_shingles_fingerprints = []
+    
+    if sh_type >= 0:
+        feature_lists, _ = feature_extraction.get_feature_lists(chunk, wl_iterations, iterator=False, accumulate_wl_shingles=accumulate_wl_shingles,
+                                                                wl_state=weisfeiler_lehman.new_state(hashed_labels=True))
+        features_fingerprints = [get_features_fingerprints(record_features) for _, record_features, _ in feature_lists]
+    
+    if sh_type <= 0:
+        shingle_lists, _ = shingle_extraction.get_w_shingle_lists(chunk, wl_iterations, iterator=False, window_size=window_size, accumulate_wl_shingles=accumulate_wl_shingles,
+                                                                  w_shingles_function=fingerprint.get_w_shingle_fingerprints, wl_state=weisfeiler_lehman.new_state(hashed_labels=True))
+        w_shingles_fingerprints = [np.fromiter(record_w_shingles, dtype=np.uint64) for _, record_w_shingles, _ in shingle_lists]
+    
+    return features_fingerprints, w_shingles_fingerprints
+
 class CharacteristicMatrix(Serializable):
     
 #     @staticmethod
@@ -18,50 +51,161 @@ class CharacteristicMatrix(Serializable):
 #         time_per_feature = 0.001
 #         return nodes_count * features_per_node * time_per_feature
     
-    def build(self, feature_lists):
-        self.sparse_matrix = {}
+    def build(self, feature_lists, accumulator=None):
+        accumulator = accumulator if accumulator is not None else COOAccumulator()
         i = -1
         for _, record_features, _ in feature_lists:
             i += 1
             if self.print_progress:
                 print "Ch.Mat.: Processing column", i, "of", self.cols_count
-            for feature in record_features:
-                shingles = shingle_extraction.extract_shingles(feature)
-                fingerprints = fingerprint.get_fingerprints(shingles)
-                for fp in fingerprints:
-                    if not self.sparse_matrix.has_key(fp):
-                        self.sparse_matrix[fp] = set()
-                    self.sparse_matrix[fp].add(i)
-    
-    def build_with_w_shingles(self, w_shingle_lists, initial_sparse_matrix={}):
-        self.sparse_matrix = initial_sparse_matrix
+            accumulator.add(i, get_features_fingerprints(record_features))
+        self.set_from_accumulator(accumulator)
+    
+    def build_with_w_shingles(self, w_shingle_lists, accumulator=None, fingerprinted=False):
+        '''Build the matrix from the w-shingles of the records.
+        :param accumulator: (default None) A COOAccumulator with already collected
+        non-zeros, to which the w-shingles will be added.
+        :param fingerprinted: (default False) If True, the lists contain the fingerprints
+        of the w-shingles (see fingerprint.get_w_shingle_fingerprints) instead of the shingles.
+        '''
+        accumulator = accumulator if accumulator is not None else COOAccumulator()
         i = -1
         for _, record_w_shingles, _ in w_shingle_lists:
             i += 1
             if self.print_progress:
                 print "Ch.Mat.: Processing column", i, "of", self.cols_count
-            fingerprints = fingerprint.get_fingerprints(record_w_shingles)
-            for fp in fingerprints:
-                if not self.sparse_matrix.has_key(fp):
-                    self.sparse_matrix[fp] = set()
-                self.sparse_matrix[fp].add(i)
+            fingerprints = record_w_shingles if fingerprinted else fingerprint.rabin_fingerprints(record_w_shingles)
+            accumulator.add(i, fingerprints)
+        self.set_from_accumulator(accumulator)
     
     def build_from_records(self, records):
         self.target_values = []
-        self.sparse_matrix = {}
+        accumulator = COOAccumulator()
         i = -1
         for targets, record_props in records:
             i += 1
             self.target_values.append(targets)
             if self.print_progress:
                 print "Ch.Mat.: Processing column", i, "of", self.cols_count
-            for prop in record_props:
-#                 fingerprints = fingerprint.get_fingerprints(shingles)
-#                 for fp in fingerprints:
-                # TODO: potential problem for the SketchMatrix because the properties are not fingerprints
-                if not self.sparse_matrix.has_key(prop):
-                    self.sparse_matrix[prop] = set()
-                self.sparse_matrix[prop].add(i)
+            # TODO: potential problem for the SketchMatrix because the properties are not fingerprints
+            accumulator.add(i, record_props)
+        self.set_from_accumulator(accumulator)
+    
+    def build_parallel(self, graph_database, n_jobs, sh_type, window_size, accumulate_wl_shingles, chunk_size=32):
+        '''Builds the matrix from the graph database with a pool of worker processes. The
+        database is split into chunks of chunk_size records and the workers extract the
+        fingerprints of the records of each chunk (see extract_chunk_fingerprints) using
+        hashed W&L labels. The columns are numbered in the order of the records as in
+        build and build_with_w_shingles.
+        '''
+        def get_chunks():
+            chunk = []
+            for record_id, element_hypergraphs, target in graph_database:
+                chunk.append((record_id, list(element_hypergraphs), target))
+                if len(chunk) == chunk_size:
+                    yield chunk, self.wl_iterations, sh_type, window_size, accumulate_wl_shingles
+                    chunk = []
+            if chunk:
+                yield chunk, self.wl_iterations, sh_type, window_size, accumulate_wl_shingles
+        
+        accumulator = COOAccumulator()
+        features_col = 0
+        w_shingles_col = 0
+        pool = multiprocessing.Pool(n_jobs if n_jobs > 0 else None)
+        try:
+            for features_fingerprints, w_shingles_fingerprints in pool.imap(extract_chunk_fingerprints, get_chunks()):
+                for fingerprints in features_fingerprints:
+                    accumulator.add(features_col, fingerprints)
+                    features_col += 1
+                for fingerprints in w_shingles_fingerprints:
+                    accumulator.add(w_shingles_col, fingerprints)
+                    w_shingles_col += 1
+                if self.print_progress:
+                    print "Ch.Mat.: Processed column", max(features_col, w_shingles_col), "of", self.cols_count
+        finally:
+            pool.close()
+            pool.join()
+        self.set_from_accumulator(accumulator)
+    
+    @staticmethod
+    def build_for_each_wl_iter(graph_database, cols_count, wl_iter_range, print_progress=False, shingles_type="features", window_size=5, accumulate_wl_shingles=True,
+                               hashed_wl_labels=False):
+        '''Builds the characteristic matrices for all numbers of W&L iterations in wl_iter_range
+        with a single W&L run up to max(wl_iter_range). The fingerprints of each record are
+        extracted once for every iteration and the matrix for i iterations is assembled from
+        the fingerprints of the iterations 0, ..., i (or only i if accumulate_wl_shingles is
+        False). Each matrix is the same as CharacteristicMatrix(graph_database, cols_count,
+        wl_iterations=i, ...) and all matrices share the final wl_state.
+        :param graph_database: A list of records (see __init__).
+        :return: A generator of tuples (wl_iterations, ch_matrix) in the order of wl_iter_range.
+        '''
+        wl_iter_range = list(wl_iter_range)
+        max_wl_iterations = max(wl_iter_range)
+        sh_type = 0 if shingles_type == "all" else -1 if shingles_type == "w-shingles" else 1 # default "features"
+        get_initial_wl_state = lambda: weisfeiler_lehman.new_state(hashed_labels=True) if hashed_wl_labels else None
+        wl_state = None
+        features_fingerprints = []
+        w_shingles_fingerprints = []
+        
+        if sh_type >= 0:
+            feature_lists, wl_state = feature_extraction.get_feature_lists_for_each_wl_iter(graph_database, max_wl_iterations, wl_state=get_initial_wl_state())
+            for col, (_, iterations_features, _) in enumerate(feature_lists):
+                if print_progress:
+                    print "Ch.Mat.: Processing column", col, "of", cols_count
+                features_fingerprints.append([get_features_fingerprints(features) for features in iterations_features])
+        
+        if sh_type <= 0:
+            shingle_lists, wl_state = shingle_extraction.get_w_shingle_lists_for_each_wl_iter(graph_database, max_wl_iterations, window_size=window_size, accumulate_wl_shingles=accumulate_wl_shingles,
+                                                                                              w_shingles_function=fingerprint.get_w_shingle_fingerprints, wl_state=get_initial_wl_state())
+            for _, iterations_w_shingles, _ in shingle_lists:
+                w_shingles_fingerprints.append([np.fromiter(w_shingles, dtype=np.uint64) for w_shingles in iterations_w_shingles])
+        
+        for wl_iterations in wl_iter_range:
+            iterations = range(wl_iterations + 1) if accumulate_wl_shingles else [wl_iterations]
+            accumulator = COOAccumulator()
+            for col, record_fingerprints in enumerate(features_fingerprints):
+                for i in iterations:
+                    accumulator.add(col, record_fingerprints[i])
+            col = 0
+            for record_fingerprints in w_shingles_fingerprints:
+                # as in build_with_w_shingles, only records which have shingles get a column
+                record_fingerprints = [record_fingerprints[i] for i in iterations if len(record_fingerprints[i]) > 0]
+                if record_fingerprints:
+                    for fingerprints in record_fingerprints:
+                        accumulator.add(col, fingerprints)
+                    col += 1
+            ch_matrix = CharacteristicMatrix(cols_count=cols_count, wl_iterations=wl_iterations, print_progress=print_progress, accumulator=accumulator)
+            ch_matrix.wl_state = wl_state
+            yield wl_iterations, ch_matrix
+    
+    def set_from_accumulator(self, accumulator):
+        '''Sets the matrix to the non-zeros collected by a COOAccumulator.
+        '''
+        self.rows, self.indptr, self.indices = accumulator.to_csr()
+    
+    def get_accumulator(self):
+        '''Returns a COOAccumulator holding the non-zeros of the matrix, e.g. to extend it.
+        '''
+        accumulator = COOAccumulator()
+        accumulator.add_csr(self.rows, self.indptr, self.indices)
+        return accumulator
+    
+    def get_csr_matrix(self):
+        '''Returns the matrix as a SciPy CSR matrix. Row i of it corresponds to
+        the fingerprint self.rows[i].
+        '''
+        data = np.ones(len(self.indices), dtype=np.int8)
+        return csr_matrix((data, self.indices, self.indptr), shape=(len(self.rows), self.cols_count))
+    
+    def get_csc_matrix(self):
+        '''Returns the matrix as a SciPy CSC matrix (see get_csr_matrix).
+        '''
+        return self.get_csr_matrix().tocsc()
+    
+    def to_dict(self):
+        '''Returns the matrix as a dictionary {fingerprint: set of columns}.
+        '''
+        return {fp: set(self.indices[self.indptr[i] : self.indptr[i + 1]].tolist()) for i, fp in enumerate(self.rows.tolist())}
     
     def compute_column_fingerprints(self, record_graphs):
         assert self.wl_state
@@ -79,58 +223,155 @@ class CharacteristicMatrix(Serializable):
         
         return sorted(column)
     
-    def compute_jaccard_similarity_matrix(self):
-        cols_cache = {}
-        def get_shingles_fp_set(col):
-            if col in cols_cache:
-                return cols_cache[col]
-            else:
-                shingles_fp = set()
-                for row in self.sparse_matrix:
-                    if col in self.sparse_matrix[row]:
-                        shingles_fp.add(row)
-                cols_cache[col] = shingles_fp
-                return shingles_fp
-        
-        def jaccard_sim(u, v):
-            len_union = len(u.union(v))
-            if len_union > 0:
-                return float(len(u.intersection(v))) / float(len_union)
-            else:
-                return 0.
-        
+    def _jaccard_intersection_blocks(self, block_size):
+        '''Yields tuples (start, end, intersections, cols_sizes), where intersections is
+        the sparse CSR product X[:, start:end]^T * X of the binary matrix X, i.e. the sizes
+        of the intersections of the columns in [start, end) with all columns.
+        '''
+        X = self.get_csc_matrix().astype(np.int32)
+        Xt = X.T.tocsr()
+        cols_sizes = np.diff(X.indptr).astype(np.float64)
+        block_size = block_size if block_size else max(self.cols_count, 1)
+        for start in range(0, self.cols_count, block_size):
+            end = min(start + block_size, self.cols_count)
+            intersections = Xt[start : end] * X
+            intersections.sort_indices()
+            yield start, end, intersections, cols_sizes
+    
+    def _jaccard_similarity_blocks(self, block_size):
+        '''Yields tuples (start, end, block), where block is the dense float32 matrix of
+        the Jaccard similarities of the columns in [start, end) to all columns.
+        '''
+        for start, end, intersections, cols_sizes in self._jaccard_intersection_blocks(block_size):
+            intersections = intersections.toarray().astype(np.float64)
+            unions = cols_sizes[start : end, np.newaxis] + cols_sizes[np.newaxis, :] - intersections
+            # the quotient is computed in double precision as in float(|a & b|) / float(|a | b|)
+            block = np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+            block[np.arange(end - start), np.arange(start, end)] = 0.
+            yield start, end, block.astype(np.float32)
+    
+    def compute_jaccard_similarity_matrix(self, block_size=None):
+        '''Computes the Jaccard similarities of all pairs of columns (records). The
+        intersections are the entries of the sparse product C = X^T * X of the binary
+        matrix X and the unions are |a| + |b| - C(a, b).
+        :param block_size: (default None) If set, the product is computed for blocks of
+        block_size columns at a time to bound the memory of the intermediate results.
+        :return: A dense float32 matrix with zeros on the diagonal.
+        '''
         jaccard_sim_mat = np.zeros((self.cols_count, self.cols_count), dtype=np.float32)
-        
-        for col_1, col_2 in itertools.combinations(range(self.cols_count), 2):
-            shingles_col_1 = get_shingles_fp_set(col_1)
-            shingles_col_2 = get_shingles_fp_set(col_2)
-            similarity = jaccard_sim(shingles_col_1, shingles_col_2)
-            jaccard_sim_mat[col_1, col_2] = similarity
-            jaccard_sim_mat[col_2, col_1] = similarity
-        
+        for start, end, block in self._jaccard_similarity_blocks(block_size):
+            jaccard_sim_mat[start : end] = block
         return jaccard_sim_mat
     
+    def _jaccard_similarity_rows(self, block_size):
+        '''Yields tuples (i, cols, sims) with the columns which have a non-zero Jaccard
+        similarity to column i (other than i itself) and their float32 similarities.
+        Only the non-zero intersections of the sparse blocks are evaluated.
+        '''
+        for start, end, intersections, cols_sizes in self._jaccard_intersection_blocks(block_size):
+            for r in range(end - start):
+                i = start + r
+                cols = intersections.indices[intersections.indptr[r] : intersections.indptr[r + 1]].astype(np.int64)
+                cols_intersections = intersections.data[intersections.indptr[r] : intersections.indptr[r + 1]].astype(np.float64)
+                # the quotient is computed in double precision as in float(|a & b|) / float(|a | b|)
+                sims = (cols_intersections / (cols_sizes[i] + cols_sizes[cols] - cols_intersections)).astype(np.float32)
+                not_i = cols != i
+                yield i, cols[not_i], sims[not_i]
+    
+    def compute_most_similar_columns(self, p, block_size=1024):
+        '''Finds the p most similar columns of each column without materializing the
+        Jaccard similarity matrix. The columns of each row are sorted by increasing
+        similarity (the most similar column is the last one) and equal similarities by
+        decreasing column index. The top p are picked from the non-zero similarities of
+        the sparse blocks; if there are less than p, the row is filled up with the columns
+        of zero similarity with the smallest indices (and the column itself only if p is at
+        least the number of columns). The memory is proportional to the output.
+        :return: An integer matrix with min(p, cols_count) columns and a row for each column.
+        '''
+        k = min(p, self.cols_count)
+        most_similar_cols = np.empty((self.cols_count, k), dtype=np.int64)
+        for i, cols, sims in self._jaccard_similarity_rows(block_size):
+            if len(cols) > k:
+                # keep the k largest similarities (with all ties of the k-th one)
+                kth_sim = np.partition(sims, len(sims) - k)[len(sims) - k]
+                top = sims >= kth_sim
+                cols, sims = cols[top], sims[top]
+            order = np.lexsort((-cols, sims))[-k:]
+            zeros_count = k - len(order)
+            if zeros_count > 0:
+                candidates = np.arange(min(k + 1, self.cols_count), dtype=np.int64)
+                candidates = candidates[(candidates != i) & ~np.in1d(candidates, cols)][:zeros_count]
+                if len(candidates) < zeros_count:
+                    candidates = np.append(candidates, i)
+                most_similar_cols[i, : zeros_count] = candidates[::-1]
+            most_similar_cols[i, zeros_count :] = cols[order]
+        return most_similar_cols
+    
+    def compute_similar_columns(self, threshold, block_size=1024, return_similarities=False):
+        '''Finds the columns with Jaccard similarity at least threshold to each column
+        without materializing the Jaccard similarity matrix. For threshold > 0 the similar
+        columns of column i are the same as np.where(compute_jaccard_similarity_matrix()[i, :] >= threshold)[0]
+        and only the non-zero intersections are evaluated. For threshold <= 0 every column
+        (including i itself, whose similarity is 0 as on the diagonal of the similarity
+        matrix) is similar, so each row holds all columns and the similarities are filled
+        in from the non-zero ones.
+        :param return_similarities: (default False) If True, returns also the similarities.
+        :return: A list with the array of similar columns of each column or, if
+        return_similarities is True, a list of tuples (similar columns, similarities).
+        '''
+        similar_cols = []
+        for _, cols, sims in self._jaccard_similarity_rows(block_size):
+            if threshold <= 0.:
+                all_sims = np.zeros(self.cols_count, dtype=np.float32)
+                all_sims[cols] = sims
+                cols, sims = np.arange(self.cols_count, dtype=np.int64), all_sims
+            else:
+                mask = sims >= threshold
+                cols, sims = cols[mask], sims[mask]
+            similar_cols.append((cols, sims) if return_similarities else cols)
+        return similar_cols
+    
     def non_empty_rows(self):
-        return self.sparse_matrix.keys()
+        '''Returns the sorted uint64 array of the fingerprints of the non-empty rows.
+        '''
+        return self.rows
     
     def non_empty_rows_count(self):
-        return len(self.sparse_matrix.keys())
+        return len(self.rows)
     
     def __getitem__(self, key):
-        return self.sparse_matrix[key]
+        '''Returns the sorted array of the columns having a 1 in the row of fingerprint key.
+        '''
+        i = np.searchsorted(self.rows, np.uint64(key))
+        if i == len(self.rows) or self.rows[i] != np.uint64(key):
+            raise KeyError(key)
+        return self.indices[self.indptr[i] : self.indptr[i + 1]]
     
     def __eq__(self, other):
         if isinstance(other, CharacteristicMatrix):
-            return self.sparse_matrix == other.sparse_matrix
+            return np.array_equal(self.rows, other.rows) and np.array_equal(self.indptr, other.indptr) and np.array_equal(self.indices, other.indices)
         else:
             return False
     
     def __ne__(self, other):
         return not self.__eq__(other)
+    
+    def __setstate__(self, state):
+        if "sparse_matrix" in state:
+            # matrices pickled with the former dictionary representation
+            accumulator = COOAccumulator()
+            for fp, cols in state.pop("sparse_matrix").items():
+                for col in cols:
+                    accumulator.add(col, [fp])
+            state["rows"], state["indptr"], state["indices"] = accumulator.to_csr()
+        self.__dict__.update(state)
 
-    def __init__(self, graph_database=None, cols_count=None, wl_iterations=0, print_progress=False, records=None, shingles_type="features", window_size=5, accumulate_wl_shingles=True):
+    def __init__(self, graph_database=None, cols_count=None, wl_iterations=0, print_progress=False, records=None, shingles_type="features", window_size=5, accumulate_wl_shingles=True,
+                 n_jobs=1, hashed_wl_labels=False, accumulator=None):
         '''A sparse binary matrix M having records as columns and fingerprints as rows.
-        M(i, j)=1 iff record j has a shingle with fingerprint i.
+        M(i, j)=1 iff record j has a shingle with fingerprint i. The matrix is stored in
+        compressed sparse row form: the sorted uint64 array rows of the non-empty row
+        fingerprints and the arrays indptr and indices (see get_csr_matrix).
         :param graph_database: A list of tuples where each tuple has the form
         (record_id, graphs, target_values) and represents an element of the database (will be
         represented by a column in the characteristic matrix). The field graphs is
@@ -147,6 +388,13 @@ class CharacteristicMatrix(Serializable):
         :param windows_size: The size of the sliding window for the w-shingles.
         :param accumulate_wl_shingles: It True (default), will accumulate the shingles
         from all W&L iterations.
+        :param n_jobs: (default 1) Number of worker processes extracting the fingerprints
+        of the records (-1 for one per CPU). More than one job implies hashed_wl_labels.
+        :param hashed_wl_labels: (default False) If True, the W&L labels are derived from
+        hashes of the full labels (see weisfeiler_lehman.new_state), so they do not depend
+        on the order of the records. The matrix is then the same for any n_jobs.
+        :param accumulator: (default None) A COOAccumulator with the non-zeros of the matrix,
+        used when neither graph_database nor records are given.
         '''
         self.cols_count = cols_count
         self.print_progress = print_progress
@@ -155,23 +403,36 @@ class CharacteristicMatrix(Serializable):
         if graph_database:
             sh_type = 0 if shingles_type == "all" else -1 if shingles_type == "w-shingles" else 1 # default "features"
             
+            if n_jobs != 1:
+                self.wl_state = weisfeiler_lehman.new_state(hashed_labels=True)
+                self.build_parallel(graph_database, n_jobs, sh_type, window_size, accumulate_wl_shingles)
+                return
+            
+            get_initial_wl_state = lambda: weisfeiler_lehman.new_state(hashed_labels=True) if hashed_wl_labels else None
+            accumulator = COOAccumulator()
+            
             if sh_type >= 0:
                 if isinstance(graph_database, list):
-                    feature_lists, self.wl_state = feature_extraction.get_feature_lists(graph_database, wl_iterations, iterator=False, accumulate_wl_shingles=accumulate_wl_shingles)
+                    feature_lists, self.wl_state = feature_extraction.get_feature_lists(graph_database, wl_iterations, iterator=False, accumulate_wl_shingles=accumulate_wl_shingles,
+                                                                                        wl_state=get_initial_wl_state())
                 else:
                     self.wl_state = None
-                    feature_lists = feature_extraction.get_feature_lists(graph_database, wl_iterations, accumulate_wl_shingles=accumulate_wl_shingles)
+                    feature_lists = feature_extraction.get_feature_lists(graph_database, wl_iterations, accumulate_wl_shingles=accumulate_wl_shingles, wl_state=get_initial_wl_state())
                 
-                self.build(feature_lists)
+                self.build(feature_lists, accumulator)
             
             if sh_type <= 0:
                 if isinstance(graph_database, list):
-                    shingle_lists, self.wl_state = shingle_extraction.get_w_shingle_lists(graph_database, wl_iterations, iterator=False, window_size=window_size, accumulate_wl_shingles=accumulate_wl_shingles)
+                    shingle_lists, self.wl_state = shingle_extraction.get_w_shingle_lists(graph_database, wl_iterations, iterator=False, window_size=window_size, accumulate_wl_shingles=accumulate_wl_shingles,
+                                                                                          w_shingles_function=fingerprint.get_w_shingle_fingerprints, wl_state=get_initial_wl_state())
                 else:
                     self.wl_state = None
-                    shingle_lists = shingle_extraction.get_w_shingle_lists(graph_database, wl_iterations, accumulate_wl_shingles=accumulate_wl_shingles)
+                    shingle_lists = shingle_extraction.get_w_shingle_lists(graph_database, wl_iterations, accumulate_wl_shingles=accumulate_wl_shingles,
+                                                                           w_shingles_function=fingerprint.get_w_shingle_fingerprints, wl_state=get_initial_wl_state())
                 
-                self.build_with_w_shingles(shingle_lists, initial_sparse_matrix=self.sparse_matrix if not sh_type else {})
+                self.build_with_w_shingles(shingle_lists, accumulator, fingerprinted=True)
+        elif accumulator is not None:
+            self.set_from_accumulator(accumulator)
         else:
             assert records
             self.build_from_records(records)
@@ -0,0 +1,76 @@
+'''
+Created on Oct 18, 2026
+
+@author: Ivan Ivanov
+'''
+import numpy as np
+
+class COOAccumulator(object):
+    '''Collects the non-zero (row fingerprint, column) pairs of a sparse binary
+    matrix as chunks of numpy arrays. The chunks are periodically merged into
+    a sorted, duplicate-free coordinate list, so the memory stays proportional
+    to the number of distinct non-zeros.
+    '''
+
+    def add(self, col, row_fingerprints):
+        '''Adds the non-zeros of column col.
+        :param row_fingerprints: An iterable of (64-bit) row fingerprints.
+        '''
+        rows = np.fromiter(row_fingerprints, dtype=np.uint64)
+        if len(rows) > 0:
+            self._append(rows, np.full(len(rows), col, dtype=np.int32))
+
+    def add_csr(self, rows, indptr, indices):
+        '''Adds all non-zeros of a matrix given as sorted row fingerprints with
+        CSR arrays (see CharacteristicMatrix).
+        '''
+        if len(indices) > 0:
+            self._append(np.repeat(rows, np.diff(indptr)), np.asarray(indices, dtype=np.int32))
+
+    def _append(self, rows, cols):
+        self.pending_rows.append(rows)
+        self.pending_cols.append(cols)
+        self.pending_count += len(rows)
+        if self.pending_count >= self.max_pending:
+            self.compact()
+
+    def compact(self):
+        '''Merges the pending chunks into the sorted coordinate list.
+        '''
+        if not self.pending_rows:
+            return
+        rows = np.concatenate([self.rows] + self.pending_rows)
+        cols = np.concatenate([self.cols] + self.pending_cols)
+        order = np.lexsort((cols, rows))
+        rows = rows[order]
+        cols = cols[order]
+        keep = np.ones(len(rows), dtype=np.bool_)
+        keep[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        self.rows = rows[keep]
+        self.cols = cols[keep]
+        self.pending_rows = []
+        self.pending_cols = []
+        self.pending_count = 0
+
+    def to_csr(self):
+        '''Returns the accumulated matrix in compressed sparse row form.
+        :return: A tuple (rows, indptr, indices), where rows is the sorted uint64 array
+        of the non-empty row fingerprints and indices[indptr[i]:indptr[i + 1]] are the
+        sorted columns having a 1 in row rows[i].
+        '''
+        self.compact()
+        rows, row_starts = np.unique(self.rows, return_index=True)
+        indptr = np.append(row_starts, len(self.rows)).astype(np.int64)
+        return rows, indptr, self.cols.copy()
+
+    def __init__(self, max_pending=1 << 22):
+        '''
+        :param max_pending: Number of non-zeros to collect before merging them
+        into the sorted coordinate list.
+        '''
+        self.max_pending = max_pending
+        self.rows = np.empty(0, dtype=np.uint64)
+        self.cols = np.empty(0, dtype=np.int32)
+        self.pending_rows = []
+        self.pending_cols = []
+        self.pending_count = 0
@@ -10,6 +10,7 @@ from ivanov.graph.algorithms.similar_graphs_mining.sketch_matrix import SketchMa
 from ivanov.statistics import all_scores
 from ivanov import statistics
 from timeit import itertools
+from scipy.sparse import csr_matrix
 import numpy as np
 import time
 
@@ -46,7 +47,47 @@ def model_score(score, k=-1, L=-1, infl_point=-1, base_model = {}):
     })
     return m
 
-def loo_crossval_sketch(graph_database, wl_iter_range, k_L_range, output_dir, base_model={}, cols_count=None, shingles_type="features", window_size=5):
+def get_characteristic_matrices(graph_database, cols_count, wl_iter_range, incremental_wl=True, print_progress=False, shingles_type="features", window_size=5, accumulate_wl_shingles=True):
+    '''Builds a characteristic matrix for each number of Weisfeiler-Lehman iterations in wl_iter_range.
+    :param incremental_wl: (default True) If True, Weisfeiler-Lehman is performed once up to
+    max(wl_iter_range) and the matrices are assembled from the shingles of each iteration
+    (see CharacteristicMatrix.build_for_each_wl_iter). If False, each matrix is built from scratch.
+    :return: A generator of tuples (wl_iterations, ch_matrix).
+    '''
+    if incremental_wl:
+        for wl_iterations, ch_matrix in CharacteristicMatrix.build_for_each_wl_iter(graph_database, cols_count, wl_iter_range, print_progress=print_progress, shingles_type=shingles_type,
+                                                                                     window_size=window_size, accumulate_wl_shingles=accumulate_wl_shingles):
+            yield wl_iterations, ch_matrix
+    else:
+        for wl_iterations in wl_iter_range:
+            yield wl_iterations, CharacteristicMatrix(graph_database, cols_count, wl_iterations=wl_iterations, print_progress=print_progress, shingles_type=shingles_type, window_size=window_size,
+                                                      accumulate_wl_shingles=accumulate_wl_shingles)
+
+def get_sketch_matrices(ch_matrix, k_L_range, reuse_sketch=False):
+    '''Builds a sketch matrix for each (k, L) tuple of k_L_range.
+    :param reuse_sketch: (default False) If True, a single sketch matrix with max(k * L) min-hash
+    functions is built and every (k, L) sketch matrix is a view over its first k * L rows (see
+    SketchMatrix.get_sub_sketch). The models then share their hash functions, so they are
+    not independent random samples.
+    :return: A generator of tuples (k, L, sketch_matrix).
+    '''
+    if reuse_sketch:
+        max_h_count = max(k * L for k, L in k_L_range)
+        start = time.time()
+        # only the views of get_sub_sketch are queried, so no LSH index is needed
+        full_sketch_matrix = SketchMatrix(max_h_count, 1, ch_matrix, build_lsh_index=False)
+        print "Building sketch matrix with {0} hash functions took:".format(max_h_count), time.time() - start, "({0:.0f} non-zeros/s)".format(full_sketch_matrix.build_nnz_per_second)
+    for k, L in k_L_range:
+        if reuse_sketch:
+            yield k, L, full_sketch_matrix.get_sub_sketch(k, L)
+        else:
+            start = time.time()
+            sketch_matrix = SketchMatrix(k, L, ch_matrix)
+            print "Building sketch matrix for k={0} and L={1} took:".format(k, L), time.time() - start, "({0:.0f} non-zeros/s)".format(sketch_matrix.build_nnz_per_second)
+            yield k, L, sketch_matrix
+
+def loo_crossval_sketch(graph_database, wl_iter_range, k_L_range, output_dir, base_model={}, cols_count=None, shingles_type="features", window_size=5, reuse_sketch=False,
+                        incremental_wl=True, weighted_voting=False):
     '''Leave-one-out cross-validation.
     :param graph_database: Defined the same way as for CharacteristicMatrix constructor (but cannot be a generator).
     :param wl_iter_range: Range of Weisfeiler-Lehman iterations to be considered in the cross-validation.
@@ -56,16 +97,28 @@ def loo_crossval_sketch(graph_database, wl_iter_range, k_L_range, output_dir, ba
 #     should return a real value. The cross-validation will find the model that maximizes this function.
     :param output_dir: A local directory, that will be used to save the sketch matrices of all models.
     :param base_model: A base model that is going to be extended by the new parameters.
+    :param reuse_sketch: (default False) If True, one sketch matrix is built per Weisfeiler-Lehman
+    iteration and shared by all (k, L) tuples (see get_sketch_matrices).
+    :param incremental_wl: (default True) If True, Weisfeiler-Lehman is performed only once for
+    the whole wl_iter_range (see get_characteristic_matrices).
+    :param weighted_voting: (default False) If True, the targets of the similar columns are
+    weighted by their estimated Jaccard similarity (see SketchMatrix.get_similar_columns_ranked).
     :return The best model as a dictionary.
     '''
     def quality(i, sketch_matrix):
         col_i = sketch_matrix.get_column(i)
-        similar_cols = list(sketch_matrix.get_similar_columns(col_i))
-        if i in similar_cols:
-            similar_cols.remove(i)
+        if weighted_voting:
+            similar_cols, similarities = sketch_matrix.get_similar_columns_ranked(col_i)
+            weights = list(similarities[similar_cols != i])
+            similar_cols = list(similar_cols[similar_cols != i])
+        else:
+            weights = None
+            similar_cols = list(sketch_matrix.get_similar_columns(col_i))
+            if i in similar_cols:
+                similar_cols.remove(i)
         similar_targets = map(lambda c: graph_database[c][2], similar_cols)
         true_target_i = graph_database[i][2]
-        estimated_target_i = statistics.predict_target_majority(similar_targets)
+        estimated_target_i = statistics.predict_target_majority(similar_targets, weights=weights)
 #         print "Col:", i, ", Target:", true_target_i, ", Est. target: ", estimated_target_i
 #         print "Similar cols:", similar_cols
 #         print "Similar targets:", similar_targets
@@ -87,14 +140,8 @@ def loo_crossval_sketch(graph_database, wl_iter_range, k_L_range, output_dir, ba
     
     models_file = open(output_dir + "models_sketch", "a")
     
-    for wl_iterations in wl_iter_range:
-#         start = time.time()
-        ch_matrix = CharacteristicMatrix(graph_database, cols_count, wl_iterations=wl_iterations, print_progress=True, shingles_type=shingles_type, window_size=window_size)
-#         print "Building characteristic matrix for wl_iter =", wl_iterations, "took:", time.time() - start
-        for k, L in k_L_range:
-#             start = time.time()
-            sketch_matrix = SketchMatrix(k, L, ch_matrix)
-#             print "Building sketch matrix for k={0} and L={1} took:".format(k, L), time.time() - start
+    for wl_iterations, ch_matrix in get_characteristic_matrices(graph_database, cols_count, wl_iter_range, incremental_wl, print_progress=True, shingles_type=shingles_type, window_size=window_size):
+        for k, L, sketch_matrix in get_sketch_matrices(ch_matrix, k_L_range, reuse_sketch):
 #             sketch_matrix.save_to_file(output_dir + "sketch_matrix_wl{0}_k{1}_L{2}".format(wl_iterations, k, L))
 #             start = time.time()
             avg_quality = 0.
@@ -117,23 +164,36 @@ def loo_crossval_sketch(graph_database, wl_iter_range, k_L_range, output_dir, ba
     
     return best_model
 
-def loo_crossval_naive(graph_database, wl_iter_range, param_2_range, quality_function, output_dir, base_model={}, shingles_type="features", window_size=5, accumulate_wl_shingles=True):
+def loo_crossval_naive(graph_database, wl_iter_range, param_2_range, quality_function, output_dir, base_model={}, shingles_type="features", window_size=5, accumulate_wl_shingles=True,
+                       similar_cols_function=None, incremental_wl=True):
     '''Similar to loo_crossval_sketch but computes directly the Jaccard
     similarities between the columns in the characteristic matrix,
     without using a sketch matrix. Not applicable for big datasets.
+    :param similar_cols_function: (default None) A function with signature (ch_matrix, param_2_range),
+    which returns for each value of param_2 the list of the similar columns of every column.
+    If set, the full Jaccard similarity matrix is not computed and quality_function is
+    called with the similar columns of column i instead of the matrix.
+    :param incremental_wl: (default True) If True, Weisfeiler-Lehman is performed only once for
+    the whole wl_iter_range (see get_characteristic_matrices).
     '''
     best_model = model_p(-1, -1, -1, base_model=base_model)
     cols_count = len(graph_database)
     
     models_file = open(output_dir + "models_naive", "a")
     
-    for wl_iterations in wl_iter_range:
-        ch_matrix = CharacteristicMatrix(graph_database, cols_count, wl_iterations=wl_iterations, shingles_type=shingles_type, window_size=window_size, accumulate_wl_shingles=accumulate_wl_shingles)
-        jaccard_similarity_matrix = ch_matrix.compute_jaccard_similarity_matrix()
-        for p in param_2_range:
+    for wl_iterations, ch_matrix in get_characteristic_matrices(graph_database, cols_count, wl_iter_range, incremental_wl, shingles_type=shingles_type, window_size=window_size,
+                                                                accumulate_wl_shingles=accumulate_wl_shingles):
+        if similar_cols_function:
+            similar_cols_lists = similar_cols_function(ch_matrix, param_2_range)
+        else:
+            jaccard_similarity_matrix = ch_matrix.compute_jaccard_similarity_matrix()
+        for p_index, p in enumerate(param_2_range):
             avg_quality = 0.
             for i in range(cols_count):
-                avg_quality += float(quality_function(i, jaccard_similarity_matrix, p))
+                if similar_cols_function:
+                    avg_quality += float(quality_function(i, similar_cols_lists[p_index][i], p))
+                else:
+                    avg_quality += float(quality_function(i, jaccard_similarity_matrix, p))
             avg_quality /= cols_count
             current_model = model_p(avg_quality, wl_iterations, p, base_model=base_model)
             print current_model
@@ -156,9 +216,12 @@ def loo_crossval_threshold(graph_database, wl_iter_range, infl_point_range, outp
     without using a sketch matrix. Not applicable for big datasets.
     :param infl_point_range: A range of inflation point values (infl_point = 1. - threshold).
     '''
-    def quality(i, jaccard_similarity_matrix, infl_point):
-        threshold = 1. - infl_point
-        similar_cols = np.where(jaccard_similarity_matrix[i, :] >= threshold)[0]
+    def similar_cols_lists(ch_matrix, infl_point_range):
+        thresholds = [1. - infl_point for infl_point in infl_point_range]
+        similar_cols = ch_matrix.compute_similar_columns(min(thresholds), return_similarities=True)
+        return [[cols[sims >= threshold] for cols, sims in similar_cols] for threshold in thresholds]
+    
+    def quality(i, similar_cols, infl_point):
         similar_targets = map(lambda c: graph_database[c][2], similar_cols)
         true_target_i = graph_database[i][2]
         estimated_target_i = statistics.predict_target_majority(similar_targets)
@@ -177,18 +240,22 @@ def loo_crossval_threshold(graph_database, wl_iter_range, infl_point_range, outp
         else:
             return int(true_target_i == estimated_target_i) # zero-one loss
     
-    return loo_crossval_naive(graph_database, wl_iter_range, infl_point_range, quality, output_dir, base_model, shingles_type, window_size, accumulate_wl_shingles=accumulate_wl_shingles)
+    return loo_crossval_naive(graph_database, wl_iter_range, infl_point_range, quality, output_dir, base_model, shingles_type, window_size, accumulate_wl_shingles=accumulate_wl_shingles,
+                              similar_cols_function=similar_cols_lists)
 
 def loo_crossval_pnn(graph_database, wl_iter_range, p_range, output_dir, base_model={}, shingles_type="features", window_size=5, accumulate_wl_shingles=True):
     '''Similar to loo_crossval_sketch but computes directly the Jaccard
     similarities between the columns in the characteristic matrix,
     without using a sketch matrix. Not applicable for big datasets.
     The classification is done by the p-nearest neighbors method.
-    '''    
-    def quality_pnn(i, jaccard_similarity_matrix, p):
+    '''
+    def most_similar_cols_lists(ch_matrix, p_range):
+        most_similar_cols = ch_matrix.compute_most_similar_columns(max(p_range))
+        return [most_similar_cols[:, -p:] for p in p_range]
+    
+    def quality_pnn(i, k_most_similar_cols, p):
         '''Quality estimation by p nearest neighbors classification.
         '''
-        k_most_similar_cols = jaccard_similarity_matrix[i, :].argsort()[-p:]
         k_most_similar_targets = map(lambda c: graph_database[c][2], k_most_similar_cols)
         true_target_i = graph_database[i][2]
         estimated_target_i = statistics.predict_target_majority(k_most_similar_targets)
@@ -197,7 +264,8 @@ def loo_crossval_pnn(graph_database, wl_iter_range, p_range, output_dir, base_mo
         else:
             return int(true_target_i == estimated_target_i) # zero-one loss
     
-    return loo_crossval_naive(graph_database, wl_iter_range, p_range, quality_pnn, output_dir, base_model, shingles_type, window_size, accumulate_wl_shingles=accumulate_wl_shingles)
+    return loo_crossval_naive(graph_database, wl_iter_range, p_range, quality_pnn, output_dir, base_model, shingles_type, window_size, accumulate_wl_shingles=accumulate_wl_shingles,
+                              similar_cols_function=most_similar_cols_lists)
 
 def d_folds(d, sketch_matrix, cols_count, quality_function, targets):
     def aggregate_scores(aggr_score, current_score):
@@ -233,17 +301,85 @@ def d_folds(d, sketch_matrix, cols_count, quality_function, targets):
     
     return avg_score
 
-def d_fold_crossval(data, cols_count, d, k_L_range, output_dir, base_model={}, multilabel=False, multilabel_prediction_threshold=0.4):
-    '''Cross-validation in d-folds.
-    :param data: Input data, where each record is a tuple of the form (target, props), where props is a sparse vector.
-    :param cols_count: Number of records in data.
-    :param d: Number of cross-validation folds.
-    :param k_L_range: A range of (k, L) tuples for the sketch matrix to be considered in the cross-validation.
-    :param output_dir: A local directory, that will be used to save the sketch matrices of all models.
-    :param base_model: A base model that is going to be extended by the new parameters.
+def get_similar_columns_matrix(band_ids, test_cols, train_cols):
+    '''Joins the test and the train columns of a sketch matrix by their band ids (see
+    SketchMatrix.get_band_ids).
+    :return: A binary CSR matrix S of shape (len(test_cols), len(train_cols)), where S[i, c] = 1
+    iff the columns test_cols[i] and train_cols[c] are equal in at least one band, i.e. the
+    train columns returned by SketchMatrix._get_similar_columns for test column i.
+    '''
+    rows_list = []
+    cols_list = []
+    for ids in band_ids:
+        train_order = np.argsort(ids[train_cols], kind="mergesort")
+        sorted_train_ids = ids[train_cols][train_order]
+        test_ids = ids[test_cols]
+        starts = np.searchsorted(sorted_train_ids, test_ids, side="left")
+        counts = np.searchsorted(sorted_train_ids, test_ids, side="right") - starts
+        # the matching train columns of test column i are train_order[starts[i] : starts[i] + counts[i]]
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows_list.append(np.repeat(np.arange(len(test_cols)), counts))
+        cols_list.append(train_order[np.repeat(starts, counts) + offsets])
+    rows = np.concatenate(rows_list)
+    cols = np.concatenate(cols_list)
+    similar_cols_matrix = csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=(len(test_cols), len(train_cols)))
+    # the duplicates of the columns matching in multiple bands are summed up
+    similar_cols_matrix.data[:] = 1
+    return similar_cols_matrix
+
+def d_folds_batch(d, sketch_matrix, targets, multilabel=False, multilabel_prediction_threshold=0.4, positive_target=1):
+    '''Computes the same scores as d_folds with the quality function of d_fold_crossval, but
+    evaluates all test columns of a fold at once. The band ids of all columns are computed once,
+    the test columns are joined with the train columns by band ids and the targets of the similar
+    columns are counted by a sparse product with the matrix of target counts.
+    :param targets: A list with a target or a list of targets for each column.
+    :return: The average scores (AUC, accuracy, precision, recall, F1) over the folds.
+    '''
+    cols_count = sketch_matrix.cols_count
+    band_ids = SketchMatrix.get_band_ids(sketch_matrix.matrix, sketch_matrix.k, sketch_matrix.L)
+    
+    targets_lists = [col_targets if type(col_targets) is list else [col_targets] for col_targets in targets]
+    all_targets = np.array(list(itertools.chain(*targets_lists)), dtype=np.int64)
+    labels, label_indices = np.unique(all_targets, return_inverse=True)
+    target_rows = np.repeat(np.arange(cols_count), [len(col_targets) for col_targets in targets_lists])
+    # the element [j, t] is the number of occurrences of the target labels[t] among the targets of column j
+    target_counts = csr_matrix((np.ones(len(all_targets), dtype=np.int64), (target_rows, label_indices)), shape=(cols_count, len(labels)))
+    
+    fold_size = cols_count / d
+    avg_score = [0., 0., 0., 0., 0.]
+    for fold in range(d):
+        test_cols = np.arange(fold * fold_size, (fold + 1) * fold_size)
+        train_cols = np.concatenate((np.arange(fold * fold_size), np.arange((fold + 1) * fold_size, cols_count)))
+        similar_cols_matrix = get_similar_columns_matrix(band_ids, test_cols, train_cols)
+        similar_target_counts = (similar_cols_matrix * target_counts[train_cols]).toarray().astype(np.float64)
+        test_targets = targets[fold * fold_size : (fold + 1) * fold_size]
+        
+        if multilabel:
+            similar_cols_counts = np.diff(similar_cols_matrix.indptr).astype(np.float64)
+            proportions = np.divide(similar_target_counts, similar_cols_counts[:, np.newaxis], out=np.zeros_like(similar_target_counts),
+                                    where=similar_cols_counts[:, np.newaxis] > 0)
+            predicted = proportions > multilabel_prediction_threshold
+            test_targets_pred = [labels[predicted[i]].tolist() for i in range(len(test_cols))]
+            acc, prec, recall, f1 = statistics.multi_label_scores(test_targets, test_targets_pred)
+            current_score = -1., acc, prec, recall, f1
+        else:
+            similar_targets_counts = similar_target_counts.sum(axis=1)
+            positive_counts = similar_target_counts[:, labels == positive_target].sum(axis=1)
+            test_targets_proba = np.divide(positive_counts, similar_targets_counts, out=np.zeros_like(positive_counts), where=similar_targets_counts > 0)
+            current_score = all_scores(test_targets, test_targets_proba)
+        
+        for i in range(len(avg_score)):
+            avg_score[i] += current_score[i]
+    
+    return [float(s) / float(d) for s in avg_score]
+
+def get_d_fold_quality_function(multilabel=False, multilabel_prediction_threshold=0.4):
+    '''Get the quality function of d_fold_crossval for d_folds, which queries the similar train
+    columns of the test columns one at a time (see d_folds_batch for the batch version).
     :param multilabel: (default False) If True, a record may have multiple different integer target labels.
     If False, the target labels are binary.
-    :return: The best model as a dictionary.
+    :return: A function (sketch_matrix, train_sketch, test_sketch, train_targets, test_targets)
+    returning the scores (AUC, accuracy, precision, recall, F1) of the test columns.
     '''
     def quality(sketch_matrix, train_sketch, test_sketch, train_targets, test_targets):
         k = sketch_matrix.k
@@ -256,8 +392,7 @@ def d_fold_crossval(data, cols_count, d, k_L_range, output_dir, base_model={}, m
         for i in range(np.shape(test_sketch)[1]):
             col_i = test_sketch[:, i : i + 1]
             similar_cols = SketchMatrix._get_similar_columns(col_i, train_sketch, k, L, train_cols_count)
-            similar_targets = itertools.chain(*map(lambda c: train_targets[c], similar_cols))
-#             similar_targets = list(itertools.chain(*map(lambda c: train_targets[c], similar_cols)))
+            similar_targets = list(itertools.chain(*map(lambda c: train_targets[c], similar_cols)))
             if multilabel:
                 target_proportions = statistics.get_multilabel_target_proportions(similar_targets, np.shape(similar_cols)[0])
                 targets_pred = filter(lambda target: target_proportions[target] > multilabel_prediction_threshold, target_proportions)
@@ -285,6 +420,27 @@ def d_fold_crossval(data, cols_count, d, k_L_range, output_dir, base_model={}, m
         else:
             return all_scores(test_targets, test_targets_proba)
     
+    return quality
+
+def d_fold_crossval(data, cols_count, d, k_L_range, output_dir, base_model={}, multilabel=False, multilabel_prediction_threshold=0.4, reuse_sketch=False,
+                    batch_evaluation=True):
+    '''Cross-validation in d-folds.
+    :param data: Input data, where each record is a tuple of the form (target, props), where props is a sparse vector.
+    :param cols_count: Number of records in data.
+    :param d: Number of cross-validation folds.
+    :param k_L_range: A range of (k, L) tuples for the sketch matrix to be considered in the cross-validation.
+    :param output_dir: A local directory, that will be used to save the sketch matrices of all models.
+    :param base_model: A base model that is going to be extended by the new parameters.
+    :param multilabel: (default False) If True, a record may have multiple different integer target labels.
+    If False, the target labels are binary.
+    :param reuse_sketch: (default False) If True, one sketch matrix is built and shared by all
+    (k, L) tuples (see get_sketch_matrices).
+    :param batch_evaluation: (default True) If True, the folds are evaluated with d_folds_batch
+    instead of querying the test columns one at a time.
+    :return: The best model as a dictionary.
+    '''
+    quality = get_d_fold_quality_function(multilabel, multilabel_prediction_threshold)
+    
     best_model = model_score([-1., -1., -1., -1., -1.], base_model=base_model)
     
     models_file = open(output_dir + "models_sketch", "a")
@@ -293,13 +449,13 @@ def d_fold_crossval(data, cols_count, d, k_L_range, output_dir, base_model={}, m
     ch_matrix = CharacteristicMatrix(records=data, cols_count=cols_count, print_progress=True)
     targets = ch_matrix.target_values
     print "Building characteristic matrix took:", time.time() - start
-    for k, L in k_L_range:
-        start = time.time()
-        sketch_matrix = SketchMatrix(k, L, ch_matrix)
-        print "Building sketch matrix for k={0} and L={1} took:".format(k, L), time.time() - start
+    for k, L, sketch_matrix in get_sketch_matrices(ch_matrix, k_L_range, reuse_sketch):
 #         sketch_matrix.save_to_file(output_dir + "sketch_matrix_wl{0}_k{1}_L{2}".format(wl_iterations, k, L))
         start = time.time()
-        avg_score = d_folds(d, sketch_matrix, cols_count, quality, targets)
+        if batch_evaluation:
+            avg_score = d_folds_batch(d, sketch_matrix, targets, multilabel, multilabel_prediction_threshold)
+        else:
+            avg_score = d_folds(d, sketch_matrix, cols_count, quality, targets)
         print "Classification took:", time.time() - start
         current_model = model_score(avg_score, k, L, base_model=base_model)
         print current_model
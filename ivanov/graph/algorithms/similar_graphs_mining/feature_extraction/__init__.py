@@ -13,32 +13,52 @@ import networkx as nx
 import itertools
 import sys
 
-def extract_features(hypergraph, wl_iterations=0, wl_state=None, accumulate_wl_shingles=True):
+def extract_features(hypergraph, wl_iterations=0, wl_state=None, accumulate_wl_shingles=True, stop_when_stable=False):
     features = []
     
-    for _, new_features, wl_state in extract_features_for_each_wl_iter(hypergraph, wl_iterations, wl_state, accumulate_wl_shingles):
+    for _, new_features, wl_state in extract_features_for_each_wl_iter(hypergraph, wl_iterations, wl_state, accumulate_wl_shingles, stop_when_stable):
         features += new_features
     
     return features, wl_state
 
-def extract_features_for_each_wl_iter(hypergraph, wl_iterations=0, wl_state=None, accumulate_wl_shingles=True):
+def extract_features_for_each_wl_iter(hypergraph, wl_iterations=0, wl_state=None, accumulate_wl_shingles=True, stop_when_stable=False):
+    '''Extract the features of the hypergraph for each Weisfeiler-Lehman iteration.
+    :param stop_when_stable: (default False) If True, the Weisfeiler-Lehman iterations
+    stop as soon as the labels are stable, i.e. iterate until stable, but at most
+    wl_iterations times.
+    :return A generator of tuples of the form (wl_iteration, features, wl_state).
+    '''
     raw_features = arnborg_proskurowski.get_reduced_features(hypergraph)
 #     if tw == -1:
 #         # TODO: How to handle graphs with larger tree-width?
 #         # for now collect all possible features
 #         print "The hypergraph has tree-width > 3."
 
-    for i in range(wl_iterations + 1):
+    if wl_iterations == 0 or accumulate_wl_shingles:
+        new_features = [process_raw_feature(raw_feature, hypergraph) for raw_feature in raw_features]
+        yield 0, itertools.chain(*new_features), wl_state
+    
+    if wl_iterations > 0:
+        vertex_ids, wl_labels, wl_state = weisfeiler_lehman.iterate_all(hypergraph, wl_iterations, wl_state, stop_when_stable=stop_when_stable)
+        for i, new_features in get_wl_features(hypergraph, raw_features, vertex_ids, wl_labels, accumulate_wl_shingles):
+            yield i, new_features, wl_state
+
+def get_wl_features(hypergraph, raw_features, vertex_ids, wl_labels, accumulate_wl_shingles=True):
+    '''Get the features of the Weisfeiler-Lehman iterations 1, 2, ... of a hypergraph.
+    :param raw_features: The raw features reduced from the hypergraph by Arnborg & Proskurowski.
+    :param vertex_ids: The vertex ids as returned by weisfeiler_lehman.iterate_all.
+    :param wl_labels: The labels as returned by weisfeiler_lehman.iterate_all.
+    :return A generator of tuples of the form (wl_iteration, features).
+    '''
+    last_iteration = len(wl_labels) - 1
+    for i in range(1, last_iteration + 1):
         if i == 1:
-            hypergraph, wl_state = weisfeiler_lehman.init(hypergraph, wl_state)
+            hypergraph = weisfeiler_lehman.relabel(hypergraph, vertex_ids, wl_labels[0])
+        hypergraph = weisfeiler_lehman.relabel(hypergraph, vertex_ids, wl_labels[i])
         
-        if i >= 1:
-#             old_hypergraph = hypergraph
-            hypergraph, wl_state = weisfeiler_lehman.iterate(hypergraph, wl_state, i)
-        
-        if i == wl_iterations or accumulate_wl_shingles:
+        if i == last_iteration or accumulate_wl_shingles:
             new_features = [process_raw_feature(raw_feature, hypergraph) for raw_feature in raw_features]
-            yield i, itertools.chain(*new_features), wl_state
+            yield i, itertools.chain(*new_features)
 
 def process_raw_feature(raw_feature, hypergraph, max_nodes=6):
     '''Turns a raw feature to a usable feature or a collection of features, depending on
@@ -50,7 +70,7 @@ def process_raw_feature(raw_feature, hypergraph, max_nodes=6):
     :return A collection containing one or more features depending on the type of the raw feature.
     '''
     assert type(raw_feature) is ReducibleFeature
-    assert type(hypergraph) is Hypergraph
+    assert isinstance(hypergraph, Hypergraph)
     assert max_nodes > 3
     def get_feature_type(raw_feature):
         '''Get the type of the raw feature according to the rule it was reduced by.
@@ -152,7 +172,11 @@ def process_raw_feature(raw_feature, hypergraph, max_nodes=6):
     # fixed or pattern/dynamic with <= max_nodes number of nodes
     yield raw_feature.as_subgraph(hypergraph)
 
-def get_feature_lists(graph_database, wl_iterations=0, iterator=True, accumulate_wl_shingles=True):
+def get_feature_lists(graph_database, wl_iterations=0, iterator=True, accumulate_wl_shingles=True, wl_state=None):
+    '''Extract the features for all graphs in the graph database.
+    :param wl_state: (default None) The initial wl_state, e.g. one with hashed labels
+    (see weisfeiler_lehman.new_state).
+    '''
     def get_features_lists_generator():
         for record_id, element_hypergraphs, target in graph_database:
             # process the hypergraphs representing one element of the database
@@ -162,11 +186,63 @@ def get_feature_lists(graph_database, wl_iterations=0, iterator=True, accumulate
                 features += new_features
             yield record_id, features, target
     
-    state = {"wl_state": None}
-    features_lists = get_features_lists_generator()
+    def get_features_lists_batch():
+        # the whole database is known in advance, so Weisfeiler-Lehman is performed on all graphs at once
+        database = [(record_id, list(element_hypergraphs), target) for record_id, element_hypergraphs, target in graph_database]
+        hypergraphs = [hypergraph for _, element_hypergraphs, _ in database for hypergraph in element_hypergraphs]
+        raw_features_list = [arnborg_proskurowski.get_reduced_features(hypergraph) for hypergraph in hypergraphs]
+        if wl_iterations > 0:
+            vertex_ids_list, wl_labels_list, state["wl_state"] = weisfeiler_lehman.iterate_all_batch(hypergraphs, wl_iterations, state["wl_state"])
+        
+        features_lists = []
+        g = 0
+        for record_id, element_hypergraphs, target in database:
+            features = []
+            for hypergraph in element_hypergraphs:
+                if wl_iterations == 0 or accumulate_wl_shingles:
+                    for raw_feature in raw_features_list[g]:
+                        features += process_raw_feature(raw_feature, hypergraph)
+                if wl_iterations > 0:
+                    for _, new_features in get_wl_features(hypergraph, raw_features_list[g], vertex_ids_list[g], wl_labels_list[g], accumulate_wl_shingles):
+                        features += new_features
+                g += 1
+            features_lists.append((record_id, features, target))
+        return features_lists
+    
+    state = {"wl_state": wl_state}
     
     if iterator:
-        return features_lists
+        return get_features_lists_generator()
     else:
-        features_lists = [(record_id, list(features), target) for record_id, features, target in features_lists]
+        features_lists = get_features_lists_batch()
         return features_lists, state["wl_state"]
+
+def get_feature_lists_for_each_wl_iter(graph_database, wl_iterations, wl_state=None):
+    '''Extract the features for all graphs in the graph database separately for each
+    Weisfeiler-Lehman iteration 0, 1, ..., wl_iterations. Weisfeiler-Lehman is performed
+    once on all graphs and the labels of an iteration do not depend on the number of
+    iterations performed, so the features of iteration i are the same as those extracted
+    by get_feature_lists(graph_database, i, iterator=False) for iteration i.
+    :return A tuple (features_lists, wl_state), where features_lists is a list of tuples
+    (record_id, iterations_features, target) and iterations_features[i] is the list of
+    features of the record from iteration i.
+    '''
+    database = [(record_id, list(element_hypergraphs), target) for record_id, element_hypergraphs, target in graph_database]
+    hypergraphs = [hypergraph for _, element_hypergraphs, _ in database for hypergraph in element_hypergraphs]
+    raw_features_list = [arnborg_proskurowski.get_reduced_features(hypergraph) for hypergraph in hypergraphs]
+    if wl_iterations > 0:
+        vertex_ids_list, wl_labels_list, wl_state = weisfeiler_lehman.iterate_all_batch(hypergraphs, wl_iterations, wl_state)
+    
+    features_lists = []
+    g = 0
+    for record_id, element_hypergraphs, target in database:
+        iterations_features = [[] for _ in range(wl_iterations + 1)]
+        for hypergraph in element_hypergraphs:
+            for raw_feature in raw_features_list[g]:
+                iterations_features[0] += process_raw_feature(raw_feature, hypergraph)
+            if wl_iterations > 0:
+                for i, new_features in get_wl_features(hypergraph, raw_features_list[g], vertex_ids_list[g], wl_labels_list[g]):
+                    iterations_features[i] += new_features
+            g += 1
+        features_lists.append((record_id, iterations_features, target))
+    return features_lists, wl_state
@@ -67,10 +67,166 @@ def string_bytes_to_int(string_value, big_endian=True):
     
     return int_value
 
+_rabin_tables = {}
+_rabin_out_tables = {}
+_rabin_table_arrays = {}
+
+def get_rabin_table(size=64):
+    '''Get the table of the remainders of (t << size) modulo the irreducible polynomial
+    for all byte values t, which allows computing Rabin's fingerprints byte by byte.
+    :param size: Size of the fingerprint in bits (64, 32, 24 or 16).
+    :return A list of 256 integers.
+    '''
+    if size not in _rabin_tables:
+        irred_poly = irred_polys[size]
+        table = []
+        for t in range(256):
+            remainder = t << size
+            for i in range(size + 7, size - 1, -1):
+                if (remainder >> i) & 1:
+                    remainder ^= irred_poly << (i - size)
+            table.append(remainder)
+        _rabin_tables[size] = table
+    return _rabin_tables[size]
+
+def string_to_bytes(string_value):
+    '''Get the bytes of a string (unicode strings are encoded in UTF-8).
+    '''
+    return string_value.encode("utf8") if type(string_value) is unicode else str(string_value)
+
+def rabin_fingerprint_bytes(shingle, size=64):
+    '''Calculates Rabin's fingerprint of a string byte by byte using a precomputed table.
+    The result is identical to rabin_fingerprint(string_bytes_to_int(shingle), size).
+    :param shingle: A string (unicode strings are encoded in UTF-8).
+    :param size: Size of the fingerprint in bits. Possible
+    sizes are 64 (default), 32, 24 and 16.
+    :return Rabin's fingerprint of the shingle as integer.
+    '''
+    table = get_rabin_table(size)
+    shift = size - 8
+    low_mask = (1 << shift) - 1
+    fingerprint = 0
+    for b in bytearray(string_to_bytes(shingle)):
+        fingerprint = table[fingerprint >> shift] ^ ((fingerprint & low_mask) << 8) ^ b
+    return np.uint64(fingerprint)
+
+def rabin_fingerprints(shingles, size=64, chunk_size=4096):
+    '''Calculates Rabin's fingerprints of a list of strings at once. The strings are
+    processed in chunks of similar length as byte matrices, one byte column at a time.
+    :param shingles: A list of strings (unicode strings are encoded in UTF-8).
+    :param size: Size of the fingerprints in bits (64, 32, 24 or 16).
+    :param chunk_size: Number of strings processed together.
+    :return A numpy array with the fingerprints (uint64) in the order of the shingles,
+    which are identical to the ones computed by rabin_fingerprint.
+    '''
+    shingles_bytes = [string_to_bytes(shingle) for shingle in shingles]
+    fingerprints = np.zeros(len(shingles_bytes), dtype=np.uint64)
+    order = sorted(range(len(shingles_bytes)), key=lambda i: len(shingles_bytes[i]))
+    for start in range(0, len(order), chunk_size):
+        chunk = order[start : start + chunk_size]
+        width = len(shingles_bytes[chunk[-1]])
+        # leading zero bytes do not change the fingerprint, so shorter strings are padded on the left
+        byte_matrix = np.zeros((len(chunk), width), dtype=np.uint8)
+        for row, i in enumerate(chunk):
+            shingle_bytes = shingles_bytes[i]
+            if shingle_bytes:
+                byte_matrix[row, width - len(shingle_bytes):] = np.frombuffer(shingle_bytes, dtype=np.uint8)
+        chunk_fingerprints = np.zeros(len(chunk), dtype=np.uint64)
+        for j in range(width):
+            chunk_fingerprints = extend_fingerprints(chunk_fingerprints, byte_matrix[:, j], size)
+        fingerprints[chunk] = chunk_fingerprints
+    
+    return fingerprints
+
+def extend_fingerprints(fingerprints, byte_values, size=64):
+    '''Appends one byte to each of the strings represented by an array of Rabin's fingerprints.
+    :param fingerprints: A numpy array of uint64 fingerprints.
+    :param byte_values: A numpy array of bytes (uint8) with the same length.
+    :param size: Size of the fingerprints in bits (64, 32, 24 or 16).
+    :return A numpy array with the new fingerprints.
+    '''
+    if size not in _rabin_table_arrays:
+        _rabin_table_arrays[size] = np.array(get_rabin_table(size), dtype=np.uint64)
+    table = _rabin_table_arrays[size]
+    shift = np.uint64(size - 8)
+    low_mask = np.uint64((1 << (size - 8)) - 1)
+    return table[fingerprints >> shift] ^ ((fingerprints & low_mask) << np.uint64(8)) ^ byte_values
+
+def get_rabin_out_table(distance, size=64):
+    '''Get the table of the remainders of (t << (8 * distance)) modulo the irreducible polynomial
+    for all byte values t, i.e. the part of a Rabin's fingerprint contributed by a byte followed by
+    distance other bytes, which is removed when the byte leaves a rolling window.
+    :param distance: Number of bytes after the byte.
+    :param size: Size of the fingerprint in bits (64, 32, 24 or 16).
+    :return A list of 256 integers.
+    '''
+    if (size, distance) not in _rabin_out_tables:
+        table = get_rabin_table(size)
+        shift = size - 8
+        low_mask = (1 << shift) - 1
+        d = max([0] + [d for s, d in _rabin_out_tables if s == size and d < distance])
+        out_table = _rabin_out_tables.get((size, d), range(256))
+        while d < distance:
+            # append a zero byte to each fingerprint
+            out_table = [table[fingerprint >> shift] ^ ((fingerprint & low_mask) << 8) for fingerprint in out_table]
+            d += 1
+            _rabin_out_tables[(size, d)] = out_table
+    return _rabin_out_tables[(size, distance)]
+
+def get_w_shingle_fingerprints(text, w, size=64):
+    '''Get the fingerprints of all w-shingles of a string without extracting the shingles,
+    i.e. the same as the fingerprints of shingle_extraction.get_w_shingles(text, w).
+    A rolling Rabin-Karp fingerprint slides once over the bytes of the text: each byte entering
+    the window is appended with the table of get_rabin_table and each byte leaving it is removed
+    with the table of get_rabin_out_table. The windows have w characters, so for non-ASCII text
+    the number of bytes in a window varies.
+    :param text: Input string (unicode strings are encoded in UTF-8).
+    :param w: Size of the sliding window.
+    :param size: Size of the fingerprints in bits (64, 32, 24 or 16).
+    :return A set of fingerprints.
+    '''
+    text_bytes = bytearray(string_to_bytes(text))
+    table = get_rabin_table(size)
+    shift = size - 8
+    low_mask = (1 << shift) - 1
+    fingerprints = set()
+    fingerprint = 0
+    
+    if len(text_bytes) == len(text):
+        # one byte per character, the leaving byte is always followed by w bytes
+        out_table = get_rabin_out_table(w, size)
+        for i, b in enumerate(text_bytes):
+            fingerprint = table[fingerprint >> shift] ^ ((fingerprint & low_mask) << 8) ^ b
+            if i >= w:
+                fingerprint ^= out_table[text_bytes[i - w]]
+            if i >= w - 1:
+                fingerprints.add(fingerprint)
+    else:
+        chars_ends = []
+        end = 0
+        for char in text:
+            end += len(char.encode("utf8"))
+            chars_ends.append(end)
+        
+        start = 0
+        end = 0
+        for i, char_end in enumerate(chars_ends):
+            while end < char_end:
+                fingerprint = table[fingerprint >> shift] ^ ((fingerprint & low_mask) << 8) ^ text_bytes[end]
+                end += 1
+            if i >= w:
+                # remove the bytes of the character leaving the window
+                while start < chars_ends[i - w]:
+                    fingerprint ^= get_rabin_out_table(end - start - 1, size)[text_bytes[start]]
+                    start += 1
+            if i >= w - 1:
+                fingerprints.add(fingerprint)
+    
+    return set(np.array(list(fingerprints), dtype=np.uint64))
+
 def get_fingerprints(shingles, size=64):
     for shingle in shingles:
-        shingle_binary = string_bytes_to_int(shingle)
-        yield rabin_fingerprint(shingle_binary, size)
+        yield rabin_fingerprint_bytes(shingle, size)
 
 def get_minhash_fingerprint_naive(feature, h, cached_shingles_dict=None):
     '''Get naively the fingerprint of the shingle which has minimal
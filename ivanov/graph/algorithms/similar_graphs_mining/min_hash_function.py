@@ -38,3 +38,66 @@ class MinHashFunction(object):
             hash_funcs.append(MinHashFunction(a, b))
         
         return hash_funcs
+
+class MinHashFunctionFamily(object):
+    '''A family of min-hash functions h_l(x) = (a_l * x + b_l) mod p for the Mersenne
+    prime p = 2^61 - 1, which evaluates all functions on whole arrays of fingerprints at once.
+    The modular arithmetic is done on uint64 numpy arrays by splitting the factors in 32-bit
+    halves and using 2^61 = 1 (mod p), so no Python big integers are involved.
+    '''
+    
+    mersenne_prime = (1 << 61) - 1
+    
+    def __init__(self, a, b):
+        '''
+        :param a: A list of multipliers, 1 <= a[l] < p.
+        :param b: A list of offsets, 0 <= b[l] < p.
+        '''
+        assert len(a) == len(b)
+        assert all(1 <= a_l < MinHashFunctionFamily.mersenne_prime for a_l in a)
+        assert all(0 <= b_l < MinHashFunctionFamily.mersenne_prime for b_l in b)
+        self.a = np.array(a, dtype=np.uint64)
+        self.b = np.array(b, dtype=np.uint64)
+    
+    def __len__(self):
+        return len(self.a)
+    
+    def __getitem__(self, key):
+        '''Returns the family of the functions selected by a slice, e.g. family[:10].
+        '''
+        assert isinstance(key, slice)
+        return MinHashFunctionFamily(self.a[key].tolist(), self.b[key].tolist())
+    
+    @staticmethod
+    def _mod_p(values):
+        '''Reduces values < 2^64 modulo p = 2^61 - 1.
+        '''
+        p = np.uint64(MinHashFunctionFamily.mersenne_prime)
+        values = (values & p) + (values >> np.uint64(61))
+        return np.where(values >= p, values - p, values)
+    
+    def __call__(self, fingerprints):
+        '''Evaluates all hash functions on an array of fingerprints.
+        :param fingerprints: An array-like of fingerprints (uint64).
+        :return A numpy array (uint64) of shape (number of functions, number of fingerprints),
+        where the element [l, i] is h_l(fingerprints[i]).
+        '''
+        low_mask = np.uint64(0xFFFFFFFF)
+        x = MinHashFunctionFamily._mod_p(np.asarray(fingerprints, dtype=np.uint64)).reshape(1, -1)
+        a = self.a.reshape(-1, 1)
+        a_hi, a_lo = a >> np.uint64(32), a & low_mask
+        x_hi, x_lo = x >> np.uint64(32), x & low_mask
+        # a * x = hi * 2^64 + mid * 2^32 + lo, where 2^64 = 8 (mod p)
+        hi = (a_hi * x_hi) << np.uint64(3)
+        mid = a_hi * x_lo + a_lo * x_hi
+        mid = (mid >> np.uint64(29)) + ((mid & np.uint64((1 << 29) - 1)) << np.uint64(32))
+        lo = MinHashFunctionFamily._mod_p(a_lo * x_lo)
+        product = MinHashFunctionFamily._mod_p(hi + mid + lo)
+        return MinHashFunctionFamily._mod_p(product + self.b.reshape(-1, 1))
+    
+    @staticmethod
+    def generate(h_count):
+        p = MinHashFunctionFamily.mersenne_prime
+        a = [random.randint(1, p - 1) for _ in range(h_count)]
+        b = [random.randint(0, p - 1) for _ in range(h_count)]
+        return MinHashFunctionFamily(a, b)
@@ -8,10 +8,13 @@ from ivanov.graph.algorithms import arnborg_proskurowski, weisfeiler_lehman
 from ivanov.graph import nxext
 import networkx as nx
 
-def extract_shingles(feature):
+def extract_shingles(feature, canonical_hash=False):
     '''Extracts (naively) all shingles contained in a feature (a shingle is created for each
     possible way to remove multiple colors per node and parallel edges).
     :param feature: A Networkx graph.
+    :param canonical_hash: (default False) If True, the shingles are the 64-bit canonical hashes
+    (see arnborg_proskurowski.get_canonical_hash), which can be used directly as fingerprints,
+    instead of the canonical strings.
     :return A generator of shingles.
     '''
     def estimate_number_of_shingles(parallel_edge_free_features_count, nodes_colors):
@@ -74,6 +77,8 @@ def extract_shingles(feature):
         for node in shingle_graph.nodes_iter():
             shingle_graph.node[node]["labels"] = [coloring[i]]
             i += 1
+        if canonical_hash:
+            return arnborg_proskurowski.get_canonical_hash(shingle_graph)
         # TODO: this shingle representation has very high collision probability in the Rabin's fingerprint
         shingle = arnborg_proskurowski.get_canonical_representation(shingle_graph)
         return shingle
@@ -103,56 +108,158 @@ def get_w_shingles(text, w):
     
     return shingles
 
-def extract_w_shingles(hypergraph, wl_iterations=0, wl_state=None, window_size=5, accumulate_wl_shingles=True):
+def extract_w_shingles(hypergraph, wl_iterations=0, wl_state=None, window_size=5, accumulate_wl_shingles=True, stop_when_stable=False, w_shingles_function=get_w_shingles):
     shingles = set()
     
-    for _, new_shingles, wl_state in extract_w_shingles_for_each_wl_iter(hypergraph, wl_iterations, wl_state, window_size, accumulate_wl_shingles=accumulate_wl_shingles):
+    for _, new_shingles, wl_state in extract_w_shingles_for_each_wl_iter(hypergraph, wl_iterations, wl_state, window_size, accumulate_wl_shingles=accumulate_wl_shingles,
+                                                                         stop_when_stable=stop_when_stable, w_shingles_function=w_shingles_function):
         shingles |= new_shingles
     
     return shingles, wl_state
 
-def extract_w_shingles_for_each_wl_iter(hypergraph, wl_iterations=0, wl_state=None, window_size=5, accumulate_wl_shingles=True):
-    for i, canon_str, wl_state in extract_canon_repr_for_each_wl_iter(hypergraph, wl_iterations, wl_state, accumulate_wl_results=accumulate_wl_shingles):
-        new_shingles = get_w_shingles(canon_str, window_size)
+def extract_w_shingles_for_each_wl_iter(hypergraph, wl_iterations=0, wl_state=None, window_size=5, accumulate_wl_shingles=True, stop_when_stable=False, w_shingles_function=get_w_shingles):
+    '''Extract the w-shingles of the canonical representation of the hypergraph for each Weisfeiler-Lehman iteration.
+    :param w_shingles_function: (default get_w_shingles) A function (text, w) which returns the set
+    of w-shingles of a text, e.g. fingerprint.get_w_shingle_fingerprints to get directly the
+    fingerprints of the w-shingles instead of the shingles.
+    :return A generator of tuples of the form (wl_iteration, w_shingles, wl_state).
+    '''
+    for i, canon_str, wl_state in extract_canon_repr_for_each_wl_iter(hypergraph, wl_iterations, wl_state, accumulate_wl_results=accumulate_wl_shingles, stop_when_stable=stop_when_stable):
+        new_shingles = w_shingles_function(canon_str, window_size)
         yield i, new_shingles, wl_state
 
-def extract_canon_repr_for_each_wl_iter(hypergraph, wl_iterations=0, wl_state=None, accumulate_wl_results=True):
-    for i in range(wl_iterations + 1):
-        if i == 1:
-            hypergraph, wl_state = weisfeiler_lehman.init(hypergraph, wl_state)
+def extract_canon_repr_for_each_wl_iter(hypergraph, wl_iterations=0, wl_state=None, accumulate_wl_results=True, stop_when_stable=False):
+    '''Compute the canonical representation of the hypergraph for each Weisfeiler-Lehman iteration.
+    :param stop_when_stable: (default False) If True, the Weisfeiler-Lehman iterations
+    stop as soon as the labels are stable, i.e. iterate until stable, but at most
+    wl_iterations times.
+    :return A generator of tuples of the form (wl_iteration, canonical_string, wl_state).
+    '''
+    if wl_iterations == 0 or accumulate_wl_results:
+        canon_str = arnborg_proskurowski.get_canonical_representation(hypergraph)
+        if canon_str == u"Tree-width > 3":
+            # TODO: How to handle graphs with larger tree-width?
+            # for now ignore the graph
+            raise StopIteration
         
-        if i >= 1:
-            hypergraph, wl_state = weisfeiler_lehman.iterate(hypergraph, wl_state, i)
+        yield 0, canon_str, wl_state
+    
+    if wl_iterations > 0:
+        vertex_ids, wl_labels, wl_state = weisfeiler_lehman.iterate_all(hypergraph, wl_iterations, wl_state, stop_when_stable=stop_when_stable)
+        for i, canon_str in get_wl_canon_reprs(hypergraph, vertex_ids, wl_labels, accumulate_wl_results):
+            yield i, canon_str, wl_state
+
+def get_wl_canon_reprs(hypergraph, vertex_ids, wl_labels, accumulate_wl_results=True):
+    '''Get the canonical representations of the Weisfeiler-Lehman iterations 1, 2, ... of a hypergraph.
+    :param vertex_ids: The vertex ids as returned by weisfeiler_lehman.iterate_all.
+    :param wl_labels: The labels as returned by weisfeiler_lehman.iterate_all.
+    :return A generator of tuples of the form (wl_iteration, canonical_string).
+    '''
+    last_iteration = len(wl_labels) - 1
+    for i in range(1, last_iteration + 1):
+        if i == 1:
+            hypergraph = weisfeiler_lehman.relabel(hypergraph, vertex_ids, wl_labels[0])
+        hypergraph = weisfeiler_lehman.relabel(hypergraph, vertex_ids, wl_labels[i])
         
-        if i == wl_iterations or accumulate_wl_results:
+        if i == last_iteration or accumulate_wl_results:
             canon_str = arnborg_proskurowski.get_canonical_representation(hypergraph)
             if canon_str == u"Tree-width > 3":
-                # TODO: How to handle graphs with larger tree-width?
-                # for now ignore the graph
                 raise StopIteration
             
-            yield i, canon_str, wl_state
+            yield i, canon_str
 
 
-def get_w_shingle_lists(graph_database, wl_iterations=0, iterator=True, window_size=5, accumulate_wl_shingles=True):
+def get_w_shingle_lists(graph_database, wl_iterations=0, iterator=True, window_size=5, accumulate_wl_shingles=True, w_shingles_function=get_w_shingles, wl_state=None):
     '''Extract w-shingles for all graphs in the graph database
+    :param wl_state: (default None) The initial wl_state, e.g. one with hashed labels
+    (see weisfeiler_lehman.new_state).
     '''
     def get_shingle_lists_generator():
         for record_id, element_hypergraphs, target in graph_database:
             # process the hypergraphs representing one element of the database
             shingles = set()
             for hypergraph in element_hypergraphs:
-                new_shingles, state["wl_state"] = extract_w_shingles(hypergraph, wl_iterations, state["wl_state"], window_size, accumulate_wl_shingles=accumulate_wl_shingles)
+                new_shingles, state["wl_state"] = extract_w_shingles(hypergraph, wl_iterations, state["wl_state"], window_size, accumulate_wl_shingles=accumulate_wl_shingles,
+                                                                         w_shingles_function=w_shingles_function)
                 shingles |= new_shingles
             if shingles:
                 # TODO: for now return only records which have shingles
                 yield record_id, list(shingles), target
     
-    state = {"wl_state": None}
-    shingles_lists = get_shingle_lists_generator()
+    def get_shingle_lists_batch():
+        # the whole database is known in advance, so Weisfeiler-Lehman is performed on all graphs at once
+        database = [(record_id, list(element_hypergraphs), target) for record_id, element_hypergraphs, target in graph_database]
+        hypergraphs = [hypergraph for _, element_hypergraphs, _ in database for hypergraph in element_hypergraphs]
+        if wl_iterations == 0 or accumulate_wl_shingles:
+            canon_strs = [arnborg_proskurowski.get_canonical_representation(hypergraph) for hypergraph in hypergraphs]
+        else:
+            canon_strs = [None] * len(hypergraphs)
+        # graphs with tree-width > 3 are ignored before performing Weisfeiler-Lehman on them
+        wl_graphs = [g for g in range(len(hypergraphs)) if canon_strs[g] != u"Tree-width > 3"]
+        wl_results = {}
+        if wl_iterations > 0:
+            vertex_ids_list, wl_labels_list, state["wl_state"] = weisfeiler_lehman.iterate_all_batch([hypergraphs[g] for g in wl_graphs], wl_iterations, state["wl_state"])
+            wl_results = dict(zip(wl_graphs, zip(vertex_ids_list, wl_labels_list)))
+        
+        shingles_lists = []
+        g = 0
+        for record_id, element_hypergraphs, target in database:
+            shingles = set()
+            for hypergraph in element_hypergraphs:
+                if canon_strs[g] is not None and canon_strs[g] != u"Tree-width > 3":
+                    shingles |= w_shingles_function(canon_strs[g], window_size)
+                if g in wl_results:
+                    vertex_ids, wl_labels = wl_results[g]
+                    for _, canon_str in get_wl_canon_reprs(hypergraph, vertex_ids, wl_labels, accumulate_wl_shingles):
+                        shingles |= w_shingles_function(canon_str, window_size)
+                g += 1
+            if shingles:
+                shingles_lists.append((record_id, list(shingles), target))
+        return shingles_lists
+    
+    state = {"wl_state": wl_state}
     
     if iterator:
-        return shingles_lists
+        return get_shingle_lists_generator()
     else:
-        shingles_lists = [(record_id, list(shingles), target) for record_id, shingles, target in shingles_lists]
+        shingles_lists = get_shingle_lists_batch()
         return shingles_lists, state["wl_state"]
+
+def get_w_shingle_lists_for_each_wl_iter(graph_database, wl_iterations, window_size=5, accumulate_wl_shingles=True, w_shingles_function=get_w_shingles, wl_state=None):
+    '''Extract the w-shingles for all graphs in the graph database separately for each
+    Weisfeiler-Lehman iteration 0, 1, ..., wl_iterations with a single Weisfeiler-Lehman
+    run (see feature_extraction.get_feature_lists_for_each_wl_iter).
+    :param accumulate_wl_shingles: (default True) As in get_w_shingle_lists, graphs with
+    tree-width > 3 are excluded from Weisfeiler-Lehman only if the shingles are accumulated,
+    which determines the numbering of the labels.
+    :return A tuple (shingles_lists, wl_state), where shingles_lists is a list of tuples
+    (record_id, iterations_shingles, target) and iterations_shingles[i] is the set of
+    w-shingles of the record from iteration i. Unlike get_w_shingle_lists, records
+    without shingles are included.
+    '''
+    database = [(record_id, list(element_hypergraphs), target) for record_id, element_hypergraphs, target in graph_database]
+    hypergraphs = [hypergraph for _, element_hypergraphs, _ in database for hypergraph in element_hypergraphs]
+    canon_strs = [arnborg_proskurowski.get_canonical_representation(hypergraph) for hypergraph in hypergraphs]
+    if accumulate_wl_shingles:
+        wl_graphs = [g for g in range(len(hypergraphs)) if canon_strs[g] != u"Tree-width > 3"]
+    else:
+        wl_graphs = range(len(hypergraphs))
+    wl_results = {}
+    if wl_iterations > 0:
+        vertex_ids_list, wl_labels_list, wl_state = weisfeiler_lehman.iterate_all_batch([hypergraphs[g] for g in wl_graphs], wl_iterations, wl_state)
+        wl_results = dict(zip(wl_graphs, zip(vertex_ids_list, wl_labels_list)))
+    
+    shingles_lists = []
+    g = 0
+    for record_id, element_hypergraphs, target in database:
+        iterations_shingles = [set() for _ in range(wl_iterations + 1)]
+        for hypergraph in element_hypergraphs:
+            if canon_strs[g] != u"Tree-width > 3":
+                iterations_shingles[0] |= w_shingles_function(canon_strs[g], window_size)
+            if g in wl_results:
+                vertex_ids, wl_labels = wl_results[g]
+                for i, canon_str in get_wl_canon_reprs(hypergraph, vertex_ids, wl_labels):
+                    iterations_shingles[i] |= w_shingles_function(canon_str, window_size)
+            g += 1
+        shingles_lists.append((record_id, iterations_shingles, target))
+    return shingles_lists, wl_state
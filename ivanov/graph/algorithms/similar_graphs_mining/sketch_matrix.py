@@ -5,9 +5,31 @@ Created on Dec 21, 2015
 '''
 
 from ivanov.graph.algorithms.similar_graphs_mining.characteristic_matrix import CharacteristicMatrix
-from ivanov.graph.algorithms.similar_graphs_mining.min_hash_function import MinHashFunction
+from ivanov.graph.algorithms.similar_graphs_mining.min_hash_function import MinHashFunctionFamily
 from ivanov.inout.serializable import Serializable
 import numpy as np
+import multiprocessing
+import collections
+import time
+
+def compute_sketch_chunk(args):
+    '''Computes the minima of the min-hash values over a chunk of rows of the characteristic
+    matrix for each column with a non-zero in the chunk. The rows are hashed once and the
+    non-zeros are sorted by column, so each minimum is a reduction of one column segment.
+    :param args: A tuple (hash_functions, fingerprints, indptr, indices), where hash_functions
+    is a MinHashFunctionFamily and the rest is the CSR form of the chunk (indptr starting from 0).
+    :return: A tuple (cols, minima), where minima[:, c] is the sketch column of cols[c]
+    restricted to the rows of the chunk.
+    '''
+    hash_functions, fingerprints, indptr, indices = args
+    if len(indices) == 0:
+        return indices, np.empty((len(hash_functions), 0), dtype=np.uint64)
+    entry_rows = np.repeat(np.arange(len(fingerprints)), np.diff(indptr))
+    order = np.argsort(indices, kind="mergesort")
+    entry_cols = indices[order]
+    segment_starts = np.flatnonzero(np.concatenate(([True], entry_cols[1:] != entry_cols[:-1])))
+    minima = np.minimum.reduceat(hash_functions(fingerprints)[:, entry_rows[order]], segment_starts, axis=1)
+    return entry_cols[segment_starts], minima
 
 class SketchMatrix(Serializable):
     @staticmethod
@@ -46,9 +68,63 @@ class SketchMatrix(Serializable):
         or_amplification = and_amplifications.any(0)
         return np.nonzero(or_amplification)[0]
     
-    def build(self, ch_matrix):
-        for i in ch_matrix.non_empty_rows(): # row i of M
-            ch_mat_row_i = ch_matrix[i]
+    @staticmethod
+    def build_lsh_index(raw_sketch_matrix, k, L):
+        '''Builds the banded LSH index of a sketch matrix: one hash table per band,
+        which maps the k min-hash values of the band to the columns having them.
+        :return: A list of L dictionaries {band key: list of column indices}.
+        '''
+        raw_sketch_matrix = np.asarray(raw_sketch_matrix, dtype=np.uint64)
+        lsh_index = []
+        for l in range(L):
+            band = np.ascontiguousarray(raw_sketch_matrix[l * k : (l + 1) * k].T)
+            # each row of the transposed band is viewed as a single byte string key
+            band_keys = band.view(np.dtype((np.void, band.dtype.itemsize * k))).ravel()
+            buckets = {}
+            for j, key in enumerate(band_keys.tolist()):
+                if key in buckets:
+                    buckets[key].append(j)
+                else:
+                    buckets[key] = [j]
+            lsh_index.append(buckets)
+        return lsh_index
+    
+    @staticmethod
+    def get_band_ids(raw_sketch_matrix, k, L):
+        '''Computes the band signatures of all columns of a sketch matrix.
+        :return: An integer matrix of shape (L, number of columns), where the element [l, j]
+        is an id of the k min-hash values of column j in band l. Two columns have the same
+        id in a band iff they are equal in the band.
+        '''
+        raw_sketch_matrix = np.asarray(raw_sketch_matrix, dtype=np.uint64)
+        band_ids = np.empty((L, np.shape(raw_sketch_matrix)[1]), dtype=np.int64)
+        for l in range(L):
+            band = np.ascontiguousarray(raw_sketch_matrix[l * k : (l + 1) * k].T)
+            band_keys = band.view(np.dtype((np.void, band.dtype.itemsize * k))).ravel()
+            band_ids[l] = np.unique(band_keys, return_inverse=True)[1]
+        return band_ids
+    
+    @staticmethod
+    def _query_lsh_index(sketch_column, lsh_index, k):
+        '''Returns the same column indices as _get_similar_columns, but looks up
+        each band of the query sketch column in the LSH index.
+        '''
+        sketch_column = np.ascontiguousarray(np.ravel(sketch_column), dtype=np.uint64)
+        similar_columns = set()
+        for l, buckets in enumerate(lsh_index):
+            bucket = buckets.get(sketch_column[l * k : (l + 1) * k].tobytes())
+            if bucket:
+                similar_columns.update(bucket)
+        return np.array(sorted(similar_columns), dtype=np.int64)
+    
+    def build(self, ch_matrix, n_jobs=1):
+        if isinstance(self.hash_functions, MinHashFunctionFamily):
+            self.build_chunked(ch_matrix, n_jobs)
+            return
+        
+        start_time = time.time()
+        for r, i in enumerate(ch_matrix.non_empty_rows().tolist()): # row i of M
+            ch_mat_row_i = ch_matrix.indices[ch_matrix.indptr[r] : ch_matrix.indptr[r + 1]]
             for j in ch_mat_row_i: # column j of M
                 # we consider only (i, j) pairs for which M(i, j) = 1
                 for l in range(len(self.hash_functions)):
@@ -56,6 +132,57 @@ class SketchMatrix(Serializable):
                     h_of_i = h(i)
                     if h_of_i < self.matrix[l, j]:
                         self.matrix[l, j] = h_of_i
+        
+        self.build_nnz_per_second = len(ch_matrix.indices) / max(time.time() - start_time, 1e-9)
+    
+    def build_chunked(self, ch_matrix, n_jobs=1, chunk_nnz=None):
+        '''Builds the sketch with a MinHashFunctionFamily from chunks of rows of the
+        characteristic matrix (see compute_sketch_chunk). The column minima of each chunk are
+        merged into the sketch as soon as they are computed. With n_jobs > 1 the chunks are
+        processed by a pool of worker processes, with at most 2 chunks per worker in flight,
+        so the memory does not grow with the number of chunks. The throughput in non-zeros of
+        the characteristic matrix per second is stored in self.build_nnz_per_second.
+        :param chunk_nnz: (default None) Maximal number of non-zeros of a chunk (a single
+        row may exceed it). By default the hashes of a chunk take about 32 MB.
+        '''
+        start_time = time.time()
+        rows = ch_matrix.non_empty_rows()
+        indptr = ch_matrix.indptr
+        chunk_nnz = chunk_nnz if chunk_nnz else max(1, (1 << 22) // max(self.h_count, 1))
+        
+        def get_chunks():
+            start = 0
+            while start < len(rows):
+                end = np.searchsorted(indptr, indptr[start] + chunk_nnz, side="right") - 1
+                end = min(max(end, start + 1), len(rows))
+                yield self.hash_functions, rows[start : end], indptr[start : end + 1] - indptr[start], ch_matrix.indices[indptr[start] : indptr[end]]
+                start = end
+        
+        def merge(chunk_minima):
+            cols, minima = chunk_minima
+            self.matrix[:, cols] = np.minimum(self.matrix[:, cols], minima)
+        
+        if n_jobs == 1:
+            for chunk in get_chunks():
+                merge(compute_sketch_chunk(chunk))
+        else:
+            workers_count = n_jobs if n_jobs > 0 else multiprocessing.cpu_count()
+            pool = multiprocessing.Pool(workers_count)
+            try:
+                # Pool.imap would queue all chunks and buffer their results, so the chunks
+                # are submitted one by one as the results of the earlier ones are merged
+                pending = collections.deque()
+                for chunk in get_chunks():
+                    pending.append(pool.apply_async(compute_sketch_chunk, (chunk,)))
+                    if len(pending) >= 2 * workers_count:
+                        merge(pending.popleft().get())
+                while pending:
+                    merge(pending.popleft().get())
+            finally:
+                pool.close()
+                pool.join()
+        
+        self.build_nnz_per_second = len(ch_matrix.indices) / max(time.time() - start_time, 1e-9)
     
     def compute_column(self, shingle_fingerprints):
         '''Computes a sketch column for the list of shingle,
@@ -65,6 +192,12 @@ class SketchMatrix(Serializable):
         :returns A numpy array representing a sketch column.
         '''
         column = np.full((self.h_count, 1), np.iinfo(np.uint64).max, np.uint64)
+        if isinstance(self.hash_functions, MinHashFunctionFamily):
+            shingle_fingerprints = np.array(list(shingle_fingerprints), dtype=np.uint64)
+            if len(shingle_fingerprints):
+                column[:, 0] = self.hash_functions(shingle_fingerprints).min(axis=1)
+            return column
+        
         for i in shingle_fingerprints:
             for l in range(len(self.hash_functions)):
                 h = self.hash_functions[l]
@@ -73,11 +206,105 @@ class SketchMatrix(Serializable):
                     column[l, 0] = h_of_i
         return column
     
+    def compute_columns(self, fingerprint_lists):
+        '''Computes the sketch columns of multiple lists of shingle fingerprints at once
+        (see compute_column). The fingerprints of all lists are hashed in one pass and the
+        minima of each list are taken by a segment reduction.
+        :param fingerprint_lists: A list of iterables of shingle fingerprints.
+        :return: A numpy array of shape (h_count, number of lists).
+        '''
+        fingerprint_lists = [np.fromiter(fingerprints, dtype=np.uint64) for fingerprints in fingerprint_lists]
+        columns = np.full((self.h_count, len(fingerprint_lists)), np.iinfo(np.uint64).max, np.uint64)
+        if not isinstance(self.hash_functions, MinHashFunctionFamily):
+            for q, fingerprints in enumerate(fingerprint_lists):
+                columns[:, q] = self.compute_column(fingerprints)[:, 0]
+            return columns
+        
+        lengths = np.array([len(fingerprints) for fingerprints in fingerprint_lists], dtype=np.int64)
+        non_empty = np.flatnonzero(lengths)
+        if len(non_empty):
+            # the empty lists have no segment, so each segment ends where the next one starts
+            segment_starts = (np.cumsum(lengths) - lengths)[non_empty]
+            columns[:, non_empty] = np.minimum.reduceat(self.hash_functions(np.concatenate(fingerprint_lists)), segment_starts, axis=1)
+        return columns
+    
     def get_column(self, i):
         return self.matrix[:, i : i + 1]
     
+    def get_sub_sketch(self, k, L):
+        '''Returns a sketch matrix with parameters k and L, which uses the first k * L
+        min-hash functions of this sketch matrix. Its raw matrix is a view over the first
+        k * L rows, so only the LSH index is built.
+        '''
+        assert k * L <= self.h_count
+        sub_sketch = SketchMatrix(k, L, raw_sketch_matrix=self.matrix[: k * L])
+        if getattr(self, "hash_functions", None) is not None:
+            sub_sketch.hash_functions = self.hash_functions[: k * L]
+        return sub_sketch
+    
+    def get_lsh_index(self):
+        '''Returns the LSH index of the sketch matrix (see build_lsh_index).
+        '''
+        if getattr(self, "lsh_index", None) is None:
+            # built lazily or sketch matrices saved before the index was introduced
+            self.lsh_index = SketchMatrix.build_lsh_index(self.matrix, self.k, self.L)
+        return self.lsh_index
+    
     def get_similar_columns(self, sketch_column):
-        return SketchMatrix._get_similar_columns(sketch_column, self.matrix, self.k, self.L, self.cols_count)
+        return SketchMatrix._query_lsh_index(sketch_column, self.get_lsh_index(), self.k)
+    
+    def rank_columns(self, sketch_column, columns, top_k=None):
+        '''Ranks columns of the sketch matrix by their estimated Jaccard similarity to a sketch
+        column, i.e. the fraction of the min-hash values equal to those of the sketch column.
+        :param top_k: (default None) If set, only the top_k most similar columns are returned.
+        :return: A tuple (columns, similarities) sorted by decreasing similarity (ties by column index).
+        '''
+        columns = np.asarray(columns, dtype=np.int64)
+        sketch_column = np.asarray(sketch_column, dtype=np.uint64).reshape(-1, 1)
+        similarities = (self.matrix[:, columns] == sketch_column).sum(axis=0) / float(self.h_count)
+        order = np.lexsort((columns, -similarities))
+        if top_k is not None:
+            order = order[:top_k]
+        return columns[order], similarities[order]
+    
+    def get_similar_columns_ranked(self, sketch_column, top_k=None):
+        '''Returns the similar columns (see get_similar_columns) ranked by their estimated
+        Jaccard similarity to the sketch column (see rank_columns).
+        :return: A tuple (columns, similarities).
+        '''
+        return self.rank_columns(sketch_column, self.get_similar_columns(sketch_column), top_k)
+    
+    def get_similar_columns_many(self, sketch_columns):
+        '''Returns the similar columns (see get_similar_columns) of each query column of
+        a matrix of sketch columns. The query columns are looked up in the LSH index band
+        by band.
+        :return: A list with an array of column indices for each query column.
+        '''
+        sketch_columns = np.asarray(sketch_columns, dtype=np.uint64)
+        similar_columns = [set() for _ in range(np.shape(sketch_columns)[1])]
+        for l, buckets in enumerate(self.get_lsh_index()):
+            band = np.ascontiguousarray(sketch_columns[l * self.k : (l + 1) * self.k].T)
+            band_keys = band.view(np.dtype((np.void, band.dtype.itemsize * self.k))).ravel()
+            for q, key in enumerate(band_keys.tolist()):
+                bucket = buckets.get(key)
+                if bucket:
+                    similar_columns[q].update(bucket)
+        return [np.array(sorted(columns), dtype=np.int64) for columns in similar_columns]
+    
+    def query_many(self, fingerprint_lists, ranked=False, top_k=None):
+        '''Finds the similar columns of multiple queries given as lists of shingle fingerprints.
+        :param ranked: (default False) If True, the similar columns of each query are ranked
+        by their estimated Jaccard similarity (see rank_columns).
+        :param top_k: (default None) The number of most similar columns to keep if ranked is True.
+        :return: A list with an array of column indices for each query or, if ranked is True,
+        a list of tuples (columns, similarities).
+        '''
+        sketch_columns = self.compute_columns(fingerprint_lists)
+        similar_columns_list = self.get_similar_columns_many(sketch_columns)
+        if ranked:
+            return [self.rank_columns(sketch_columns[:, q], similar_columns, top_k) for q, similar_columns in enumerate(similar_columns_list)]
+        else:
+            return similar_columns_list
     
 #     def extend_sketch_matrix(self, feature_lists, new_cols_count, extension_id):
 #         new_matrix = np.full((self.h_count, len(self.cols) + new_cols_count), np.iinfo(np.uint64).max, np.uint64)
@@ -100,21 +327,30 @@ class SketchMatrix(Serializable):
     def __repr__(self):
         return str(self.matrix)
 
-    def __init__(self, k, L, ch_matrix=None, hash_functions=None, raw_sketch_matrix=None):
+    def __init__(self, k, L, ch_matrix=None, hash_functions=None, raw_sketch_matrix=None, n_jobs=1, build_lsh_index=True):
+        '''
+        :param build_lsh_index: (default True) If False, the LSH index is built on the first query
+        (see get_lsh_index), e.g. for sketch matrices which are only used through get_sub_sketch.
+        '''
         self.k = k
         self.L = L
         self.h_count = k * L
-        self.cols_count = ch_matrix.cols_count
         
         if ch_matrix is not None:
             assert isinstance(ch_matrix, CharacteristicMatrix)
             self.matrix = np.full((self.h_count, ch_matrix.cols_count), np.iinfo(np.uint64).max, np.uint64)
-            if type(hash_functions) is list:
+            if type(hash_functions) is list or isinstance(hash_functions, MinHashFunctionFamily):
                 assert len(hash_functions) == k * L
                 self.hash_functions = hash_functions
             else:
-                self.hash_functions = MinHashFunction.generate_functions(self.h_count)
+                self.hash_functions = MinHashFunctionFamily.generate(self.h_count)
             
-            self.build(ch_matrix)
+            self.cols_count = ch_matrix.cols_count
+            self.build(ch_matrix, n_jobs)
         else:
+            self.cols_count = np.shape(raw_sketch_matrix)[1]
             self.matrix = raw_sketch_matrix
+            # nothing was built
+            self.build_nnz_per_second = None
+        
+        self.lsh_index = SketchMatrix.build_lsh_index(self.matrix, k, L) if build_lsh_index else None
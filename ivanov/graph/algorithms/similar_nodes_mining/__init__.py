@@ -4,7 +4,10 @@ Created on Jan 26, 2016
 @author: Ivan Ivanov
 '''
 from ivanov.graph.algorithms import r_ball_hyper, similar_graphs_mining
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 import numpy as np
+import itertools
 
 def extract_rballs_of_node(node, hypergraph, r_in=0, r_out=0, r_all=0, center_default_color=False):
     rballs = [r_ball_hyper(hypergraph, node, r_in, edge_dir=-1, center_default_color=center_default_color) if r_in > 0 else None,
@@ -33,27 +36,33 @@ def extract_rballs_database(hypergraph, r_in=0, r_out=0, r_all=0, center_default
     
     return rballs_database_generator(), index_node_map
 
-# TODO: can be optimized, since now we compute all symmetries
+def get_candidate_pairs(sketch_matrix):
+    '''Finds all pairs of columns of the sketch matrix, which are equal in at least one band.
+    The pairs are generated from the buckets of the LSH index of the sketch matrix, so the
+    memory is proportional to the number of candidate pairs.
+    :return: An array of shape (pairs_count, 2) with the sorted unique pairs (i, j), i < j.
+    '''
+    nodes_count = np.shape(sketch_matrix.matrix)[1]
+    pair_codes = np.empty(0, dtype=np.int64)
+    for buckets in sketch_matrix.get_lsh_index():
+        band_pair_codes = [pair_codes]
+        for bucket in buckets.itervalues():
+            if len(bucket) > 1:
+                # the columns in a bucket are in increasing order
+                bucket = np.array(bucket, dtype=np.int64)
+                i, j = np.triu_indices(len(bucket), 1)
+                band_pair_codes.append(bucket[i] * nodes_count + bucket[j])
+        pair_codes = np.unique(np.concatenate(band_pair_codes))
+    
+    return np.column_stack((pair_codes // nodes_count, pair_codes % nodes_count))
+
 def get_node_similarity_matrix(sketch_matrix):
-    sketch = sketch_matrix.matrix
-    nodes_count = np.shape(sketch)[1]
-    k = sketch_matrix.k
-    L = sketch_matrix.L
+    nodes_count = np.shape(sketch_matrix.matrix)[1]
+    pairs = get_candidate_pairs(sketch_matrix)
     
     similarity_matrix = np.zeros((nodes_count, nodes_count))
-    
-    for n1 in range(nodes_count):
-        n1_sketch_col = sketch[:, n1 : n1 + 1]
-        equality_sketch_for_n1 = sketch == n1_sketch_col
-        bands_amplification = np.empty((L, nodes_count))
-        offset = 0
-        for l in range(L):
-            offset_new = offset + k
-            bands_amplification[l] = equality_sketch_for_n1[offset : offset_new].all(0)
-            offset = offset_new
-        similarity_matrix[n1] = bands_amplification.any(0)
-    
-    np.fill_diagonal(similarity_matrix, 0.)
+    similarity_matrix[pairs[:, 0], pairs[:, 1]] = 1.
+    similarity_matrix[pairs[:, 1], pairs[:, 0]] = 1.
     
     return similarity_matrix
 
@@ -61,6 +70,13 @@ def get_similar_nodes(node, hypergraph, sketch_matrix, wl_iterations, wl_labels_
     rballs = extract_rballs_of_node(node, hypergraph, r_in, r_out, r_all)
     return similar_graphs_mining.get_similar_graphs(rballs, sketch_matrix, wl_iterations, wl_labels_list)
 
+def get_similar_nodes_many(nodes, hypergraph, sketch_matrix, wl_iterations, wl_labels_list, r_in=0, r_out=0, r_all=0):
+    '''Same as get_similar_nodes for each of the nodes, but all queries are resolved together
+    (see similar_graphs_mining.get_similar_graphs_many).
+    '''
+    rballs_list = [extract_rballs_of_node(node, hypergraph, r_in, r_out, r_all) for node in nodes]
+    return similar_graphs_mining.get_similar_graphs_many(rballs_list, sketch_matrix, wl_iterations, wl_labels_list)
+
 # TODO: very naive way of extracting all similar nodes
 def get_all_similar_nodes(similarity_matrix, cols_nodes_map):
     similar_nodes = []
@@ -74,3 +90,49 @@ def get_all_similar_nodes(similarity_matrix, cols_nodes_map):
             similar_nodes.append(similar)
     
     return similar_nodes
+
+def get_all_similar_nodes_lsh(sketch_matrix, cols_nodes_map):
+    '''Returns the same as get_all_similar_nodes(get_node_similarity_matrix(sketch_matrix), cols_nodes_map)
+    without building the dense similarity matrix (see get_candidate_pairs).
+    '''
+    pairs = get_candidate_pairs(sketch_matrix)
+    rows = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    cols = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    order = np.lexsort((cols, rows))
+    rows = rows[order].tolist()
+    cols = cols[order].tolist()
+    
+    similar_nodes = []
+    for row_index, row_cols in itertools.groupby(zip(rows, cols), lambda pair: pair[0]):
+        indices = [row_index] + [col for _, col in row_cols]
+        similar_nodes.append(map(lambda index: cols_nodes_map[index], indices))
+    
+    return similar_nodes
+
+def get_similar_node_groups(sketch_matrix, cols_nodes_map):
+    '''Groups the nodes into the connected components of the similarity relation of the
+    sketch matrix. The columns of each bucket of the LSH index are chained, so the memory
+    is proportional to the number of columns times the number of bands.
+    :return: A list of the groups with at least two nodes, ordered by their first column.
+    '''
+    nodes_count = np.shape(sketch_matrix.matrix)[1]
+    edges_from = []
+    edges_to = []
+    for buckets in sketch_matrix.get_lsh_index():
+        for bucket in buckets.itervalues():
+            if len(bucket) > 1:
+                edges_from.extend(bucket[:-1])
+                edges_to.extend(bucket[1:])
+    
+    graph = coo_matrix((np.ones(len(edges_from), dtype=np.int8), (edges_from, edges_to)), shape=(nodes_count, nodes_count))
+    _, components = connected_components(graph, directed=False)
+    order = np.argsort(components, kind="mergesort")
+    
+    groups = []
+    for _, group in itertools.groupby(order.tolist(), lambda index: components[index]):
+        group = list(group)
+        if len(group) > 1:
+            groups.append(group)
+    groups.sort(key=lambda group: group[0])
+    
+    return [map(lambda index: cols_nodes_map[index], group) for group in groups]
@@ -5,9 +5,43 @@ Created on Oct 5, 2015
 '''
 
 import networkx as nx
+import numpy as np
+import itertools
+import hashlib
 from ivanov.graph import nxext
 from ivanov.graph.hypergraph import Hypergraph
 
+def new_state(hashed_labels=False):
+    '''Creates an empty wl_state.
+    :param hashed_labels: (default False) If True, the short label of a full label is
+    derived from a hash of the full label instead of a counter (see get_short_label).
+    Such labels do not depend on the order in which the graphs are processed, so
+    states built independently (e.g. in different processes) agree on all labels.
+    '''
+    wl_state = {
+        "labels": {},
+        "next_labels": {0: 0}
+    }
+    if hashed_labels:
+        wl_state["hashed_labels"] = True
+    return wl_state
+
+def get_short_label(wl_state, iteration, full_label):
+    '''Get the short unique label "wl_<iteration>.<number>" of a full label and
+    register it in the wl_state if it is new. For a wl_state with hashed labels
+    (see new_state) the number is the hexadecimal 64-bit prefix of the SHA-1 of
+    the full label.
+    '''
+    if full_label not in wl_state["labels"]:
+        if wl_state.get("hashed_labels"):
+            full_label_bytes = full_label.encode("utf8") if type(full_label) is unicode else str(full_label)
+            label_number = hashlib.sha1(full_label_bytes).hexdigest()[:16]
+        else:
+            label_number = wl_state["next_labels"][iteration]
+        wl_state["labels"][full_label] = "wl_{0}.{1}".format(iteration, label_number)
+        wl_state["next_labels"][iteration] += 1
+    return wl_state["labels"][full_label]
+
 def iterate(graph, wl_state, iteration, test_mode=False):
     '''Performs one iteration of the Weisfeiler-Lehman algorithm.
     :param graph: A Networkx graph or a Hypergraph
@@ -26,7 +60,7 @@ def iterate(graph, wl_state, iteration, test_mode=False):
             '''Get the direction of the edge between nodes u and v
             '''
             res = 0
-            if type(graph) is not Hypergraph:
+            if not isinstance(graph, Hypergraph):
                 if graph.has_edge(u, v) and graph.has_edge(v, u):
                     res = 0
                 elif graph.has_edge(u, v):
@@ -88,15 +122,12 @@ def iterate(graph, wl_state, iteration, test_mode=False):
         nodes = graph.node
     
     for node in nodes:
-        if type(graph) is not Hypergraph:
+        if not isinstance(graph, Hypergraph):
             neighbors = nxext.get_all_neighbors(graph, node)
         else:
-            neighbors = graph.bipartite_graph.neighbors(node)
+            neighbors = graph.bipartite_neighbors(node)
         new_node_label = get_new_label(node, neighbors)
-        if new_node_label not in wl_state["labels"]:
-                wl_state["labels"][new_node_label] = "wl_{0}.{1}".format(iteration, wl_state["next_labels"][iteration])
-                wl_state["next_labels"][iteration] += 1
-        new_graph.node[node]["labels"] = [wl_state["labels"][new_node_label]]
+        new_graph.node[node]["labels"] = [get_short_label(wl_state, iteration, new_node_label)]
     
     return new_graph, wl_state
     
@@ -125,10 +156,7 @@ def init(graph, wl_state=None, test_mode=False):
     init_labels(new_graph)
     
     if wl_state is None:
-        wl_state = {
-            "labels": {},
-            "next_labels": {0: 0}
-        }
+        wl_state = new_state()
     
     if test_mode:
         nodes = sorted(graph.node, key=lambda n: graph.node[n]["labels"][0])
@@ -137,46 +165,240 @@ def init(graph, wl_state=None, test_mode=False):
     
     for node in nodes:
         node_label = new_graph.node[node]["labels"][0]
-        if node_label not in wl_state["labels"]:
-            wl_state["labels"][node_label] = "wl_0.{0}".format(wl_state["next_labels"][0])
-            wl_state["next_labels"][0] += 1
-        new_graph.node[node]["labels"] = [wl_state["labels"][node_label]]
+        new_graph.node[node]["labels"] = [get_short_label(wl_state, 0, node_label)]
     
     return new_graph, wl_state
     
-def is_stable(graph, new_graph, iteration=0):
-    is_stable = True
+def iterate_all(graph, wl_iterations, wl_state=None, test_mode=False, stop_when_stable=False):
+    '''Performs the initialization and wl_iterations iterations of the Weisfeiler-Lehman
+    algorithm in one pass. The labels are coded as integers and the multi-sets of
+    neighbor labels as sorted integer tuples over the CSR adjacency of the bipartite
+    incidence graph, so the full string labels are built once per distinct label
+    instead of once per node and the graph is not copied between the iterations.
+    The labels and the wl_state are the same as from init followed by iterate
+    for the iterations 1, ..., wl_iterations.
+    :param graph: A Hypergraph.
+    :param wl_iterations: The number of iterations to perform.
+    :param wl_state: Optional. A dictionary containing 2 sub-dictionaries:
+    "labels" contains a mapping from the full original graph labels or
+    labels generated during the Weisfeiler & Lehman iterations to their
+    corresponding WL short unique labels; "next_labels" contains the next label
+    number for each WL iteration.
+    :param stop_when_stable: (default False) If True, stops after the first
+    iteration which does not refine the labels (see is_stable), so at most
+    wl_iterations iterations are performed.
+    :return A tuple of the form (vertex_ids, labels, wl_state), where labels[i]
+    is the list of WL labels of the vertices in vertex_ids after iteration i
+    (labels[0] are the labels after the initialization).
+    '''
+    vertex_ids_list, labels_list, wl_state = iterate_all_batch([graph], wl_iterations, wl_state, test_mode, stop_when_stable)
+    return vertex_ids_list[0], labels_list[0], wl_state
+
+def iterate_all_batch(graphs, wl_iterations, wl_state=None, test_mode=False, stop_when_stable=False):
+    '''Performs the Weisfeiler-Lehman algorithm as iterate_all on a whole list of graphs
+    at once. The graphs are packed in one disjoint union adjacency, so each iteration
+    is a single refinement over all graphs. The labels and the wl_state are the same
+    as from calling iterate_all on the graphs one after the other.
+    :param graphs: A list of Hypergraphs.
+    :param wl_iterations: The number of iterations to perform.
+    :param wl_state: Optional. The state shared by all graphs (see iterate_all).
+    :param stop_when_stable: (default False) If True, the iterations on each graph
+    stop after its first iteration which does not refine its labels.
+    :return A tuple of the form (vertex_ids_list, labels_list, wl_state), where
+    vertex_ids_list[g] and labels_list[g] are for graphs[g] as returned by iterate_all.
+    '''
+    for graph in graphs:
+        assert isinstance(graph, Hypergraph)
+    
+    if wl_state is None:
+        wl_state = new_state()
+    
+    graphs_count = len(graphs)
+    adjacencies = [graph.bipartite_csr() for graph in graphs]
+    vertex_ids_list = [vertex_ids for vertex_ids, _, _ in adjacencies]
+    indptr_list = [np.zeros(1, dtype=np.int64)]
+    indices_list = []
+    offsets = [0]
+    for vertex_ids, indptr, indices in adjacencies:
+        indptr_list.append(indptr[1:].astype(np.int64) + indptr_list[-1][-1])
+        indices_list.append(indices.astype(np.int64) + offsets[-1])
+        offsets.append(offsets[-1] + len(vertex_ids))
+    indptr = np.concatenate(indptr_list)
+    indices = np.concatenate(indices_list) if graphs else np.zeros(0, dtype=np.int64)
+    vertex_count = offsets[-1]
     
-    if type(graph) is not Hypergraph:
+    def init_colors():
+        colors = np.empty(vertex_count, dtype=np.int32)
+        names = []
+        name_colors = {}
+        for graph, vertex_ids, offset in zip(graphs, vertex_ids_list, offsets):
+            raw_labels = []
+            for vertex_id in vertex_ids:
+                labels = graph.node[vertex_id].get("labels")
+                if not labels:
+                    raw_labels.append("0")
+                elif len(labels) == 1:
+                    raw_labels.append(labels[0])
+                else:
+                    raw_labels.append(",".join(sorted(labels)))
+            
+            if test_mode:
+                order = sorted(range(len(vertex_ids)), key=lambda v: graph.node[vertex_ids[v]]["labels"][0])
+            else:
+                order = range(len(vertex_ids))
+            
+            for v in order:
+                name = get_short_label(wl_state, 0, raw_labels[v])
+                if name not in name_colors:
+                    name_colors[name] = len(names)
+                    names.append(name)
+                colors[offset + v] = name_colors[name]
+        return colors, names
+    
+    def get_full_label(signature, names, colors_count):
+        label_extensions = [[], [], []]
+        for key in signature[1:]:
+            label_extensions[key // colors_count].append(names[key % colors_count])
+        
+        label_extension = []
+        for direction, neighbor_labels in zip(["any", "in", "out"], label_extensions):
+            if neighbor_labels:
+                neighbor_labels.sort()
+                label_extension.append("{0}({1})".format(direction, ",".join(neighbor_labels)))
+        label_extension = ",".join(label_extension)
+        
+        return "{0};{1}".format(names[signature[0]], label_extension)
+    
+    colors, names = init_colors()
+    all_colors = [colors]
+    all_names = [names]
+    # the number of iterations performed on each graph
+    iterations = [0] * graphs_count
+    active = range(graphs_count)
+    
+    if wl_iterations > 0 and graphs:
+        directions = np.concatenate([_get_directions(graph, *adjacency) for graph, adjacency in zip(graphs, adjacencies)])
+        rows = np.repeat(np.arange(vertex_count), np.diff(indptr))
+        bounds = indptr.tolist()
+        # the nodes of each graph are visited in the order of the graph copy made by each iteration
+        vertex_orders = list(vertex_ids_list)
+        positions = [{vertex_id: offset + v for v, vertex_id in enumerate(vertex_ids)} for vertex_ids, offset in zip(vertex_ids_list, offsets)]
+    
+    for i in range(1, wl_iterations + 1):
+        if not active:
+            break
+        
+        if i not in wl_state["next_labels"]:
+            wl_state["next_labels"][i] = 0
+        
+        colors_count = len(names)
+        keys = directions * colors_count + colors[indices]
+        sorted_keys = keys[np.lexsort((keys, rows))].tolist()
+        colors_list = colors.tolist()
+        
+        new_colors = np.zeros(vertex_count, dtype=np.int32)
+        new_names = []
+        signature_colors = {}
+        still_active = []
+        for g in active:
+            start, end = offsets[g], offsets[g + 1]
+            signatures = {v: (colors_list[v],) + tuple(sorted_keys[bounds[v] : bounds[v + 1]]) for v in xrange(start, end)}
+            
+            vertex_orders[g] = list(dict.fromkeys(vertex_orders[g]))
+            order = [positions[g][vertex_id] for vertex_id in vertex_orders[g]]
+            if test_mode:
+                order.sort(key=lambda v: names[colors_list[v]])
+            
+            for v in order:
+                signature = signatures[v]
+                if signature not in signature_colors:
+                    full_label = get_full_label(signature, names, colors_count)
+                    signature_colors[signature] = len(new_names)
+                    new_names.append(get_short_label(wl_state, i, full_label))
+                new_colors[v] = signature_colors[signature]
+            
+            iterations[g] = i
+            classes_count = len(set(colors_list[start:end]))
+            new_classes_count = len(set(new_colors[start:end].tolist()))
+            stable = _is_stable_partition(classes_count, new_classes_count, end - start) or i > end - start
+            if not (stop_when_stable and stable):
+                still_active.append(g)
+        
+        active = still_active
+        colors, names = new_colors, new_names
+        all_colors.append(colors)
+        all_names.append(names)
+    
+    labels_list = []
+    for g in range(graphs_count):
+        start, end = offsets[g], offsets[g + 1]
+        labels_list.append([[names[color] for color in colors[start:end].tolist()] for colors, names in zip(all_colors[:iterations[g] + 1], all_names)])
+    
+    return vertex_ids_list, labels_list, wl_state
+
+def relabel(graph, vertex_ids, labels):
+    '''Get a copy of the graph with the labels computed by iterate_all.
+    :param graph: A Hypergraph.
+    :param vertex_ids: The vertex ids as returned by iterate_all.
+    :param labels: The labels of one iteration as returned by iterate_all.
+    :return A copy of the graph where vertex_ids[i] has the label labels[i].
+    '''
+    new_graph = graph.copy()
+    for vertex_id, label in itertools.izip(vertex_ids, labels):
+        new_graph.node[vertex_id]["labels"] = [label]
+    return new_graph
+
+def _get_directions(graph, vertex_ids, indptr, indices):
+    '''Get the direction of each entry of the CSR adjacency of a hypergraph as seen
+    from the vertex of its row: 0 for "any", 1 for "in" and 2 for "out".
+    '''
+    directions = np.zeros(len(indices), dtype=np.int64)
+    indices_list = indices.tolist()
+    for v, vertex_id in enumerate(vertex_ids):
+        for j in xrange(indptr[v], indptr[v + 1]):
+            neighbor = vertex_ids[indices_list[j]]
+            if vertex_id.startswith(u"he_") or neighbor.startswith(u"he_"):
+                raise Exception("Weisfeiler-Lehman is not implemented for hypergraphs with edges of order > 2.")
+            if vertex_id.startswith(u"e_"):
+                n, e, k = neighbor, vertex_id, -1
+            else:
+                n, e, k = vertex_id, neighbor, 1
+            dir_perms = graph.node[e]["direction"]
+            if len(dir_perms) != 1:
+                continue
+            dir_perm_0 = next(iter(dir_perms))
+            if dir_perm_0.index(n) == 0:
+                res = k
+            elif dir_perm_0.index(n) == 1:
+                res = -k
+            else:
+                raise Exception("Strange direction encoding of an edge. Are {0} and {1} connected?".format(vertex_id, neighbor))
+            directions[j] = 2 if res > 0 else 1
+    return directions
+
+def is_stable(graph, new_graph, iteration=0):
+    '''Check whether an iteration of the Weisfeiler-Lehman algorithm stabilized the labels.
+    Since each iteration can only refine the partition of the nodes by their labels,
+    it suffices to compare the numbers of distinct labels (color classes) before and
+    after the iteration, which takes linear time.
+    :param graph: A Networkx graph or a Hypergraph before the iteration.
+    :param new_graph: The graph resulting from the iteration.
+    :param iteration: The number of the iteration.
+    :return True if the partition was not refined or cannot be refined any further.
+    '''
+    if not isinstance(graph, Hypergraph):
         nodes_count = graph.number_of_nodes()
     else:
-        nodes_count = graph.bipartite_graph.number_of_nodes()
+        nodes_count = graph.bipartite_number_of_nodes()
     
     if iteration > nodes_count:
         return True
     
-    repeating_new_labels = False
-    
-    for node_1 in graph.node:
-        node_1_label = graph.node[node_1]["labels"][0]
-        node_1_new_label = new_graph.node[node_1]["labels"][0]
-        for node_2 in graph.node:
-            if node_1 != node_2:
-                node_2_label = graph.node[node_2]["labels"][0]
-                node_2_new_label = new_graph.node[node_2]["labels"][0]
-                old_labels_cond = node_1_label == node_2_label
-                new_labels_cond = node_1_new_label == node_2_new_label
-                if old_labels_cond or new_labels_cond:
-                    if old_labels_cond and new_labels_cond:
-                        repeating_new_labels = True
-                        continue
-                    else:
-                        is_stable = False
-                        if repeating_new_labels:
-                            break
-    
-    if not is_stable and not repeating_new_labels:
-        # There is nothing to refine, since each new label appears only once in the graph
-        is_stable = True
-    
-    return is_stable
+    classes_count = len(set(graph.node[node]["labels"][0] for node in graph.node))
+    new_classes_count = len(set(new_graph.node[node]["labels"][0] for node in graph.node))
+    
+    return _is_stable_partition(classes_count, new_classes_count, nodes_count)
+
+def _is_stable_partition(classes_count, new_classes_count, nodes_count):
+    # a partition into single nodes cannot be refined any further
+    return new_classes_count == classes_count or new_classes_count == nodes_count
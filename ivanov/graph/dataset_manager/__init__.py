@@ -185,7 +185,7 @@ def process_record(record, wl_iterations, state, binary_target_labels=True, shin
     wl_state = state["wl_state"]
     shingle_id_map = state["shingle_id_map"]
     
-    def process_shingles(shingles, record_data_vector, wl_it):
+    def process_shingles(shingles, record_data_vector, wl_it, fingerprinted=False):
         next_shingle_id_key = "next_shingle_id" if accumulate_wl_shingles else "wl_{0}_next_shingle_id".format(wl_it)
         if not fingerprints:
             for shingle in shingles:
@@ -194,7 +194,7 @@ def process_record(record, wl_iterations, state, binary_target_labels=True, shin
                     wl_state[next_shingle_id_key] += 1
                 record_data_vector.add((shingle_id_map[shingle], 1))
         else:
-            shingle_ids = set(fingerprint.get_fingerprints(shingles, size=24))
+            shingle_ids = shingles if fingerprinted else set(fingerprint.rabin_fingerprints(list(shingles), size=24))
             record_data_vector |= set(map(lambda shingle_id: (shingle_id, 1), shingle_ids))
     
     if sh_type < 2:
@@ -226,11 +226,17 @@ def process_record(record, wl_iterations, state, binary_target_labels=True, shin
             # TODO: should we exclude records with tree-width > 3?
             if accumulate_wl_shingles:
                 record_data_vector = set()
-            w_shingles_ext_iter = shingle_extraction.extract_w_shingles_for_each_wl_iter(record_graph, wl_iterations, wl_state["wl_state"], window_size=window_size)
+            if fingerprints:
+                # fingerprint the w-shingles directly while sliding over the canonical representations
+                w_shingles_function = lambda text, w: fingerprint.get_w_shingle_fingerprints(text, w, size=24)
+            else:
+                w_shingles_function = shingle_extraction.get_w_shingles
+            w_shingles_ext_iter = shingle_extraction.extract_w_shingles_for_each_wl_iter(record_graph, wl_iterations, wl_state["wl_state"], window_size=window_size,
+                                                                                         w_shingles_function=w_shingles_function)
             for wl_it, new_w_shingles, wl_state["wl_state"] in w_shingles_ext_iter:
                 if not accumulate_wl_shingles:
                     record_data_vector = set()
-                process_shingles(new_w_shingles, record_data_vector, wl_it)
+                process_shingles(new_w_shingles, record_data_vector, wl_it, fingerprinted=fingerprints)
                 record_data_wl_vectors[wl_it] |= record_data_vector
         
         elif sh_type == 0:
@@ -11,6 +11,7 @@ from ivanov.inout.serializable import Serializable
 from ivanov.graph import nxext
 from timeit import itertools
 import networkx as nx
+import numpy as np
 import copy
 
 class Hypergraph(Serializable):
@@ -54,7 +55,9 @@ class Hypergraph(Serializable):
     
     def add_node(self, node, attr_dict):
         node_id = Hypergraph.format_node_id(node)
-        self.bipartite_graph.add_node(node_id, attr_dict=attr_dict, bipartite=0)
+        attr_dict["bipartite"] = 0
+        self._add_vertex(node_id, attr_dict)
+        self.neighbors_multiplicities.setdefault(node_id, {})
         if len(attr_dict["labels"]) > 1:
             self.nodes_with_more_labels.add(node_id)
         self.nodes_count += 1
@@ -84,11 +87,19 @@ class Hypergraph(Serializable):
         if not direction:
             direction = set(permutations(nodes_set))
         
-        self.bipartite_graph.add_node(edge_id, direction=direction, labels=[label], bipartite=1)
+        self._add_vertex(edge_id, {"direction": direction, "labels": [label], "bipartite": 1})
         self.edges_count += 1
         
         for node in nodes:
-            self.bipartite_graph.add_edge(edge_id, node)
+            self._link(edge_id, node)
+        
+        # update the neighbors counts
+        if len(nodes_set) > 1:
+            for u in nodes_set:
+                u_multiplicities = self.neighbors_multiplicities.setdefault(u, {})
+                for v in nodes_set:
+                    if v != u:
+                        u_multiplicities[v] = u_multiplicities.get(v, 0) + 1
         
         # update self loops
         if len(nodes_set) == 1:
@@ -99,9 +110,10 @@ class Hypergraph(Serializable):
     def remove_node(self, node):
         assert node.startswith(u"n_")
         
-        connected_edges = self.bipartite_graph.neighbors(node)
+        connected_edges = self.bipartite_neighbors(node)
         self.remove_edges_from(connected_edges, unsafe=True)
-        self.bipartite_graph.remove_node(node)
+        self._remove_vertex(node)
+        del self.neighbors_multiplicities[node]
         self.nodes_count -= 1
     
     def safe_remove_node(self, node):
@@ -124,7 +136,19 @@ class Hypergraph(Serializable):
         else:
             self.try_remove_from_parallel_hedges_groups(edge_id)
         
-        self.bipartite_graph.remove_node(edge_id)
+        # update the neighbors counts
+        endpoints = self.endpoints(edge_id)
+        if len(endpoints) > 1:
+            for u in endpoints:
+                u_multiplicities = self.neighbors_multiplicities[u]
+                for v in endpoints:
+                    if v != u:
+                        if u_multiplicities[v] == 1:
+                            del u_multiplicities[v]
+                        else:
+                            u_multiplicities[v] -= 1
+        
+        self._remove_vertex(edge_id)
         self.edges_count -= 1
         
         # update self loops
@@ -159,7 +183,7 @@ class Hypergraph(Serializable):
     
     def edge(self, edge_id):
         assert edge_id.startswith(u"e_") or edge_id.startswith(u"he_")
-        return self.bipartite_graph.node[edge_id]
+        return self.node[edge_id]
     
     def edges(self, u=None, v=None):
         return list(self.edges_iter(u, v))
@@ -258,6 +282,11 @@ class Hypergraph(Serializable):
         assert node.startswith(u"n_")
         return self.bipartite_graph.degree(node)
     
+    def number_of_neighbors(self, node):
+        '''Returns the number of distinct neighbors of a node in O(1).
+        '''
+        return len(self.neighbors_multiplicities[node])
+    
     def neighbors(self, node):
         assert node.startswith(u"n_")
         
@@ -332,7 +361,7 @@ class Hypergraph(Serializable):
     def add_node_label(self, node_id, label):
         assert node_id.startswith(u"n_")
         
-        labels = self.bipartite_graph.node[node_id]["labels"]
+        labels = self.node[node_id]["labels"]
         labels.append(label)
         if len(labels) > 1:
             self.nodes_with_more_labels.add(node_id)
@@ -341,7 +370,7 @@ class Hypergraph(Serializable):
         assert node_id.startswith(u"n_")
         assert type(labels) is list
         
-        self.bipartite_graph.node[node_id]["labels"] = labels
+        self.node[node_id]["labels"] = labels
         if len(labels) > 1:
             self.nodes_with_more_labels.add(node_id)
         else:
@@ -448,11 +477,21 @@ class Hypergraph(Serializable):
     def reset_self_loops(self):
         self.self_loops = set()
     
+    def init_neighbors_multiplicities(self):
+        self.neighbors_multiplicities = {node: {} for node in self.nodes_iter()}
+        for edge_id in self.edges_iter():
+            endpoints = self.endpoints(edge_id)
+            for u in endpoints:
+                u_multiplicities = self.neighbors_multiplicities[u]
+                for v in endpoints:
+                    if v != u:
+                        u_multiplicities[v] = u_multiplicities.get(v, 0) + 1
+    
     def init_nodes_with_n_neighbors(self):
         self.reset_nodes_with_n_neighbors()
         
         for node in self.nodes_iter():
-            neighbors_count = len(self.neighbors(node))
+            neighbors_count = len(self.neighbors_multiplicities[node])
             if neighbors_count == 1:
                 self.nodes_with_1_neighbor.add(node)
             elif neighbors_count == 2:
@@ -467,8 +506,8 @@ class Hypergraph(Serializable):
         new_nodes_with_2_neighbors = set()
         new_nodes_with_3_neighbors = set()
         for node in candidate_nodes:
-            if self.bipartite_graph.has_node(node):
-                neighbors_count = len(self.neighbors(node))
+            if node in self.neighbors_multiplicities:
+                neighbors_count = len(self.neighbors_multiplicities[node])
                 if neighbors_count == 1:
                     new_nodes_with_1_neighbor.add(node)
                 elif neighbors_count == 2:
@@ -497,6 +536,63 @@ class Hypergraph(Serializable):
         self.nodes_with_2_neighbors = set()
         self.nodes_with_3_neighbors = set()
     
+    def bipartite_neighbors(self, vertex_id):
+        '''Get the neighbors of a vertex in the bipartite incidence graph, i.e.
+        the edges incident to a node or the endpoints of an edge.
+        '''
+        return self.bipartite_graph.neighbors(vertex_id)
+    
+    def bipartite_number_of_nodes(self):
+        return self.bipartite_graph.number_of_nodes()
+    
+    def bipartite_csr(self):
+        '''Get the bipartite incidence graph in compressed sparse row form.
+        :return A tuple (vertex_ids, indptr, indices), where vertex_ids lists
+        the node and edge ids in the order of self.node and the neighbors of
+        vertex_ids[i] are vertex_ids[j] for j in indices[indptr[i] : indptr[i + 1]].
+        '''
+        vertex_ids = list(self.node)
+        position = {vertex_id: i for i, vertex_id in enumerate(vertex_ids)}
+        indptr = np.zeros(len(vertex_ids) + 1, dtype=np.int32)
+        indices = []
+        for i, vertex_id in enumerate(vertex_ids):
+            indices += [position[neighbor] for neighbor in self.bipartite_neighbors(vertex_id)]
+            indptr[i + 1] = len(indices)
+        return vertex_ids, indptr, np.array(indices, dtype=np.int32)
+    
+    # storage primitives of the bipartite incidence graph
+    
+    def _init_storage(self):
+        self.bipartite_graph = nx.Graph()
+        self.node = self.bipartite_graph.node
+    
+    def _add_vertex(self, vertex_id, attr_dict):
+        self.bipartite_graph.add_node(vertex_id, attr_dict=attr_dict)
+    
+    def _remove_vertex(self, vertex_id):
+        self.bipartite_graph.remove_node(vertex_id)
+    
+    def _link(self, edge_id, node):
+        self.bipartite_graph.add_edge(edge_id, node)
+    
+    def _has_vertex(self, vertex_id):
+        return self.bipartite_graph.has_node(vertex_id)
+    
+    def _copy_storage(self, other):
+        # the dictionaries are filled in iteration order (as copy.deepcopy does)
+        # to preserve the order in which nodes and neighbors are visited
+        self.bipartite_graph = nx.Graph()
+        self.bipartite_graph.node = {vertex_id: Hypergraph._copy_attr_dict(attr_dict) for vertex_id, attr_dict in other.node.iteritems()}
+        self.bipartite_graph.adj = {vertex_id: {neighbor: data for neighbor, data in neighbors.iteritems()} for vertex_id, neighbors in other.bipartite_graph.adj.iteritems()}
+        self.bipartite_graph.edge = self.bipartite_graph.adj
+        self.node = self.bipartite_graph.node
+    
+    @staticmethod
+    def _copy_attr_dict(attr_dict):
+        new_attr_dict = {key: value for key, value in attr_dict.iteritems()}
+        new_attr_dict["labels"] = list(attr_dict["labels"])
+        return new_attr_dict
+    
     def to_nx_graph(self):
         return self.subgraph_with_labels(set(self.nodes_iter()))
     
@@ -504,7 +600,32 @@ class Hypergraph(Serializable):
         nxext.visualize_graph(self.bipartite_graph, bipartite=True, edge_labels=False)
     
     def copy(self):
-        return copy.deepcopy(self)
+        '''Structural copy of the hypergraph, which is much cheaper than copy.deepcopy.
+        The incidence structure, the attribute dictionaries, the label lists and the
+        ready sets are duplicated, while the label strings and the direction sets
+        (which are never modified in place) are shared with the original.
+        '''
+        def copy_set(s):
+            # set(list(s)) keeps the iteration order of a deep copy
+            return set(list(s))
+        
+        def copy_groups(groups):
+            return {key: copy_set(group) if type(group) is set else list(group) for key, group in groups.iteritems()}
+        
+        new_hypergraph = object.__new__(self.__class__)
+        new_hypergraph.__dict__.update(self.__dict__)
+        new_hypergraph._copy_storage(self)
+        
+        new_hypergraph.nodes_with_more_labels = copy_set(self.nodes_with_more_labels)
+        new_hypergraph.self_loops = copy_set(self.self_loops)
+        new_hypergraph.parallel_edges_groups = copy_groups(self.parallel_edges_groups)
+        new_hypergraph.parallel_hedges_groups = copy_groups(self.parallel_hedges_groups)
+        new_hypergraph.nodes_with_1_neighbor = copy_set(self.nodes_with_1_neighbor)
+        new_hypergraph.nodes_with_2_neighbors = copy_set(self.nodes_with_2_neighbors)
+        new_hypergraph.nodes_with_3_neighbors = copy_set(self.nodes_with_3_neighbors)
+        new_hypergraph.neighbors_multiplicities = {node: dict(multiplicities) for node, multiplicities in self.neighbors_multiplicities.iteritems()}
+        
+        return new_hypergraph
     
     # NOTE: does not check isomorphism
     def __eq__(self, other):
@@ -521,9 +642,26 @@ class Hypergraph(Serializable):
     def __ne__(self, other):
         return not self.__eq__(other)
 
-    def __init__(self, nx_graph = nx.Graph()):
-        self.bipartite_graph = nx.Graph()
-        self.node = self.bipartite_graph.node
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "neighbors_multiplicities" not in state:
+            # hypergraphs pickled before the neighbors counts were maintained
+            self.init_neighbors_multiplicities()
+
+    def __new__(cls, nx_graph=None, compact=False, interned_labels=None):
+        if compact and cls is Hypergraph:
+            cls = CompactHypergraph
+        return super(Hypergraph, cls).__new__(cls)
+
+    def __init__(self, nx_graph = nx.Graph(), compact=False, interned_labels=None):
+        '''Build a hypergraph from a Networkx graph.
+        :param nx_graph: A Networkx graph (directed or undirected, may be a multigraph).
+        :param compact: (default False) If True, a CompactHypergraph is constructed
+        instead, which stores the bipartite incidence graph in integer arrays
+        rather than in a Networkx graph.
+        :param interned_labels: (default None) Used only with compact=True, see CompactHypergraph.__init__.
+        '''
+        self._init_storage()
         self.next_edge_index = 0
         self.next_hedge_index = 0
         
@@ -531,6 +669,10 @@ class Hypergraph(Serializable):
         self.edges_count = 0
         self.hedges_count = 0
         
+        # the number of edges shared by each pair of adjacent nodes {node: {neighbor: multiplicity}},
+        # so the number of distinct neighbors of a node is maintained in O(1) by add_edge and remove_edge
+        self.neighbors_multiplicities = {}
+        
         # ready sets
         self.reset_nodes_with_more_labels()
         self.reset_self_loops()
@@ -571,3 +713,203 @@ class Hypergraph(Serializable):
         # Initialize ready sets
         self.init_parallel_edges_groups()
         self.init_nodes_with_n_neighbors()
+
+
+class CompactHypergraph(Hypergraph):
+    '''A Hypergraph which stores the bipartite incidence graph with dense integer
+    ids instead of a Networkx graph. The public API (including the u"n_*", u"e_*"
+    and u"he_*" ids) is the same as for Hypergraph, so Arnborg & Proskurowski and
+    Weisfeiler & Lehman can run on it unchanged. Internally every node or edge is
+    a dense integer and the incidences are lists of integers, which can be
+    exported as CSR arrays with bipartite_csr. Lists are used instead of numpy
+    arrays since the reductions update the incidences one element at a time,
+    which is slower on numpy arrays. The slots of removed nodes and edges are
+    compacted by the next scan over all nodes or edges once they outnumber the
+    live ones. The labels of the input graph are interned in a table owned by
+    the caller (see __init__).
+    '''
+    
+    def has_node(self, node):
+        return node in self._index and not self._is_edge[self._index[node]]
+    
+    def nodes_iter(self):
+        self._compact()
+        ids = self._ids
+        is_edge = self._is_edge
+        return (ids[i] for i in xrange(len(ids)) if ids[i] is not None and not is_edge[i])
+    
+    def edges_iter(self, u=None, v=None):
+        ids = self._ids
+        incidence = self._incidence
+        if u:
+            u_edges = incidence[self._index[u]]
+            if not v:
+                return iter([ids[e] for e in u_edges])
+            v_index = self._index[v]
+            return iter([ids[e] for e in u_edges if v_index in incidence[e]])
+        else:
+            self._compact()
+            ids = self._ids
+            is_edge = self._is_edge
+            return (ids[i] for i in xrange(len(ids)) if ids[i] is not None and is_edge[i])
+    
+    def hedges(self, u=None, v=None, w=None):
+        if u:
+            ids = self._ids
+            incidence = self._incidence
+            u_hedges = [e for e in incidence[self._index[u]] if len(incidence[e]) > 2]
+            if v:
+                v_index = self._index[v]
+                u_hedges = [e for e in u_hedges if v_index in incidence[e]]
+                if w:
+                    w_index = self._index[w]
+                    u_hedges = [e for e in u_hedges if w_index in incidence[e]]
+            return [ids[e] for e in u_hedges]
+        else:
+            return list(self.hedges_iter())
+    
+    def degree(self, node):
+        return len(self._incidence[self._index[node]])
+    
+    def neighbors(self, node):
+        i = self._index[node]
+        ids = self._ids
+        incidence = self._incidence
+        neighbors = set()
+        for e in incidence[i]:
+            neighbors.update(incidence[e])
+        neighbors.discard(i)
+        return list(set([ids[j] for j in neighbors]))
+    
+    def endpoints(self, edge_id):
+        ids = self._ids
+        return [ids[j] for j in self._incidence[self._index[edge_id]]]
+    
+    def get_adj_nodes(self, nodes):
+        assert type(nodes) is set
+        
+        ids = self._ids
+        incidence = self._incidence
+        node_indices = set([self._index[node] for node in nodes])
+        all_edges = set()
+        for i in node_indices:
+            all_edges.update(incidence[i])
+        
+        adj_nodes = set()
+        for e in all_edges:
+            endpoints = [j for j in incidence[e] if j in node_indices]
+            for pair in combinations(endpoints, 2):
+                adj_nodes.add(tuple(sorted([ids[pair[0]], ids[pair[1]]])))
+        
+        return adj_nodes
+    
+    def bipartite_neighbors(self, vertex_id):
+        ids = self._ids
+        return [ids[j] for j in self._incidence[self._index[vertex_id]]]
+    
+    def bipartite_number_of_nodes(self):
+        return len(self._index)
+    
+    def bipartite_csr(self):
+        vertex_ids = list(self.node)
+        position = np.full(len(self._ids), -1, dtype=np.int32)
+        dense_ids = np.array([self._index[vertex_id] for vertex_id in vertex_ids], dtype=np.int32)
+        position[dense_ids] = np.arange(len(vertex_ids), dtype=np.int32)
+        incidence = self._incidence
+        degrees = np.array([len(incidence[i]) for i in dense_ids], dtype=np.int32)
+        indptr = np.zeros(len(vertex_ids) + 1, dtype=np.int32)
+        np.cumsum(degrees, out=indptr[1:])
+        indices = np.fromiter(itertools.chain.from_iterable(incidence[i] for i in dense_ids), dtype=np.int32, count=indptr[-1])
+        return vertex_ids, indptr, position[indices]
+    
+    def to_bipartite_nx_graph(self):
+        bipartite_graph = nx.Graph()
+        for vertex_id in self.node:
+            bipartite_graph.add_node(vertex_id, attr_dict=self.node[vertex_id])
+        for edge_id in self.edges_iter():
+            for node in self.endpoints(edge_id):
+                bipartite_graph.add_edge(edge_id, node)
+        return bipartite_graph
+    
+    def visualize(self):
+        nxext.visualize_graph(self.to_bipartite_nx_graph(), bipartite=True, edge_labels=False)
+    
+    def _init_storage(self):
+        self.node = {}
+        self._index = {}
+        self._ids = []
+        self._incidence = []
+        self._is_edge = bytearray()
+    
+    def _add_vertex(self, vertex_id, attr_dict):
+        if vertex_id in self._index:
+            self.node[vertex_id].update(attr_dict)
+            return
+        self._index[vertex_id] = len(self._ids)
+        self._ids.append(vertex_id)
+        self._incidence.append([])
+        self._is_edge.append(attr_dict["bipartite"])
+        self.node[vertex_id] = attr_dict
+    
+    def _remove_vertex(self, vertex_id):
+        i = self._index.pop(vertex_id)
+        incidence = self._incidence
+        for j in incidence[i]:
+            incidence[j].remove(i)
+        incidence[i] = None
+        self._ids[i] = None
+        del self.node[vertex_id]
+    
+    def _compact(self):
+        # drop the slots of the removed vertices (if they outnumber the others), keeping the order of the others
+        ids = self._ids
+        if len(ids) <= 2 * len(self._index):
+            return
+        live = [i for i in xrange(len(ids)) if ids[i] is not None]
+        new_index = [-1] * len(ids)
+        for new_i, i in enumerate(live):
+            new_index[i] = new_i
+        incidence = self._incidence
+        self._incidence = [[new_index[j] for j in incidence[i]] for i in live]
+        self._ids = [ids[i] for i in live]
+        self._is_edge = bytearray(self._is_edge[i] for i in live)
+        self._index = {vertex_id: i for i, vertex_id in enumerate(self._ids)}
+    
+    def _link(self, edge_id, node):
+        e = self._index[edge_id]
+        i = self._index[node]
+        if i not in self._incidence[e]:
+            self._incidence[e].append(i)
+            self._incidence[i].append(e)
+    
+    def _has_vertex(self, vertex_id):
+        return vertex_id in self._index
+    
+    def _copy_storage(self, other):
+        self.node = {vertex_id: Hypergraph._copy_attr_dict(attr_dict) for vertex_id, attr_dict in other.node.iteritems()}
+        self._index = dict(other._index)
+        self._ids = list(other._ids)
+        self._incidence = [list(incidence) if incidence is not None else None for incidence in other._incidence]
+        self._is_edge = bytearray(other._is_edge)
+    
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            storage = ["_index", "_ids", "_incidence", "_is_edge"]
+            self_dict = {key: value for key, value in self.__dict__.items() if key not in storage}
+            other_dict = {key: value for key, value in other.__dict__.items() if key not in storage}
+            return self_dict == other_dict
+        else:
+            return False
+    
+    def __init__(self, nx_graph=nx.Graph(), compact=True, interned_labels=None):
+        '''
+        :param interned_labels: (default None) A dictionary {label: label} in which the labels are
+        interned, e.g. one shared by all hypergraphs of a graph database, so that equal labels
+        are stored once. It is owned by the caller and freed with it. By default the labels are
+        interned only within this hypergraph.
+        '''
+        Hypergraph.__init__(self, nx_graph)
+        interned_labels = interned_labels if interned_labels is not None else {}
+        for vertex_id in self.node:
+            attr_dict = self.node[vertex_id]
+            attr_dict["labels"] = [interned_labels.setdefault(label, label) for label in attr_dict["labels"]]
@@ -104,7 +104,7 @@ def calculate_sketch_matrix(ch_matrix, hypergraph):
     print "Building sketch matrix started at", time.strftime(time_format)
     start = time.time()
     sketch_matrix = SketchMatrix(k, L, ch_matrix)
-    print "Building sketch matrix took", time.time() - start, "s"
+    print "Building sketch matrix took", time.time() - start, "s", "({0:.0f} non-zeros/s)".format(sketch_matrix.build_nnz_per_second)
     print "-----------------------------------------"
     
     print "Saving sketch matrix started at", time.strftime(time_format)
@@ -142,15 +142,9 @@ if __name__ == '__main__':
     sketch_matrix = calculate_sketch_matrix(ch_matrix, hypergraph)
 #     sketch_matrix, index_node_map, node_id_map = load_sketch_matrix()
     
-    print "Building similarity matrix started at", time.strftime(time_format)
-    start = time.time()
-    sim_mat = similar_nodes_mining.get_node_similarity_matrix(sketch_matrix)
-    print "Building similarity matrix took", time.time() - start, "s"
-    print "-----------------------------------------"
-    
     print "Extracting similar nodes started at", time.strftime(time_format)
     start = time.time()
-    similar_nodes = similar_nodes_mining.get_all_similar_nodes(sim_mat, index_node_map)
+    similar_nodes = similar_nodes_mining.get_all_similar_nodes_lsh(sketch_matrix, index_node_map)
     print "Extracting similar nodes took", time.time() - start, "s"
     print "-----------------------------------------"
     
@@ -19,12 +19,21 @@ def avg(l):
 def F1(precision, recall):
     return (2. * precision * recall) / (precision + recall) if precision and recall else 0.
 
-def predict_target_majority(targets, default_negative_target=0):
+def predict_target_majority(targets, default_negative_target=0, weights=None):
     '''Majority election of target.
     :param similar_targets: A list of either integers or lists. Each element may have multiple target values.
     The target label that appears most frequently is the chosen one.
+    :param weights: (default None) A list with a weight of each element, e.g. its estimated
+    similarity to the query (see SketchMatrix.get_similar_columns_ranked). If set, the target
+    label with the largest sum of weights is chosen.
     '''
-    if len(targets):
+    if len(targets) and weights is not None:
+        target_weights = {}
+        for element_targets, weight in itertools.izip(targets, weights):
+            for target in (element_targets if type(element_targets) is list else [element_targets]):
+                target_weights[target] = target_weights.get(target, 0.) + weight
+        return max(target_weights, key=lambda x: target_weights[x])
+    elif len(targets):
         if type(targets[0]) is list:
             target_counts = Counter(itertools.chain(*targets))
         else:
@@ -0,0 +1,71 @@
+'''
+Micro-benchmarks of the performance-critical parts of the graph algorithms.
+Run from the project root, e.g. "python -m tests.benchmark".
+'''
+from ivanov.graph.hypergraph import Hypergraph
+from ivanov.graph.algorithms import weisfeiler_lehman
+from tests import example_graphs
+import networkx as nx
+import copy
+import random
+import time
+
+def time_per_call(function, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        function()
+    return (time.time() - start) / repeat
+
+def example_hypergraphs(compact=False):
+    '''Get all example graphs from the tests as hypergraphs sorted by size.
+    :return A list of tuples of the form (name, hypergraph).
+    '''
+    hypergraphs = []
+    for name in dir(example_graphs):
+        nx_graph = getattr(example_graphs, name)
+        if isinstance(nx_graph, nx.Graph):
+            hypergraphs.append((name, Hypergraph(nx_graph, compact=compact)))
+    return sorted(hypergraphs, key=lambda (_, hypergraph): hypergraph.bipartite_number_of_nodes())
+
+def hypergraph_copy(repeat=200):
+    '''Compare the cost of Hypergraph.copy with copy.deepcopy on the example graphs.
+    '''
+    print "{0:28} {1:>6} {2:>6} {3:>14} {4:>14} {5:>14}".format("graph", "nodes", "edges", "deepcopy [us]", "copy [us]", "compact [us]")
+    compact_hypergraphs = dict(example_hypergraphs(compact=True))
+    for name, hypergraph in example_hypergraphs():
+        compact_hypergraph = compact_hypergraphs[name]
+        deepcopy_time = time_per_call(lambda: copy.deepcopy(hypergraph), repeat)
+        copy_time = time_per_call(hypergraph.copy, repeat)
+        compact_copy_time = time_per_call(compact_hypergraph.copy, repeat)
+        print "{0:28} {1:>6} {2:>6} {3:>14.1f} {4:>14.1f} {5:>14.1f}".format(name, hypergraph.number_of_nodes(), hypergraph.number_of_edges(),
+                                                                           deepcopy_time * 1e6, copy_time * 1e6, compact_copy_time * 1e6)
+
+def random_hypergraph(nodes_count, edges_count, labels_count=10, compact=False):
+    '''Generate a random directed multigraph with labeled nodes and edges as a hypergraph.
+    '''
+    nx_graph = nx.MultiDiGraph()
+    for node in range(nodes_count):
+        nx_graph.add_node(node, labels=[str(random.randrange(labels_count))])
+    for _ in range(edges_count):
+        nx_graph.add_edge(random.randrange(nodes_count), random.randrange(nodes_count), label=str(random.randrange(labels_count)))
+    return Hypergraph(nx_graph, compact=compact)
+
+def weisfeiler_lehman_iterations(wl_iterations=4, repeat=3):
+    '''Compare the per-node iterate with the integer-coded iterate_all on random graphs.
+    '''
+    def run_iterate(hypergraph):
+        wl_hypergraph, wl_state = weisfeiler_lehman.init(hypergraph)
+        for i in range(1, wl_iterations + 1):
+            wl_hypergraph, wl_state = weisfeiler_lehman.iterate(wl_hypergraph, wl_state, i)
+    
+    print "{0:>6} {1:>6} {2:>14} {3:>14}".format("nodes", "edges", "iterate [ms]", "iterate_all [ms]")
+    for nodes_count in [100, 1000, 5000]:
+        hypergraph = random_hypergraph(nodes_count, 2 * nodes_count)
+        iterate_time = time_per_call(lambda: run_iterate(hypergraph), repeat)
+        iterate_all_time = time_per_call(lambda: weisfeiler_lehman.iterate_all(hypergraph, wl_iterations), repeat)
+        print "{0:>6} {1:>6} {2:>14.1f} {3:>14.1f}".format(hypergraph.number_of_nodes(), hypergraph.number_of_edges(),
+                                                          iterate_time * 1e3, iterate_all_time * 1e3)
+
+if __name__ == '__main__':
+    hypergraph_copy()
+    weisfeiler_lehman_iterations()
@@ -6,8 +6,12 @@ Created on Dec 28, 2015
 
 from ivanov.graph.algorithms.arnborg_proskurowski.reducible_feature import ReducibleFeature
 from ivanov.graph.algorithms import arnborg_proskurowski
+from ivanov.graph.hypergraph import Hypergraph
 from tests import example_graphs
+import networkx as nx
 import unittest
+import itertools
+import random
 
 class TestArnborgProskurowski(unittest.TestCase):
     def common_asserts(self, tw, tw_exp, canon_str, canon_str_exp, features, features_exp):
@@ -88,6 +92,79 @@ class TestArnborgProskurowski(unittest.TestCase):
         canon_str_1 = arnborg_proskurowski.get_canonical_representation(example_graphs.ap_graph_tw_3)
         features_1 = arnborg_proskurowski.get_reduced_features(example_graphs.ap_graph_tw_3)
         self.common_asserts(tw_1, 3, canon_str_1, canon_str_exp, features_1, features_exp)
+    def testCanonicalHash(self):
+        graphs = [example_graphs.ap_graph_tw_2, example_graphs.ap_ring_graph, example_graphs.ap_graph_tw_3]
+        hashes = [arnborg_proskurowski.get_canonical_hash(graph) for graph in graphs]
+        self.assertEqual(len(set(hashes)), len(graphs), "Different graphs got the same canonical hash.")
+        for graph, canon_hash in zip(graphs[:2], hashes[:2]):
+            nodes = graph.nodes()
+            renamed_graph = nx.relabel_nodes(graph, dict(zip(nodes, reversed(nodes))))
+            self.assertEqual(arnborg_proskurowski.get_canonical_hash(renamed_graph), canon_hash, "The canonical hash is not canonical.")
+        
+        tw, canon_hash, features = arnborg_proskurowski.run_algorithm(example_graphs.ap_graph_tw_2, return_features=True, canonical_hash=True)
+        self.assertEqual(tw, 2)
+        self.assertEqual(canon_hash, hashes[0])
+        self.assertEqual(features, arnborg_proskurowski.get_reduced_features(example_graphs.ap_graph_tw_2))
+    
+    def testMinimalLabeling(self):
+        graph = nx.MultiDiGraph()
+        for node in range(4):
+            graph.add_node(node, labels=["n"])
+        for (u, v), label in zip(itertools.combinations(range(4), 2), ["a", "a!", "a", "b", "a!", "a"]):
+            graph.add_edge(u, v, label=label)
+        hypergraph = Hypergraph(graph)
+        edges = hypergraph.edges()
+        nodes = hypergraph.nodes()
+        
+        # the labels "(a" and "(a," are prefixes of edge strings, so the joined strings are compared
+        for labels in [[], ["(a,", "(a"]]:
+            candidates = []
+            for perm in itertools.permutations(nodes):
+                strings = sorted(labels + [Hypergraph.edge_to_string(hypergraph, edge, perm) for edge in edges])
+                candidates.append((u",".join(strings), perm))
+            minimal_label = min(candidates)[0]
+            minimal_perms_exp = [perm for label, perm in candidates if label == minimal_label]
+            
+            minimal_strings, minimal_perms = ReducibleFeature.get_minimal_labeling(hypergraph, edges, itertools.permutations(nodes), labels)
+            self.assertEqual(u",".join(minimal_strings), minimal_label, "The minimal label was not found.")
+            self.assertEqual(minimal_perms, minimal_perms_exp, "The minimal permutations were not found.")
+    
+    def testFastTreewidth(self):
+        def labeled(graph):
+            for node in graph.nodes_iter():
+                graph.node[node]["labels"] = ["a"]
+            for u, v in graph.edges_iter():
+                graph.edge[u][v]["label"] = "b"
+            return graph
+        
+        graphs = [example_graphs.ap_graph_tw_2, example_graphs.ap_ring_graph, example_graphs.ap_graph_tw_3]
+        graphs += map(labeled, [nx.path_graph(5), nx.complete_graph(5), nx.complete_graph(4), nx.empty_graph(3)])
+        # buddy, cube and a graph with tree-width 4 and only nodes with 4 neighbors
+        graphs += map(labeled, [nx.complete_bipartite_graph(3, 3), nx.cubical_graph(), nx.octahedral_graph()])
+        tws_exp = [arnborg_proskurowski.get_treewidth(graph) for graph in graphs]
+        self.assertEqual(tws_exp, [2, 2, 3, 1, -1, 3, 0, 3, 3, -1])
+        tws = list(arnborg_proskurowski.get_treewidths(graphs))
+        self.assertEqual(tws, tws_exp, "The fast tree-width differs from the one of the full algorithm.")
+    
+    def testCanonicalRepresentationCache(self):
+        def shuffled(graph, seed):
+            nodes = graph.nodes()
+            new_nodes = list(nodes)
+            random.Random(seed).shuffle(new_nodes)
+            return nx.relabel_nodes(graph, dict(zip(nodes, new_nodes)))
+        
+        cache = arnborg_proskurowski.CanonicalRepresentationCache(max_size=1)
+        arnborg_proskurowski.set_canonical_cache(cache)
+        try:
+            for graph in [example_graphs.ap_graph_tw_2, example_graphs.ap_ring_graph]:
+                canon_str_exp = arnborg_proskurowski.run_algorithm(graph)[1]
+                for seed in range(3):
+                    canon_str = arnborg_proskurowski.get_canonical_representation(shuffled(graph, seed))
+                    self.assertEqual(canon_str, canon_str_exp, "The cached canonical string differs from the computed one.")
+        finally:
+            arnborg_proskurowski.set_canonical_cache(None)
+        self.assertEqual((cache.hits, cache.misses), (4, 2), "Isomorphic graphs were not served from the cache.")
+        self.assertEqual(len(cache), 1, "The least recently used graph was not evicted.")
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -4,10 +4,11 @@ Created on Dec 18, 2015
 @author: Ivan Ivanov
 '''
 
-from ivanov.graph.algorithms import weisfeiler_lehman
-from ivanov.graph.hypergraph import Hypergraph
+from ivanov.graph.algorithms import weisfeiler_lehman, arnborg_proskurowski
+from ivanov.graph.hypergraph import Hypergraph, CompactHypergraph
 from ivanov.graph import algorithms, rdf
 from tests import example_graphs
+import networkx as nx
 import unittest
 
 class TestGraph(unittest.TestCase):
@@ -15,7 +16,83 @@ class TestGraph(unittest.TestCase):
         dummy_hypergraph = Hypergraph(example_graphs.gt_dummy_graph)
         dummy_copy = dummy_hypergraph.copy()
         self.assertEqual(dummy_hypergraph, dummy_copy, "The copy was not correct.")
+        
+        for hypergraph in [Hypergraph(example_graphs.gt_dummy_graph), Hypergraph(example_graphs.gt_dummy_graph, compact=True)]:
+            hypergraph_copy = hypergraph.copy()
+            node = next(hypergraph.nodes_iter())
+            edge = next(hypergraph.edges_iter())
+            hypergraph_copy.add_node_label(node, u"new_label")
+            hypergraph_copy.remove_edge(edge)
+            self.assertNotIn(u"new_label", hypergraph.node[node]["labels"], "The copy shares the node labels with the original.")
+            self.assertIn(edge, hypergraph.node, "Removing an edge from the copy changed the original.")
+            self.assertNotEqual(hypergraph, hypergraph_copy)
+
+    def testCompactHypergraph(self):
+        for nx_graph in [example_graphs.ap_graph_tw_2, example_graphs.ap_graph_tw_3, example_graphs.gt_dummy_graph]:
+            hypergraph = Hypergraph(nx_graph)
+            compact_hypergraph = Hypergraph(nx_graph, compact=True)
+            self.assertIs(type(compact_hypergraph), CompactHypergraph)
+            self.assertEqual(hypergraph.number_of_edges(), compact_hypergraph.number_of_edges())
+            self.assertEqual(set(hypergraph.nodes_iter()), set(compact_hypergraph.nodes_iter()))
+            for node in hypergraph.nodes_iter():
+                self.assertEqual(set(hypergraph.neighbors(node)), set(compact_hypergraph.neighbors(node)))
+            tw, canon_str = arnborg_proskurowski.run_algorithm(hypergraph)
+            compact_tw, compact_canon_str = arnborg_proskurowski.run_algorithm(compact_hypergraph)
+            self.assertEqual(tw, compact_tw, "The tree-width differs for the compact hypergraph.")
+            self.assertEqual(canon_str, compact_canon_str, "The canonical string differs for the compact hypergraph.")
+        
+        hyper_dummy_wl, wl_state = weisfeiler_lehman.init(Hypergraph(example_graphs.gt_dummy_wl), test_mode=True)
+        compact_dummy_wl, compact_wl_state = weisfeiler_lehman.init(Hypergraph(example_graphs.gt_dummy_wl, compact=True), test_mode=True)
+        for i in range(1, 4):
+            hyper_dummy_wl, wl_state = weisfeiler_lehman.iterate(hyper_dummy_wl, wl_state, i, test_mode=True)
+            compact_dummy_wl, compact_wl_state = weisfeiler_lehman.iterate(compact_dummy_wl, compact_wl_state, i, test_mode=True)
+        self.assertEqual(wl_state, compact_wl_state, "Weisfeiler-Lehman differs for the compact hypergraph.")
 
+    def testCompactHypergraph_Compaction(self):
+        hypergraph = Hypergraph(example_graphs.gt_dummy_graph)
+        compact_hypergraph = Hypergraph(example_graphs.gt_dummy_graph, compact=True)
+        nodes = compact_hypergraph.nodes()
+        for node in nodes[: 2 * len(nodes) / 3]:
+            hypergraph.remove_node(node)
+            compact_hypergraph.remove_node(node)
+        self.assertEqual(compact_hypergraph.nodes(), [node for node in nodes if compact_hypergraph.has_node(node)], "The order of the nodes changed.")
+        self.assertEqual(len(compact_hypergraph._ids), compact_hypergraph.bipartite_number_of_nodes(), "The removed nodes were not compacted.")
+        self.assertEqual(set(hypergraph.edges_iter()), set(compact_hypergraph.edges_iter()))
+        for node in hypergraph.nodes_iter():
+            self.assertEqual(set(hypergraph.neighbors(node)), set(compact_hypergraph.neighbors(node)))
+            self.assertEqual(set(hypergraph.edges(node)), set(compact_hypergraph.edges(node)))
+    
+    def testCompactHypergraph_InternedLabels(self):
+        def make_graph():
+            # equal but distinct label objects in every graph
+            nx_graph = nx.Graph()
+            nx_graph.add_node(1, labels=[u"".join([u"a", u"b"])])
+            nx_graph.add_node(2, labels=[u"".join([u"c", u"d"])])
+            nx_graph.add_edge(1, 2, label=u"".join([u"e", u"f"]))
+            return nx_graph
+        
+        interned_labels = {}
+        hypergraphs = [Hypergraph(make_graph(), compact=True, interned_labels=interned_labels) for _ in range(2)]
+        self.assertEqual(set(interned_labels), {u"ab", u"cd", u"ef"})
+        for node in hypergraphs[0].nodes_iter():
+            for label, other_label in zip(hypergraphs[0].node[node]["labels"], hypergraphs[1].node[node]["labels"]):
+                self.assertIs(label, other_label, "The labels are not interned in the shared table.")
+        # without a table the labels are interned only within each hypergraph
+        self.assertIsNot(Hypergraph(make_graph(), compact=True).node[u"n_1"]["labels"][0], hypergraphs[0].node[u"n_1"]["labels"][0])
+
+    def testHypergraph_NumberOfNeighbors(self):
+        for hypergraph in [Hypergraph(example_graphs.gt_dummy_graph), Hypergraph(example_graphs.gt_dummy_graph, compact=True)]:
+            nodes = hypergraph.nodes()
+            hypergraph.add_edge(set(nodes[:3]))
+            hypergraph.add_edge(set(nodes[1:3]))
+            hypergraph.remove_edge(next(hypergraph.edges_iter(nodes[3])))
+            hypergraph.remove_node(nodes[4])
+            hypergraph_copy = hypergraph.copy()
+            hypergraph_copy.remove_node(nodes[0])
+            for h in [hypergraph, hypergraph_copy]:
+                for node in h.nodes_iter():
+                    self.assertEqual(h.number_of_neighbors(node), len(h.neighbors(node)), "Wrong number of neighbors of {0}.".format(node))
+    
     def testHypergraph_ReadWrite(self):
         file_name = "test_files/dummy_hypergraph.tmp"
         dummy_hypergraph = Hypergraph(example_graphs.gt_dummy_graph)
@@ -23,6 +100,19 @@ class TestGraph(unittest.TestCase):
         read_hypergraph = Hypergraph.load_from_file(file_name)
         self.assertEqual(dummy_hypergraph, read_hypergraph, "The read hypergraph is different from the saved one.")
     
+    def testHypergraph_ReadWithoutNeighborsCounts(self):
+        file_name = "test_files/dummy_hypergraph.tmp"
+        for compact in [False, True]:
+            dummy_hypergraph = Hypergraph(example_graphs.ap_graph_tw_2, compact=compact)
+            neighbors_multiplicities = dummy_hypergraph.neighbors_multiplicities
+            # saved before the neighbors counts were maintained
+            del dummy_hypergraph.neighbors_multiplicities
+            dummy_hypergraph.save_to_file(file_name)
+            read_hypergraph = Hypergraph.load_from_file(file_name)
+            self.assertEqual(read_hypergraph.neighbors_multiplicities, neighbors_multiplicities, "The neighbors counts were not rebuilt.")
+            read_hypergraph.copy().remove_edge(next(read_hypergraph.edges_iter()))
+            self.assertEqual(arnborg_proskurowski.run_algorithm(read_hypergraph), arnborg_proskurowski.run_algorithm(example_graphs.ap_graph_tw_2))
+    
     def testHypergraph_edges_iter(self):
         dummy_hypergraph = Hypergraph(example_graphs.gt_dummy_graph)
         self.assertEqual(len(list(dummy_hypergraph.edges_iter())), 32)
@@ -142,6 +232,34 @@ class TestGraph(unittest.TestCase):
             hyper_dummy_wl = new_hyper_dummy_wl
             i += 1
         self.assertEqual(wl_state_exp, wl_state, "The multi-sets of labels computed by Weisfeiler-Lehman are not correct.")
+        
+        _, labels, wl_state = weisfeiler_lehman.iterate_all(Hypergraph(example_graphs.gt_dummy_wl), 10, test_mode=True, stop_when_stable=True)
+        self.assertEqual(i + 1, len(labels), "Weisfeiler-Lehman did not stop at the first stable iteration.")
+        self.assertEqual(wl_state_exp, wl_state, "The multi-sets of labels computed by Weisfeiler-Lehman are not correct.")
+    
+    def testWeisfeilerLehman_IterateAll(self):
+        for nx_graph, test_mode in [(example_graphs.gt_dummy_wl, True), (example_graphs.ap_graph_tw_3, False)]:
+            hypergraph = Hypergraph(nx_graph)
+            vertex_ids, labels, wl_state = weisfeiler_lehman.iterate_all(hypergraph, 3, test_mode=test_mode)
+            wl_hypergraph, wl_state_exp = weisfeiler_lehman.init(hypergraph, test_mode=test_mode)
+            for i in range(4):
+                if i > 0:
+                    wl_hypergraph, wl_state_exp = weisfeiler_lehman.iterate(wl_hypergraph, wl_state_exp, i, test_mode=test_mode)
+                labels_exp = [wl_hypergraph.node[vertex_id]["labels"][0] for vertex_id in vertex_ids]
+                self.assertEqual(labels_exp, labels[i], "The labels of WL iteration {0} are not correct.".format(i))
+            self.assertEqual(wl_state_exp, wl_state, "The integer-coded Weisfeiler-Lehman produced a different state.")
+    
+    def testWeisfeilerLehman_IterateAllBatch(self):
+        hypergraphs = [Hypergraph(example_graphs.gt_dummy_wl), Hypergraph(example_graphs.ap_graph_tw_3), Hypergraph(example_graphs.snm_dummy_graph)]
+        for stop_when_stable in [False, True]:
+            wl_state = None
+            results_exp = []
+            for hypergraph in hypergraphs:
+                vertex_ids, labels, wl_state = weisfeiler_lehman.iterate_all(hypergraph, 3, wl_state, stop_when_stable=stop_when_stable)
+                results_exp.append((vertex_ids, labels))
+            vertex_ids_list, labels_list, batch_wl_state = weisfeiler_lehman.iterate_all_batch(hypergraphs, 3, stop_when_stable=stop_when_stable)
+            self.assertEqual(results_exp, zip(vertex_ids_list, labels_list), "The batched Weisfeiler-Lehman produced different labels.")
+            self.assertEqual(wl_state, batch_wl_state, "The batched Weisfeiler-Lehman produced a different state.")
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testHypergraphReadWrite']
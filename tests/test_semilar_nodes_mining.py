@@ -5,11 +5,13 @@ Created on Dec 29, 2015
 '''
 
 from ivanov.graph.algorithms.similar_graphs_mining import feature_extraction,\
-    fingerprint, shingle_extraction
+    fingerprint, shingle_extraction, crossval
 from ivanov.graph.algorithms import arnborg_proskurowski, similar_nodes_mining,\
     r_ball_hyper
 from ivanov.graph.algorithms.similar_graphs_mining.characteristic_matrix import CharacteristicMatrix
-from ivanov.graph.algorithms.similar_graphs_mining.min_hash_function import MinHashFunction
+from ivanov.graph.algorithms.similar_graphs_mining.coo_accumulator import COOAccumulator
+from ivanov.graph.algorithms.similar_graphs_mining.min_hash_function import MinHashFunction,\
+    MinHashFunctionFamily
 from ivanov.graph.algorithms.similar_graphs_mining.sketch_matrix import SketchMatrix
 from ivanov.graph.hypergraph import Hypergraph
 from ivanov.graph import algorithms
@@ -84,6 +86,14 @@ class TestSimilarNodesMining(unittest.TestCase):
         fp = fingerprint.rabin_fingerprint(dummy_binary_value)
         self.assertEqual(fp_exp, fp, "The calculated fingerprint is wrong.")
     
+    def testRabinFingerprintBytes(self):
+        shingles = [u"", u"n_1;any(wl_1.2,wl_1.4)", u"\u00fcber", u"\x00a", u"a" * 100]
+        for size in [64, 32, 24, 16]:
+            fps_exp = [fingerprint.rabin_fingerprint(fingerprint.string_bytes_to_int(shingle), size) for shingle in shingles]
+            fps = [fingerprint.rabin_fingerprint_bytes(shingle, size) for shingle in shingles]
+            self.assertEqual(fps_exp, fps, "The table-driven fingerprint differs from Rabin's fingerprint.")
+            self.assertEqual(fps_exp, list(fingerprint.rabin_fingerprints(shingles, size, chunk_size=2)), "The batch fingerprints differ from Rabin's fingerprint.")
+    
     def testShingleExtraction(self):
         shingles_exp = [
             "(0.1;(1.2;(7,((0,1))),3),(1.2;(7,((0,1),(1,0))),4),1)",
@@ -113,6 +123,9 @@ class TestSimilarNodesMining(unittest.TestCase):
         ]
         shingles = shingle_extraction.extract_shingles(example_graphs.snm_dummy_feature)
         self.assertEqual(shingles_exp, list(shingles), "Wrong shingles were extracted from feature.")
+        hashed_shingles = list(shingle_extraction.extract_shingles(example_graphs.snm_dummy_feature, canonical_hash=True))
+        self.assertEqual(len(hashed_shingles), len(shingles_exp))
+        self.assertEqual(len(set(hashed_shingles)), len(set(shingles_exp)), "The hashed shingles do not distinguish the same shingles.")
     
     def testGetWShingles(self):
         text = "abcdabd"
@@ -120,6 +133,16 @@ class TestSimilarNodesMining(unittest.TestCase):
         shingles = shingle_extraction.get_w_shingles(text, 2)
         self.assertEqual(shingles_exp, shingles, "Wrong w-shingles were extracted from text.")
     
+    def testGetWShingleFingerprints(self):
+        # ASCII, non-ASCII (windows with a varying number of bytes) and byte strings
+        texts = [u"abcdabd", u"n_1;any(wl_1.2),out(wl_1.4)", u"\u00fcber", u"a", u"\u00fcber \u20ac, \u00e4\u00e4 und \u4e2d\u6587 (wl_1.2)", "abcdabd"]
+        for text in texts:
+            for w in [1, 2, 5]:
+                for size in [24, 64]:
+                    fps_exp = set(fingerprint.get_fingerprints(shingle_extraction.get_w_shingles(text, w), size=size))
+                    fps = fingerprint.get_w_shingle_fingerprints(text, w, size=size)
+                    self.assertEqual(fps_exp, fps, "Wrong fingerprints of the w-shingles were computed.")
+    
     def testWShinglesExtraction(self):
         h1 = Hypergraph(example_graphs.w_shingles_graph_1)
         h2 = Hypergraph(example_graphs.w_shingles_graph_2)
@@ -142,13 +165,189 @@ class TestSimilarNodesMining(unittest.TestCase):
         fp = fingerprint.get_minhash_fingerprint_naive(example_graphs.snm_dummy_feature, h)
         self.assertEqual(fp_exp, fp, "The minhash fingerprint extracted from the feature is not correct.")
     
+    def testMinHashFunctionFamily(self):
+        p = MinHashFunctionFamily.mersenne_prime
+        a = [1, p - 1, int(1181783497276652981)]
+        b = [0, p - 1, int(2093704845963720703)]
+        hash_family = MinHashFunctionFamily(a, b)
+        fingerprints = [0, 1, p - 1, p, 2 ** 63, 2 ** 64 - 1, int(9591196679437604257)]
+        hashes = hash_family(np.array(fingerprints, dtype=np.uint64))
+        for l in range(len(a)):
+            for i, x in enumerate(fingerprints):
+                self.assertEqual((a[l] * x + b[l]) % p, int(hashes[l, i]), "Wrong value of the vectorized min-hash function.")
+    
+    def testSketchMatrix_ComputeColumn(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=3, r_out=2, r_all=0)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        ch_matrix = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=0)
+        sketch_matrix = SketchMatrix(5, 20, ch_matrix)
+        for j in range(nodes_count):
+            column_fingerprints = [fp for fp in ch_matrix.non_empty_rows() if j in ch_matrix[fp]]
+            equality = (sketch_matrix.get_column(j) == sketch_matrix.compute_column(column_fingerprints)).all()
+            self.assertTrue(equality, "The computed sketch column differs from the column of the sketch matrix.")
+
+    def testSketchMatrix_Chunked(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=3, r_out=2, r_all=0)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        ch_matrix = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=2)
+        hash_functions = MinHashFunctionFamily.generate(5 * 20)
+        sketch_matrix_exp = SketchMatrix(5, 20, ch_matrix, hash_functions=hash_functions)
+        sketch_matrix = SketchMatrix(5, 20, ch_matrix, hash_functions=hash_functions, n_jobs=2)
+        self.assertTrue((sketch_matrix_exp.matrix == sketch_matrix.matrix).all(), "The sketch matrix built in parallel is wrong.")
+        legacy_sketch_matrix = SketchMatrix(1, 2, ch_matrix, hash_functions=MinHashFunction.generate_functions(2))
+        self.assertGreater(legacy_sketch_matrix.build_nnz_per_second, 0)
+        for chunk_nnz, n_jobs in [(1, 1), (7, 1), (7, 2)]:
+            sketch_matrix.matrix[:] = np.iinfo(np.uint64).max
+            sketch_matrix.build_chunked(ch_matrix, n_jobs=n_jobs, chunk_nnz=chunk_nnz)
+            self.assertTrue((sketch_matrix_exp.matrix == sketch_matrix.matrix).all(), "The sketch matrix built from small chunks is wrong.")
+
+    def testSketchMatrix_SubSketch(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=2, r_out=2, r_all=0)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        ch_matrix = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=1)
+        full_sketch_matrix = SketchMatrix(24, 1, ch_matrix, build_lsh_index=False)
+        self.assertIsNone(full_sketch_matrix.lsh_index)
+        for k, L in [(2, 3), (3, 8), (1, 24)]:
+            sketch_matrix_exp = SketchMatrix(k, L, ch_matrix, hash_functions=full_sketch_matrix.hash_functions[: k * L])
+            sketch_matrix = full_sketch_matrix.get_sub_sketch(k, L)
+            self.assertTrue((sketch_matrix_exp.matrix == sketch_matrix.matrix).all(), "Wrong sub-sketch matrix.")
+            for j in range(nodes_count):
+                similar_columns_exp = sketch_matrix_exp.get_similar_columns(sketch_matrix_exp.get_column(j))
+                similar_columns = sketch_matrix.get_similar_columns(sketch_matrix.get_column(j))
+                self.assertEqual(list(similar_columns_exp), list(similar_columns), "The sub-sketch returned different similar columns.")
+
+    def testSketchMatrix_GetSimilarColumns(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=2, r_out=2, r_all=0)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        ch_matrix = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=2)
+        k, L = 2, 8
+        sketch_matrix = SketchMatrix(k, L, ch_matrix)
+        query_columns = [sketch_matrix.get_column(j) for j in range(nodes_count)]
+        query_columns.append(sketch_matrix.compute_column([]))
+        # a column sharing only its first band with column 0
+        mixed_column = sketch_matrix.compute_column([])
+        mixed_column[:k] = sketch_matrix.get_column(0)[:k]
+        query_columns.append(mixed_column)
+        for sketch_column in query_columns:
+            expected = SketchMatrix._get_similar_columns(sketch_column, sketch_matrix.matrix, k, L, nodes_count)
+            similar_columns = sketch_matrix.get_similar_columns(sketch_column)
+            self.assertEqual(list(expected), list(similar_columns), "The LSH index returned different similar columns.")
+
+    def testSketchMatrix_QueryMany(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=2, r_out=2, r_all=0)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        ch_matrix = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=1)
+        sketch_matrix = SketchMatrix(3, 4, ch_matrix)
+        rows = ch_matrix.non_empty_rows().tolist()
+        queries = [[], rows, rows[::2], rows[1:3], list(ch_matrix.non_empty_rows()[ch_matrix.indices[ch_matrix.indptr[:-1]] == 0])]
+        queries += [[fp for fp in rows if j in ch_matrix[fp]] for j in range(nodes_count)]
+        sketch_columns = sketch_matrix.compute_columns(queries)
+        similar_columns_list = sketch_matrix.query_many(queries)
+        for q, query in enumerate(queries):
+            sketch_column = sketch_matrix.compute_column(query)
+            self.assertTrue((sketch_column == sketch_columns[:, q : q + 1]).all(), "Wrong sketch column of query {0}.".format(q))
+            self.assertEqual(list(sketch_matrix.get_similar_columns(sketch_column)), list(similar_columns_list[q]), "Wrong similar columns of query {0}.".format(q))
+
+    def testSketchMatrix_GetSimilarColumnsRanked(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=2, r_out=2, r_all=0)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        ch_matrix = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=1)
+        sketch_matrix = SketchMatrix(2, 10, ch_matrix)
+        for j in range(nodes_count):
+            sketch_column = sketch_matrix.get_column(j)
+            similar_columns, similarities = sketch_matrix.get_similar_columns_ranked(sketch_column)
+            self.assertEqual(list(sketch_matrix.get_similar_columns(sketch_column)), sorted(similar_columns), "The ranked similar columns differ.")
+            similarities_exp = [np.mean(sketch_matrix.matrix[:, c] == sketch_column[:, 0]) for c in similar_columns]
+            self.assertEqual(similarities_exp, list(similarities), "Wrong estimated Jaccard similarities.")
+            self.assertEqual(sorted(similarities, reverse=True), list(similarities), "The similar columns are not ranked.")
+            top_columns, _ = sketch_matrix.get_similar_columns_ranked(sketch_column, top_k=2)
+            self.assertEqual(list(similar_columns[:2]), list(top_columns), "Wrong top-k similar columns.")
+
+    def testSketchMatrix_SimilarColumnsMatrix(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=2, r_out=2, r_all=0)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        ch_matrix = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=1)
+        k, L = 2, 6
+        sketch_matrix = SketchMatrix(k, L, ch_matrix)
+        band_ids = SketchMatrix.get_band_ids(sketch_matrix.matrix, k, L)
+        test_cols = np.arange(3, 7)
+        train_cols = np.concatenate((np.arange(3), np.arange(7, nodes_count)))
+        similar_cols_matrix = crossval.get_similar_columns_matrix(band_ids, test_cols, train_cols)
+        train_sketch = sketch_matrix.matrix[:, train_cols]
+        for i, j in enumerate(test_cols):
+            expected = SketchMatrix._get_similar_columns(sketch_matrix.get_column(j), train_sketch, k, L, len(train_cols))
+            similar_cols = similar_cols_matrix.indices[similar_cols_matrix.indptr[i] : similar_cols_matrix.indptr[i + 1]]
+            self.assertEqual(list(expected), sorted(similar_cols), "Wrong similar train columns of test column {0}.".format(j))
+
+    def testDFoldsBatch(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=2, r_out=2, r_all=0)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        ch_matrix = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=1)
+        sketch_matrix = SketchMatrix(2, 6, ch_matrix)
+        d = 3
+        fold_size = nodes_count / d
+        # every fold has both binary targets, the multi-label targets have 1 or 2 labels
+        binary_targets = [[1 if (i / 2) % 2 else -1] for i in range(nodes_count)]
+        multilabel_targets = [[i % 3] if i % 2 else [i % 3, 3] for i in range(nodes_count)]
+        self.assertTrue(all(len(set(map(tuple, binary_targets[f * fold_size : (f + 1) * fold_size]))) == 2 for f in range(d)))
+        for targets, multilabel in [(binary_targets, False), (multilabel_targets, True)]:
+            quality = crossval.get_d_fold_quality_function(multilabel)
+            scores_exp = crossval.d_folds(d, sketch_matrix, nodes_count, quality, targets)
+            scores = crossval.d_folds_batch(d, sketch_matrix, targets, multilabel)
+            for score_exp, score in zip(scores_exp, scores):
+                self.assertAlmostEqual(score_exp, score, msg="The batch scores differ from the ones of d_folds (multilabel={0}).".format(multilabel))
+
     def testCharacteristicMatrix(self):
         dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
         rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=3, r_out=2, r_all=0)
         nodes_count = dummy_hypergraph.number_of_nodes()
         ch_matrix = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=0)
-        self.assertEqual(self.raw_ch_matrix_exp, ch_matrix.sparse_matrix, "The computed characteristic matrix is wrong.")
-    
+        self.assertEqual(self.raw_ch_matrix_exp, ch_matrix.to_dict(), "The computed characteristic matrix is wrong.")
+
+    def testCharacteristicMatrix_Parallel(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=3, r_out=2, r_all=0)
+        rballs_database = list(rballs_database)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        for shingles_type in ["features", "all"]:
+            ch_matrix_exp = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=2, shingles_type=shingles_type, hashed_wl_labels=True)
+            ch_matrix = CharacteristicMatrix(iter(rballs_database), nodes_count, wl_iterations=2, shingles_type=shingles_type, n_jobs=2)
+            self.assertEqual(ch_matrix_exp, ch_matrix, "The characteristic matrix built in parallel is wrong.")
+
+    def testCharacteristicMatrix_ForEachWLIter(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=3, r_out=2, r_all=0)
+        rballs_database = list(rballs_database)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        for shingles_type in ["features", "w-shingles"]:
+            for accumulate_wl_shingles in [True, False]:
+                ch_matrices = CharacteristicMatrix.build_for_each_wl_iter(rballs_database, nodes_count, [0, 1, 3], shingles_type=shingles_type, accumulate_wl_shingles=accumulate_wl_shingles)
+                for wl_iterations, ch_matrix in ch_matrices:
+                    ch_matrix_exp = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=wl_iterations, shingles_type=shingles_type, accumulate_wl_shingles=accumulate_wl_shingles)
+                    self.assertEqual(ch_matrix_exp, ch_matrix, "Wrong characteristic matrix for {0} W&L iterations.".format(wl_iterations))
+
+    def testCharacteristicMatrix_COOAccumulator(self):
+        accumulator = COOAccumulator(max_pending=3)
+        for col, fingerprints in sorted(enumerate([[5, 3, 5], [], [2**64 - 1, 3], [3]]), reverse=True):
+            accumulator.add(col, fingerprints)
+        accumulator.add(0, [2**64 - 1])
+        ch_matrix = CharacteristicMatrix(records=[([0], [1])], cols_count=1)
+        ch_matrix.cols_count = 4
+        ch_matrix.set_from_accumulator(accumulator)
+        self.assertEqual([3, 5, 2**64 - 1], ch_matrix.non_empty_rows().tolist(), "Wrong non-empty rows.")
+        self.assertEqual({3: set([0, 2, 3]), 5: set([0]), 2**64 - 1: set([0, 2])}, ch_matrix.to_dict(), "Wrong accumulated matrix.")
+        self.assertEqual([0, 2, 3], ch_matrix[3].tolist(), "Wrong columns of a row.")
+        self.assertRaises(KeyError, lambda: ch_matrix[4])
+        self.assertEqual((3, 4), ch_matrix.get_csc_matrix().shape, "Wrong shape of the sparse matrix.")
+
     def testCharacteristicMatrix_ReadWrite(self):
         file_name = "test_files/characteristic_matrix.tmp"
         dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
@@ -167,6 +366,29 @@ class TestSimilarNodesMining(unittest.TestCase):
         ch_matrix_jaccard_sim = ch_matrix.compute_jaccard_similarity_matrix()
         equality = (self.ch_matrix_jaccard_sim_exp == ch_matrix_jaccard_sim).all()
         self.assertTrue(equality, "The computed Jaccard similarity matrix is wrong.")
+        ch_matrix_jaccard_sim = ch_matrix.compute_jaccard_similarity_matrix(block_size=5)
+        equality = (self.ch_matrix_jaccard_sim_exp == ch_matrix_jaccard_sim).all()
+        self.assertTrue(equality, "The Jaccard similarity matrix computed in blocks is wrong.")
+
+    def testCharacteristicMatrix_SimilarColumns(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=3, r_out=2, r_all=0)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        ch_matrix = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=0)
+        for p in [1, 3, 20, nodes_count]:
+            most_similar_cols = ch_matrix.compute_most_similar_columns(p, block_size=5)
+            for i in range(nodes_count):
+                # by increasing similarity, equal similarities by decreasing index and the column itself first
+                most_similar_cols_exp = sorted(range(nodes_count), key=lambda j: (j != i, self.ch_matrix_jaccard_sim_exp[i, j], -j))[-p:]
+                self.assertEqual(most_similar_cols_exp, list(most_similar_cols[i]), "Wrong most similar columns.")
+        for threshold in [0., 0.5, 0.75, 1.]:
+            similar_cols = ch_matrix.compute_similar_columns(threshold, block_size=5)
+            for i in range(nodes_count):
+                self.assertEqual(list(np.where(self.ch_matrix_jaccard_sim_exp[i, :] >= threshold)[0]), list(similar_cols[i]), "Wrong similar columns.")
+            similar_cols = ch_matrix.compute_similar_columns(threshold, block_size=5, return_similarities=True)
+            for i in range(nodes_count):
+                cols, sims = similar_cols[i]
+                self.assertEqual(list(self.ch_matrix_jaccard_sim_exp[i, cols]), list(sims), "Wrong similarities of the similar columns.")
     
     def testSimilarNodesMining(self):
         dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
@@ -222,6 +444,30 @@ class TestSimilarNodesMining(unittest.TestCase):
         self.assertEqual(similar_nodes_2_exp, similar_nodes_2, "Wrong similar nodes were extracted.")
         self.assertEqual(similar_nodes_3_exp, similar_nodes_3, "Wrong similar nodes were extracted.")
     
+    def testGetAllSimilarNodesLSH(self):
+        dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
+        rballs_database, index_node_map = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=3, r_out=2, r_all=0)
+        nodes_count = dummy_hypergraph.number_of_nodes()
+        ch_matrix = CharacteristicMatrix(rballs_database, nodes_count, wl_iterations=0)
+        sketch_matrix = SketchMatrix(2, 10, ch_matrix)
+        # the expected similar nodes are found by comparing each column with all columns band by band
+        similar_nodes_exp = []
+        for i in range(nodes_count):
+            similar_cols = SketchMatrix._get_similar_columns(sketch_matrix.matrix[:, i : i + 1], sketch_matrix.matrix, 2, 10, nodes_count)
+            similar_cols = [col for col in similar_cols if col != i]
+            if similar_cols:
+                similar_nodes_exp.append([index_node_map[index] for index in [i] + similar_cols])
+        self.assertTrue(similar_nodes_exp, "The test sketch matrix has no similar nodes.")
+        similar_nodes = similar_nodes_mining.get_all_similar_nodes_lsh(sketch_matrix, index_node_map)
+        self.assertEqual(similar_nodes_exp, similar_nodes, "Wrong similar nodes were extracted from the LSH buckets.")
+        similarity_matrix = similar_nodes_mining.get_node_similarity_matrix(sketch_matrix)
+        similar_nodes = similar_nodes_mining.get_all_similar_nodes(similarity_matrix, index_node_map)
+        self.assertEqual(similar_nodes_exp, similar_nodes, "Wrong similar nodes were extracted from the LSH buckets.")
+        for group in similar_nodes_mining.get_similar_node_groups(sketch_matrix, index_node_map):
+            for similar in similar_nodes_exp:
+                if similar[0] in group:
+                    self.assertTrue(set(similar) <= set(group), "A group does not contain all similar nodes.")
+    
     def testGetSimilarNodesToQueryNode(self):
         dummy_hypergraph = Hypergraph(example_graphs.snm_dummy_graph)
         rballs_database, _ = similar_nodes_mining.extract_rballs_database(dummy_hypergraph, r_in=3, r_out=2, r_all=0)